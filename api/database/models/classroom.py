@@ -1,7 +1,7 @@
 """
 Classroom database model
 """
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, func
+from sqlalchemy import Column, String, Integer, SmallInteger, Boolean, ForeignKey, DateTime, Identity, func
 from sqlalchemy.orm import relationship
 from ..session import Base
 
@@ -12,6 +12,8 @@ class Classroom(Base):
     __tablename__ = "classrooms"
     
     id = Column(String, primary_key=True, index=True)
+    # Compact surrogate key referenced by occupancy_history rows
+    short_id = Column(SmallInteger, Identity(), unique=True, nullable=False)
     room_number = Column(String, nullable=False, index=True)
     building_id = Column(String, ForeignKey("buildings.id"), nullable=False)
     faculty = Column(String, nullable=False, index=True)
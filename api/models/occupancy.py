@@ -24,7 +24,8 @@ class OccupancyResponse(BaseModel):
 class OccupancyUpdate(BaseModel):
     """Occupancy update model"""
     classroom_id: str = Field(..., description="Classroom ID")
-    current_count: int = Field(..., ge=0, description="Current occupancy count")
+    # occupancy_history.count is a smallint
+    current_count: int = Field(..., ge=0, le=32767, description="Current occupancy count")
     detection_confidence: float = Field(..., ge=0.0, le=1.0, description="Detection confidence")
     camera_id: Optional[str] = Field(None, description="Camera ID")
 
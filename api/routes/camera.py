@@ -119,12 +119,11 @@ async def detect_people(
             )
             db.add(occupancy)
         
-        # 履歴レコードを作成
-        from datetime import datetime
+        # 履歴レコードを作成（IDはデータベースが採番、教室は short_id で参照）
+        from datetime import datetime, timezone
         history = OccupancyHistory(
-            id=f"hist_{classroom_id}_{datetime.utcnow().timestamp()}",
-            classroom_id=classroom_id,
-            timestamp=datetime.utcnow(),
+            classroom_key=classroom.short_id,
+            timestamp=datetime.now(timezone.utc),
             count=person_count,
             detection_confidence=float(avg_confidence),
             camera_id=None,
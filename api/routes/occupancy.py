@@ -259,10 +259,10 @@ async def update_occupancy(
     now = datetime.now(timezone.utc)
     occupancy.last_updated = now
     
-    # Create history entry with unique ID based on current timestamp
+    # Create history entry (the id is assigned by the database; rows reference the
+    # classroom by its short_id)
     history = OccupancyHistory(
-        id=f"hist_{occupancy.classroom_id}_{now.timestamp()}",
-        classroom_id=occupancy.classroom_id,
+        classroom_key=classroom.short_id,
         timestamp=now,
         count=occupancy.current_count,
         detection_confidence=occupancy.detection_confidence,
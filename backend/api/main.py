@@ -1,8 +1,9 @@
 """
 FastAPI main application
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import logging
 
 from config import settings
@@ -16,11 +17,50 @@ logger = logging.getLogger(__name__)
 # Database is expected to be already initialized in Supabase
 # No runtime initialization needed in serverless environment
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan: preload the detector, start the history buffer and attach the
+    occupancy filter on startup, release camera resources and flush buffered history on shutdown"""
+    history_engine = None
+    if settings.history_buffer_enabled:
+        from database.session import create_dedicated_engine
+        from services import history_buffer, occupancy_writer
+        history_buffer.flush_rows = settings.history_buffer_flush_rows
+        history_buffer.flush_interval = settings.history_buffer_flush_ms / 1000
+        history_buffer.max_rows = settings.history_buffer_max_rows
+        # Own connection, so flushes never wait for (or hold) the request pool
+        history_engine = create_dedicated_engine()
+        history_buffer.start(history_engine)
+        occupancy_writer.history_buffer = history_buffer
+    if settings.occupancy_filter_enabled:
+        from services import occupancy_filter, occupancy_writer
+        occupancy_filter.window = settings.occupancy_filter_window
+        occupancy_filter.deadband = settings.occupancy_filter_deadband
+        occupancy_filter.max_age = settings.occupancy_filter_max_age
+        occupancy_filter.heartbeat = settings.occupancy_filter_heartbeat
+        occupancy_writer.filter = occupancy_filter
+    if settings.camera_enabled:
+        from api.routes import camera
+        camera.start_inference_executor()
+    yield
+    if settings.camera_enabled:
+        from api.routes import camera
+        camera.shutdown_inference_executor()
+    if settings.history_buffer_enabled:
+        from services import history_buffer, occupancy_writer
+        # Later writes go straight to the table; then write out what is buffered
+        occupancy_writer.history_buffer = None
+        history_buffer.stop()
+        history_engine.dispose()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="YNU Classroom Occupancy API",
     description="Real-time classroom occupancy monitoring system for Yokohama National University",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -62,6 +102,7 @@ app.include_router(schedules.router, prefix=settings.api_v1_prefix)
 if settings.camera_enabled:
     from api.routes import camera
     app.include_router(camera.router, prefix=settings.api_v1_prefix)
+    app.include_router(camera.static_router)
     logger.info("Camera routes enabled")
 else:
     logger.info("Camera routes disabled (set CAMERA_ENABLED=true to enable)")
@@ -72,6 +113,7 @@ app.include_router(search_history.router, prefix=settings.api_v1_prefix)
 
 # Static files mounting is disabled for Vercel serverless deployment
 # Static files should be served via Vercel's static file serving or CDN
+# (with camera routes enabled, /static/processed/{id}.jpg is rendered on demand)
 
 
 @app.get("/")
@@ -85,12 +127,26 @@ async def root():
 
 
 @app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {
+async def health_check(response: Response):
+    """Health check endpoint
+    
+    With camera routes enabled, returns 503 until the detector has been
+    loaded and warmed up, so load balancers only route traffic to ready workers.
+    """
+    health = {
         "status": "healthy",
         "camera_enabled": settings.camera_enabled,
     }
+    if settings.camera_enabled:
+        from api.routes import camera
+        model = camera.get_model_status()
+        health["camera_model"] = model
+        if model["state"] == "loading":
+            health["status"] = "starting"
+            response.status_code = 503
+        elif not model["ready"]:
+            health["status"] = "degraded"
+    return health
 
 
 if __name__ == "__main__":
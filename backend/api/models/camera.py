@@ -0,0 +1,9 @@
+"""
+Camera Pydantic models for API
+"""
+from pydantic import BaseModel, Field
+
+
+class ModelSwapRequest(BaseModel):
+    """Detection model swap request"""
+    model_path: str = Field(..., min_length=1, description="Path of the new model file on the API server")
@@ -2,7 +2,7 @@
 Occupancy Pydantic models for API
 """
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -16,6 +16,7 @@ class OccupancyResponse(BaseModel):
     camera_id: Optional[str] = None
     is_available: bool
     occupancy_rate: float
+    thumbnail_requested: bool = False  # エッジ検出のカメラに解析結果サムネイルの送信を要求
     
     class Config:
         from_attributes = True
@@ -24,9 +25,35 @@ class OccupancyResponse(BaseModel):
 class OccupancyUpdate(BaseModel):
     """Occupancy update model"""
     classroom_id: str = Field(..., description="Classroom ID")
-    current_count: int = Field(..., ge=0, description="Current occupancy count")
+    # occupancy_history.count is a smallint
+    current_count: int = Field(..., ge=0, le=32767, description="Current occupancy count")
     detection_confidence: float = Field(..., ge=0.0, le=1.0, description="Detection confidence")
     camera_id: Optional[str] = Field(None, description="Camera ID")
+    captured_at: Optional[datetime] = Field(None, description="When the frame was captured (edge detection)")
+
+
+class OccupancyBulkUpdate(BaseModel):
+    """Readings for many classrooms in one request"""
+    readings: List[OccupancyUpdate] = Field(..., min_length=1, description="Readings (any order)")
+
+
+class OccupancyBulkItem(BaseModel):
+    """Result for one reading of a bulk update (same order as the request)"""
+    classroom_id: str
+    # 'ok' (current state updated), 'stale' (history only: older than the stored
+    # state or than another reading in the request), 'filtered' (within the
+    # occupancy filter's deadband), 'duplicate', 'not_found'
+    status: str
+    current_count: Optional[int] = None  # Classroom's count after the update
+
+
+class OccupancyBulkResponse(BaseModel):
+    """Bulk update response"""
+    results: List[OccupancyBulkItem]
+    applied: int
+    stale: int
+    rejected: int
+    filtered: int = 0
 
 
 class ClassroomWithOccupancy(BaseModel):
@@ -1,50 +1,150 @@
 """
 Camera detection API routes
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header
+from fastapi.responses import FileResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime, timezone
 from pathlib import Path
+import asyncio
 import logging
+import secrets
+import time
 
 # Try to import camera dependencies
 try:
     import cv2
     import numpy as np
-    from camera.detector import YOLODetector
+    from camera.executor import (
+        InferenceExecutor,
+        InferenceQueueFull,
+        InferenceUnavailable,
+        run_batch_detection,
+        run_detection,
+        run_remote_batch_detection,
+        run_remote_detection,
+    )
+    from camera.frame_store import frame_store
+    from camera.budget import InferenceBudget
+    from camera import codec
     CAMERA_AVAILABLE = True
 except ImportError:
     CAMERA_AVAILABLE = False
     cv2 = None
     np = None
-    YOLODetector = None
+    InferenceExecutor = None
+    InferenceQueueFull = None
+    InferenceUnavailable = None
+    run_detection = None
+    run_remote_detection = None
+    run_batch_detection = None
+    run_remote_batch_detection = None
+    frame_store = None
+    InferenceBudget = None
+    codec = None
 
 from database.session import get_db
-from database.models.occupancy import Occupancy as DBOccupancy, OccupancyHistory
 from database.models.classroom import Classroom
+from database.models.user import Favorite
+from api.models.camera import ModelSwapRequest
+from services.classroom_ids import classroom_ids as classroom_id_cache
+from services.history_buffer import history_buffer
+from services.occupancy_filter import occupancy_filter
+from services.occupancy_writer import Reading, occupancy_writer
 from config import settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/camera", tags=["camera"])
 
+# 解析結果画像（/static/processed/{classroom_id}.jpg）の配信用
+static_router = APIRouter(tags=["camera"])
+
 # If camera dependencies are not available, create a stub router
 if not CAMERA_AVAILABLE:
-    logger.warning("Camera dependencies (cv2, numpy, YOLODetector) not available. Camera routes will be disabled.")
+    logger.warning("Camera dependencies (cv2, numpy, camera.executor) not available. Camera routes will be disabled.")
 
-# グローバルなYOLO検出器インスタンス（初回使用時に初期化）
-_yolo_detector = None
+# グローバルな推論エグゼキューター（初回使用時に初期化）
+_inference_executor = None
+_preload_task = None
+# 画像アップロードのカメラへの推論予算の配分（INFERENCE_BUDGET_FPS が0なら無効）
+_inference_budget = None
 
 
-def get_yolo_detector():
-    """YOLO検出器のシングルトンインスタンスを取得"""
+def get_inference_executor():
+    """推論エグゼキューターのシングルトンインスタンスを取得"""
     if not CAMERA_AVAILABLE:
         raise HTTPException(status_code=503, detail="Camera functionality is not available. Required dependencies (cv2, numpy, ultralytics) are not installed.")
-    global _yolo_detector
-    if _yolo_detector is None:
-        model_path = settings.detection_model_path if hasattr(settings, 'detection_model_path') else "yolov8n.pt"
-        _yolo_detector = YOLODetector(model_path=model_path)
-    return _yolo_detector
+    global _inference_executor
+    if _inference_executor is None:
+        # 推論サーバーを使う場合、APIワーカーはモデルを読み込まない
+        use_server = bool(settings.inference_server_socket)
+        _inference_executor = InferenceExecutor(
+            model_path=None if use_server else settings.detection_model_path,
+            backend=settings.detection_backend,
+            quantize=settings.detection_onnx_quantize,
+            profiles_path=settings.inference_profiles_path or None,
+            cascade=settings.detection_cascade,
+            frame_cache={
+                "max_entries": settings.frame_cache_size,
+                "max_distance": settings.frame_cache_max_distance,
+                "max_age": settings.frame_cache_max_age,
+            } if settings.frame_cache_size > 0 else None,
+            mode="thread" if use_server else settings.inference_executor,
+            max_workers=settings.inference_workers,
+            max_queue=settings.inference_queue_size,
+            retry_after=settings.inference_retry_after,
+        )
+    return _inference_executor
+
+
+def get_inference_budget():
+    """推論予算のシングルトンインスタンスを取得（無効な場合はNone）"""
+    global _inference_budget
+    if _inference_budget is None and CAMERA_AVAILABLE and settings.inference_budget_fps > 0:
+        _inference_budget = InferenceBudget(
+            frames_per_second=settings.inference_budget_fps,
+            min_interval=settings.camera_update_interval,
+            max_interval=settings.inference_budget_max_interval,
+        )
+    return _inference_budget
+
+
+def _next_upload_in(db: Session, classroom: Classroom, person_count: int) -> Optional[float]:
+    """検出結果を推論予算に反映し、カメラの次のアップロードまでの秒数を返す"""
+    budget = get_inference_budget()
+    if budget is None:
+        return None
+    if budget.favorites_stale():
+        counts = db.query(Favorite.classroom_id, func.count(Favorite.id)).group_by(Favorite.classroom_id).all()
+        budget.set_favorites(dict(counts))
+    budget.observe(classroom.id, person_count, classroom.capacity)
+    return budget.next_slot(classroom.id)
+
+
+def start_inference_executor():
+    """アプリ起動時に検出器の読み込みとウォームアップをバックグラウンドで開始する"""
+    global _preload_task
+    if not CAMERA_AVAILABLE:
+        return
+    _preload_task = asyncio.create_task(get_inference_executor().preload())
+
+
+def get_model_status() -> dict:
+    """検出モデルの読み込み状態（/health 用）"""
+    if not CAMERA_AVAILABLE:
+        return {"state": "unavailable", "ready": False}
+    return get_inference_executor().model_status()
+
+
+def shutdown_inference_executor():
+    """推論エグゼキューターを停止する（アプリ終了時）"""
+    global _inference_executor
+    if _inference_executor is not None:
+        _inference_executor.shutdown()
+        _inference_executor = None
 
 
 @router.post("/detect")
@@ -59,7 +159,7 @@ async def detect_people(
     - 画像ファイルを受け取る
     - YOLOv8で人物（class_id=0）を検出
     - 人数をカウント
-    - 解析結果画像（バウンディングボックス付き）を保存
+    - 受信画像と検出結果を保存（解析結果画像は表示時に描画）
     - データベースのOccupancyテーブルを更新
     """
     if not CAMERA_AVAILABLE:
@@ -76,63 +176,44 @@ async def detect_people(
         
         # 画像ファイルの読み込み
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
-        if image is None:
-            raise HTTPException(status_code=400, detail="画像の読み込みに失敗しました")
-        
-        logger.info(f"画像を受信しました: {file.filename}, サイズ: {image.shape}")
+        # デコード・人物検出・フレーム保存はワーカーで実行（イベントループをブロックしない）
+        # 解析結果画像は /static/processed/{classroom_id}.jpg の要求時に描画する
+        executor = get_inference_executor()
+        try:
+            if settings.inference_server_socket:
+                detection = await executor.submit(
+                    run_remote_detection, contents, classroom_id, settings.inference_server_socket
+                )
+            else:
+                detection = await executor.submit(run_detection, contents, classroom_id)
+        except InferenceQueueFull as e:
+            logger.warning(f"推論キューが満杯です - 教室ID: {classroom_id}")
+            raise HTTPException(
+                status_code=503,
+                detail="推論キューが満杯です。しばらくしてから再送信してください",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except InferenceUnavailable as e:
+            logger.error(f"推論サーバーを利用できません - 教室ID: {classroom_id}: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail="推論サーバーを利用できません。しばらくしてから再送信してください",
+                headers={"Retry-After": str(e.retry_after)},
+            )
         
-        # YOLO検出器を取得
-        detector = get_yolo_detector()
+        if detection["shape"] is None:
+            raise HTTPException(status_code=400, detail="画像の読み込みに失敗しました")
         
-        # 人物検出（バウンディングボックス付き画像も取得）
-        annotated_image, person_count, avg_confidence = detector.detect_with_annotations(image)
+        person_count = detection["person_count"]
+        avg_confidence = detection["confidence"]
         
+        logger.info(f"画像を受信しました: {file.filename}, サイズ: {detection['shape']}")
         logger.info(f"検出結果 - 教室ID: {classroom_id}, 人数: {person_count}, 信頼度: {avg_confidence:.2f}")
         
-        # 解析結果画像を保存
-        # backendディレクトリを基準にstatic/processedディレクトリを作成
-        backend_dir = Path(__file__).parent.parent.parent
-        static_dir = backend_dir / "static" / "processed"
-        static_dir.mkdir(parents=True, exist_ok=True)
-        
-        output_path = static_dir / f"{classroom_id}.jpg"
-        cv2.imwrite(str(output_path), annotated_image)
-        logger.info(f"解析結果画像を保存しました: {output_path}")
-        
-        # データベースのOccupancyテーブルを更新
-        occupancy = db.query(DBOccupancy).filter(DBOccupancy.classroom_id == classroom_id).first()
-        
-        if occupancy:
-            # 既存レコードを更新
-            occupancy.current_count = person_count
-            occupancy.detection_confidence = float(avg_confidence)
-        else:
-            # 新規レコードを作成
-            occupancy = DBOccupancy(
-                id=f"occ_{classroom_id}",
-                classroom_id=classroom_id,
-                current_count=person_count,
-                detection_confidence=float(avg_confidence),
-            )
-            db.add(occupancy)
-        
-        # 履歴レコードを作成
-        from datetime import datetime
-        history = OccupancyHistory(
-            id=f"hist_{classroom_id}_{datetime.utcnow().timestamp()}",
-            classroom_id=classroom_id,
-            timestamp=datetime.utcnow(),
-            count=person_count,
-            detection_confidence=float(avg_confidence),
-            camera_id=None,
-        )
-        db.add(history)
-        
+        # Occupancy の更新と履歴の追加（1回のupsert）
+        occupancy_writer.write(db, Reading(classroom_id, person_count, float(avg_confidence)))
         db.commit()
-        db.refresh(occupancy)
         
         # 画像URLを構築
         image_url = f"/static/processed/{classroom_id}.jpg"
@@ -142,7 +223,9 @@ async def detect_people(
             "person_count": person_count,
             "confidence": float(avg_confidence),
             "image_url": image_url,
-            "message": f"{person_count}人を検出しました"
+            "message": f"{person_count}人を検出しました",
+            # 次のアップロードまでの秒数（推論予算が無効な場合はNone）
+            "next_upload_in": _next_upload_in(db, classroom, person_count),
         }
         
     except HTTPException:
@@ -152,3 +235,225 @@ async def detect_people(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"処理中にエラーが発生しました: {str(e)}")
 
+
+@router.post("/detect-batch")
+async def detect_people_batch(
+    files: List[UploadFile] = File(..., description="画像ファイル（classroom_idsと同じ順番）"),
+    classroom_ids: List[str] = Form(..., description="教室ID（filesと同じ順番）"),
+    db: Session = Depends(get_db)
+):
+    """
+    複数教室の画像をまとめて受け取り、人数検出とデータベース更新を一括で行う
+
+    - 1台のエッジ端末（ラズパイ・NVR）が複数教室を担当する場合に使用
+    - 全画像を1回のバッチ推論で処理
+    - OccupancyとOccupancyHistoryを1トランザクションでコミット
+    - 教室ごとの結果を返す（存在しない教室・読み込めない画像は status で通知）
+    """
+    if not CAMERA_AVAILABLE:
+        raise HTTPException(
+            status_code=503, 
+            detail="Camera functionality is not available. Required dependencies (cv2, numpy, ultralytics) are not installed."
+        )
+    
+    if len(files) != len(classroom_ids):
+        raise HTTPException(status_code=400, detail="filesとclassroom_idsの数が一致しません")
+    
+    if len(set(classroom_ids)) != len(classroom_ids):
+        raise HTTPException(status_code=400, detail="classroom_idsに重複があります")
+    
+    try:
+        # 教室の存在確認（1クエリ）
+        known_ids = {
+            row.id for row in db.query(Classroom.id).filter(Classroom.id.in_(classroom_ids)).all()
+        }
+        targets = [(cid, f) for cid, f in zip(classroom_ids, files) if cid in known_ids]
+        
+        results = {
+            cid: {"classroom_id": cid, "status": "not_found", "message": f"教室が見つかりません: {cid}"}
+            for cid in classroom_ids if cid not in known_ids
+        }
+        
+        if targets:
+            contents = [await f.read() for _, f in targets]
+            target_ids = [cid for cid, _ in targets]
+            
+            # 全画像を1回のバッチ推論で処理
+            executor = get_inference_executor()
+            try:
+                if settings.inference_server_socket:
+                    detections = await executor.submit(
+                        run_remote_batch_detection, contents, target_ids, settings.inference_server_socket
+                    )
+                else:
+                    detections = await executor.submit(run_batch_detection, contents, target_ids)
+            except InferenceQueueFull as e:
+                logger.warning(f"推論キューが満杯です - 教室数: {len(targets)}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="推論キューが満杯です。しばらくしてから再送信してください",
+                    headers={"Retry-After": str(e.retry_after)},
+                )
+            except InferenceUnavailable as e:
+                logger.error(f"推論サーバーを利用できません - 教室数: {len(targets)}: {e}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="推論サーバーを利用できません。しばらくしてから再送信してください",
+                    headers={"Retry-After": str(e.retry_after)},
+                )
+            
+            now = datetime.now(timezone.utc)
+            readings = []
+            for (cid, _), detection in zip(targets, detections):
+                if detection["shape"] is None:
+                    results[cid] = {"classroom_id": cid, "status": "invalid_image", "message": "画像の読み込みに失敗しました"}
+                    continue
+                
+                person_count = detection["person_count"]
+                confidence = detection["confidence"]
+                
+                readings.append(Reading(cid, person_count, confidence, captured_at=now))
+                
+                results[cid] = {
+                    "classroom_id": cid,
+                    "status": "ok",
+                    "person_count": person_count,
+                    "confidence": confidence,
+                    "image_url": f"/static/processed/{cid}.jpg",
+                    "message": f"{person_count}人を検出しました",
+                }
+            
+            # 全教室分を1回のupsertで書き込み、1トランザクションでコミット
+            occupancy_writer.write_many(db, readings)
+            db.commit()
+        
+        logger.info(f"バッチ検出結果 - 教室数: {len(classroom_ids)}, 成功: {sum(r['status'] == 'ok' for r in results.values())}")
+        
+        return {
+            "results": [results[cid] for cid in classroom_ids],
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"バッチ人数検出処理でエラーが発生しました: {e}", exc_info=True)
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"処理中にエラーが発生しました: {str(e)}")
+
+
+@router.post("/thumbnail")
+async def upload_thumbnail(
+    file: UploadFile = File(..., description="解析結果画像（JPEG）"),
+    classroom_id: str = Form(..., description="教室ID"),
+    db: Session = Depends(get_db)
+):
+    """
+    エッジ検出のカメラから解析結果画像（サムネイル）を受け取る
+    
+    人数は /occupancy/update で送信され、画像はたまに（またはサーバーから
+    要求されたときだけ）送られてきます。推論は行わずにそのまま保存します。
+    """
+    if not CAMERA_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Camera functionality is not available.")
+    
+    if not frame_store.is_valid_id(classroom_id):
+        raise HTTPException(status_code=400, detail=f"不正な教室IDです: {classroom_id}")
+    
+    classroom = db.query(Classroom).filter(Classroom.id == classroom_id).first()
+    if not classroom:
+        raise HTTPException(status_code=404, detail=f"教室が見つかりません: {classroom_id}")
+    
+    contents = await file.read()
+    # ヘッダーだけを読んで確認する（デコードはしない）
+    size = codec.jpeg_size(contents)
+    if size is None:
+        raise HTTPException(status_code=400, detail="JPEG画像ではありません")
+    
+    await asyncio.get_running_loop().run_in_executor(None, frame_store.save_thumbnail, classroom_id, contents)
+    logger.info(f"サムネイルを受信しました - 教室ID: {classroom_id}, {size[0]}x{size[1]}, {len(contents)} bytes")
+    
+    return {
+        "classroom_id": classroom_id,
+        "image_url": f"/static/processed/{classroom_id}.jpg",
+    }
+
+
+@router.get("/metrics")
+async def get_inference_metrics():
+    """推論エグゼキューターのメトリクス（キュー深さ・待ち時間など）・推論予算の配分・履歴バッファと占有状況フィルタの状態を取得"""
+    metrics = get_inference_executor().metrics()
+    metrics["jpeg_codec"] = codec.backend_name()
+    if history_buffer.running:
+        metrics["history_buffer"] = history_buffer.metrics()
+    if occupancy_writer.filter is occupancy_filter:
+        metrics["occupancy_filter"] = occupancy_filter.metrics()
+    budget = get_inference_budget()
+    if budget is not None:
+        metrics["budget"] = budget.metrics()
+    return metrics
+
+
+@router.post("/model")
+async def swap_detection_model(
+    request: ModelSwapRequest,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    検出モデルを無停止で差し替える（管理者用）
+    
+    新しいモデルを読み込み・ウォームアップしてから切り替えます。
+    処理中のリクエストは古いモデルで完了します。差し替えはプロセスの
+    再起動までの間だけ有効です（恒久的には DETECTION_MODEL_PATH を変更）。
+    
+    Headers:
+        X-Admin-Token: CAMERA_ADMIN_TOKEN と同じ値
+    """
+    if not settings.camera_admin_token or not secrets.compare_digest(
+        x_admin_token or "", settings.camera_admin_token
+    ):
+        raise HTTPException(status_code=403, detail="管理者トークンが正しくありません")
+    
+    if not Path(request.model_path).is_file():
+        raise HTTPException(status_code=400, detail=f"モデルファイルが見つかりません: {request.model_path}")
+    
+    executor = get_inference_executor()
+    try:
+        status = await executor.swap_model(request.model_path)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"モデルの読み込みに失敗しました: {e}")
+    
+    logger.info(f"検出モデルを差し替えました: {request.model_path}")
+    return status
+
+
+@static_router.get("/static/processed/{filename}")
+def get_processed_image(filename: str, db: Session = Depends(get_db)):
+    """
+    解析結果画像（バウンディングボックス付き）を取得
+
+    最新フレームと検出結果から要求時に描画し、次のフレームが届くまでキャッシュします。
+    認証不要のため、ディスクに書き込むのは保存済みフレームがある教室の描画と、
+    存在する教室へのサムネイル要求（教室ごとに高々1件）だけです。
+    """
+    if not CAMERA_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Camera functionality is not available.")
+    
+    classroom_id, ext = filename.rsplit(".", 1) if "." in filename else (filename, "")
+    if ext != "jpg" or not frame_store.is_valid_id(classroom_id):
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+    
+    # 保存済みフレームが無い教室は描画されない（既存の解析結果画像があればそれを返す）
+    path = frame_store.render(classroom_id)
+    
+    # エッジ検出のカメラには、画像が古ければ次の人数送信時にサムネイルを送るよう要求する
+    # （存在しない教室IDでは要求しない。要求が残っている間は重ねて要求しない）
+    if path is None or time.time() - path.stat().st_mtime > settings.edge_thumbnail_max_age:
+        if classroom_id_cache.known(db, [classroom_id]):
+            frame_store.request_thumbnail(classroom_id)
+    
+    if path is None:
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+    
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "no-cache"})
@@ -7,6 +7,8 @@ from typing import List, Optional
 from database.session import get_db
 from database.models.classroom import Classroom as DBClassroom
 from api.models.classroom import ClassroomResponse, ClassroomCreate, ClassroomUpdate
+from services.classroom_ids import classroom_ids
+from services.occupancy_filter import occupancy_filter
 
 router = APIRouter(prefix="/classrooms", tags=["classrooms"])
 
@@ -58,6 +60,7 @@ async def create_classroom(
     db.add(db_classroom)
     db.commit()
     db.refresh(db_classroom)
+    classroom_ids.invalidate()
     
     return db_classroom
 
@@ -95,6 +98,8 @@ async def delete_classroom(classroom_id: str, db: Session = Depends(get_db)):
     
     db.delete(classroom)
     db.commit()
+    classroom_ids.invalidate()
+    occupancy_filter.forget(classroom_id)
     
     return {"message": "Classroom deleted successfully"}
 
@@ -3,16 +3,56 @@ Occupancy management API routes
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+import logging
+import time
 from database.session import get_db
-from database.models.occupancy import Occupancy as DBOccupancy, OccupancyHistory
+from database.models.occupancy import Occupancy as DBOccupancy
 from database.models.classroom import Classroom
 from database.models.schedule import ClassSchedule
-from api.models.occupancy import OccupancyResponse, OccupancyUpdate, ClassroomWithOccupancy
+from api.models.occupancy import (
+    OccupancyResponse,
+    OccupancyUpdate,
+    OccupancyBulkUpdate,
+    OccupancyBulkItem,
+    OccupancyBulkResponse,
+    ClassroomWithOccupancy,
+)
+from services.classroom_ids import classroom_ids
+from services.occupancy_writer import Reading, occupancy_writer
+from config import settings
+
+# エッジ検出カメラへのサムネイル要求（カメラ機能の依存関係が無い環境では無効）
+try:
+    from camera.frame_store import frame_store
+except ImportError:
+    frame_store = None
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/occupancy", tags=["occupancy"])
 
+classroom_ids.ttl = settings.classroom_id_cache_ttl
+
+
+def _occupancy_response(row: dict, classroom: Classroom) -> OccupancyResponse:
+    """Build a response from an occupancy row written by OccupancyWriter
+
+    is_available / occupancy_rate follow the Occupancy model properties.
+    """
+    count = row["current_count"]
+    return OccupancyResponse(
+        id=row["id"],
+        classroom_id=row["classroom_id"],
+        current_count=count,
+        detection_confidence=row["detection_confidence"],
+        last_updated=row["last_updated"],
+        camera_id=row["camera_id"],
+        is_available=count < classroom.capacity * 0.5,
+        occupancy_rate=min(count / classroom.capacity, 1.0) if classroom.capacity else 0.0,
+    )
+
 
 @router.get("/", response_model=List[OccupancyResponse])
 async def get_occupancy(
@@ -187,7 +227,10 @@ async def get_classrooms_with_status(
         from pathlib import Path
         backend_dir = Path(__file__).parent.parent.parent
         processed_image_path = backend_dir / "static" / "processed" / f"{classroom.id}.jpg"
-        image_url = f"/static/processed/{classroom.id}.jpg" if processed_image_path.exists() else None
+        # 最新フレーム（解析結果画像は要求時に描画される）
+        frame_path = backend_dir / "static" / "frames" / f"{classroom.id}.jpg"
+        has_image = processed_image_path.exists() or frame_path.exists()
+        image_url = f"/static/processed/{classroom.id}.jpg" if has_image else None
         
         result.append({
             "classroom": {
@@ -233,39 +276,105 @@ async def update_occupancy(
     if not classroom:
         raise HTTPException(status_code=404, detail="Classroom not found")
     
-    # Check if occupancy exists
-    occupancy = db.query(DBOccupancy).filter(DBOccupancy.classroom_id == occupancy_data.classroom_id).first()
+    # One upsert for the current state plus the history row. Readings replayed
+    # from an edge spool can arrive after newer ones; they still go into history
+    # but do not overwrite the current state, and replaying the same reading twice
+    # does not duplicate its history row.
+    row = occupancy_writer.write(db, Reading(
+        classroom_id=occupancy_data.classroom_id,
+        count=occupancy_data.current_count,
+        confidence=occupancy_data.detection_confidence,
+        captured_at=occupancy_data.captured_at,
+        camera_id=occupancy_data.camera_id,
+    ))
+    db.commit()
+    if row is None:
+        raise HTTPException(status_code=500, detail="Occupancy was not stored")
     
-    if occupancy:
-        # Update existing
-        occupancy.current_count = occupancy_data.current_count
-        occupancy.detection_confidence = occupancy_data.detection_confidence
-        if occupancy_data.camera_id:
-            occupancy.camera_id = occupancy_data.camera_id
-    else:
-        # Create new
-        occupancy = DBOccupancy(
-            id=f"occ_{occupancy_data.classroom_id}",
-            classroom_id=occupancy_data.classroom_id,
-            current_count=occupancy_data.current_count,
-            detection_confidence=occupancy_data.detection_confidence,
-            camera_id=occupancy_data.camera_id,
+    response = _occupancy_response(row, classroom)
+    if frame_store is not None:
+        response.thumbnail_requested = frame_store.pop_thumbnail_request(classroom.id)
+    return response
+
+
+@router.post("/bulk-update", response_model=OccupancyBulkResponse)
+async def bulk_update_occupancy(
+    payload: OccupancyBulkUpdate,
+    db: Session = Depends(get_db)
+):
+    """
+    Update occupancy for many classrooms in one request
+
+    Classroom IDs are checked against a cached ID set, and all readings are
+    written in one transaction (multi-row upsert plus one history insert).
+    Each reading gets its own status instead of failing the whole request.
+    """
+    started_at = time.perf_counter()
+    if len(payload.readings) > settings.occupancy_bulk_max_readings:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many readings (max {settings.occupancy_bulk_max_readings} per request)",
         )
-        db.add(occupancy)
-    
-    # Create history entry
-    history = OccupancyHistory(
-        id=f"hist_{occupancy.classroom_id}_{occupancy.last_updated}",
-        classroom_id=occupancy.classroom_id,
-        timestamp=occupancy.last_updated,
-        count=occupancy.current_count,
-        detection_confidence=occupancy.detection_confidence,
-        camera_id=occupancy.camera_id,
-    )
-    db.add(history)
-    
+
+    known = classroom_ids.known(db, {item.classroom_id for item in payload.readings})
+    now = datetime.now(timezone.utc)
+    readings: List[Optional[Reading]] = []
+    statuses: List[str] = []
+    history_keys = set()
+    newest: Dict[str, int] = {}
+    for index, item in enumerate(payload.readings):
+        if item.classroom_id not in known:
+            readings.append(None)
+            statuses.append("not_found")
+            continue
+        reading = Reading(
+            classroom_id=item.classroom_id,
+            count=item.current_count,
+            confidence=item.detection_confidence,
+            captured_at=item.captured_at or now,
+            camera_id=item.camera_id,
+        )
+        if reading.history_key in history_keys:
+            readings.append(None)
+            statuses.append("duplicate")
+            continue
+        history_keys.add(reading.history_key)
+        readings.append(reading)
+        statuses.append("stale")
+        previous = newest.get(reading.classroom_id)
+        if previous is None or reading.captured_at > readings[previous].captured_at:
+            newest[reading.classroom_id] = index
+
+    rows = occupancy_writer.write_many(db, [r for r in readings if r is not None])
     db.commit()
-    db.refresh(occupancy)
-    
-    return occupancy
 
+    # Only the newest reading per classroom can become the current state
+    for classroom_id, index in newest.items():
+        row = rows.get(classroom_id)
+        if row is None:
+            continue
+        if row["applied"]:
+            statuses[index] = "ok"
+        elif row["filtered"]:
+            statuses[index] = "filtered"
+
+    results = [
+        OccupancyBulkItem(
+            classroom_id=item.classroom_id,
+            status=status,
+            current_count=rows[item.classroom_id]["current_count"] if item.classroom_id in rows else None,
+        )
+        for item, status in zip(payload.readings, statuses)
+    ]
+
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    if elapsed_ms > settings.occupancy_bulk_slo_ms:
+        logger.warning(f"Bulk occupancy update of {len(payload.readings)} readings took {elapsed_ms:.0f} ms")
+
+    return OccupancyBulkResponse(
+        results=results,
+        applied=statuses.count("ok"),
+        stale=statuses.count("stale"),
+        rejected=statuses.count("not_found") + statuses.count("duplicate"),
+        filtered=statuses.count("filtered"),
+    )
@@ -0,0 +1,119 @@
+"""
+JPEGのデコード・エンコードのベンチマーク
+
+カメラのアップロードと同じ JPEG（品質85）を作り、次のスループットを比較します。
+
+- フル解像度でデコードしてから検出器の入力サイズに縮小する（従来の処理）
+- camera/codec.py で入力サイズに合わせてDCT領域で縮小デコードする
+- 1/2・1/4・1/8 の各縮尺でのデコード
+- エンコード（cv2.imencode と camera/codec.py）
+
+使用方法:
+    python benchmark_codec.py
+    python benchmark_codec.py --width 1920 --height 1080 --input-size 640 --iterations 100
+    python benchmark_codec.py --image sample_images/edu6-101/01.jpg
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+import cv2
+import numpy as np
+
+from camera import codec
+
+
+def _make_image(width: int, height: int) -> np.ndarray:
+    """カメラ画像に近い（滑らかな背景と輪郭のある物体・ノイズ）合成画像"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.stack([x / width * 200, y / height * 200, (x + y) / (width + height) * 255], axis=-1)
+    for _ in range(40):
+        x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(image, (x0, y0), (x0 + width // 20, y0 + height // 8), color, -1)
+    image += rng.normal(0, 6, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def _resize_to(image: np.ndarray, size: int) -> np.ndarray:
+    h, w = image.shape[:2]
+    factor = size / max(h, w)
+    if factor >= 1.0:
+        return image
+    return cv2.resize(image, (round(w * factor), round(h * factor)), interpolation=cv2.INTER_AREA)
+
+
+def _bench(func, iterations: int) -> float:
+    """1回あたりの時間（秒）の中央値"""
+    func()  # ウォームアップ
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def _report(name: str, seconds: float, baseline: float = None):
+    speedup = f"  x{baseline / seconds:4.1f}" if baseline else ""
+    print(f"  {name:<36} {seconds * 1000:7.2f}ms/枚 {1 / seconds:8.1f}枚/秒{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JPEGのデコード・エンコードのベンチマーク")
+    parser.add_argument('--image', type=str, default=None, help='使用するJPEG画像（省略時は合成画像）')
+    parser.add_argument('--width', type=int, default=1920, help='合成画像の幅（デフォルト: 1920）')
+    parser.add_argument('--height', type=int, default=1080, help='合成画像の高さ（デフォルト: 1080）')
+    parser.add_argument('--input-size', type=int, default=640, help='検出器の入力サイズ（長辺、デフォルト: 640）')
+    parser.add_argument('--quality', type=int, default=85, help='JPEGの品質（デフォルト: 85）')
+    parser.add_argument('--iterations', type=int, default=50, help='計測回数（デフォルト: 50）')
+    args = parser.parse_args()
+
+    if args.image:
+        data = Path(args.image).read_bytes()
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            sys.exit(f"画像を読み込めません: {args.image}")
+    else:
+        image = _make_image(args.width, args.height)
+        data = codec.encode(image, quality=args.quality)
+
+    h, w = image.shape[:2]
+    reduction = codec.choose_reduction(w, h, args.input_size)
+    print(f"画像: {w}x{h}, {len(data) / 1024:.0f}KB, JPEGライブラリ: {codec.backend_name()}")
+    print(f"検出器の入力サイズ: {args.input_size}px → 縮小デコード 1/{reduction}")
+
+    print("デコード（検出器の入力サイズまで）:")
+    buffer = np.frombuffer(data, np.uint8)
+    baseline = _bench(lambda: _resize_to(cv2.imdecode(buffer, cv2.IMREAD_COLOR), args.input_size), args.iterations)
+    _report("cv2.imdecode + resize", baseline)
+    _report(
+        "codec.decode + resize",
+        _bench(lambda: _resize_to(codec.decode(data, args.input_size).image, args.input_size), args.iterations),
+        baseline,
+    )
+
+    print("デコード（縮尺ごと）:")
+    full = _bench(lambda: codec.decode(data), args.iterations)
+    _report("1/1", full)
+    for factor in sorted(codec.REDUCTIONS):
+        # min_size に元の長辺/倍率を渡すと、その縮尺が選ばれる
+        size = max(w, h) // factor
+        _report(f"1/{factor}", _bench(lambda: codec.decode(data, size), args.iterations), full)
+
+    print("エンコード:")
+    baseline = _bench(lambda: cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, args.quality]), args.iterations)
+    _report("cv2.imencode", baseline)
+    _report("codec.encode", _bench(lambda: codec.encode(image, args.quality), args.iterations), baseline)
+    thumbnail = _resize_to(image, 640)
+    _report("codec.encode（640pxサムネイル）", _bench(lambda: codec.encode(thumbnail, 70), args.iterations), baseline)
+
+
+if __name__ == "__main__":
+    main()
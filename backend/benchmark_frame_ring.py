@@ -0,0 +1,122 @@
+"""
+撮影プロセスから推論プロセスへのフレーム受け渡しのベンチマーク
+
+multiprocessing.Queue（フレームをpickleしてコピー）と共有メモリのフレームリング
+（camera/frame_ring.py、コピーなし）で、同じ枚数のフレームを渡したときの
+スループットと遅延（書き込みから読み取りまで）を比較します。
+
+使用方法:
+    python benchmark_frame_ring.py
+    python benchmark_frame_ring.py --frames 500 --width 1920 --height 1080
+"""
+import argparse
+import multiprocessing as mp
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+import numpy as np
+
+from camera.frame_ring import FrameRing
+
+
+def _make_frames(shape, count: int = 8):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, shape, dtype=np.uint8) for _ in range(count)]
+
+
+def _consume(image: np.ndarray) -> int:
+    """推論の代わりに軽い処理（全画素を読まないと共有メモリの利点が見えないため間引いて合計）"""
+    return int(image[::16, ::16].sum())
+
+
+def _queue_producer(queue, shape, frames: int):
+    samples = _make_frames(shape)
+    for i in range(frames):
+        queue.put((time.perf_counter(), samples[i % len(samples)]))
+    queue.put(None)
+
+
+def _ring_producer(spec, shape, frames: int, interval: float):
+    ring = FrameRing.attach(spec)
+    samples = _make_frames(shape)
+    for i in range(frames):
+        ring.write(samples[i % len(samples)], captured_at=time.perf_counter())
+        if interval:
+            time.sleep(interval)
+    ring.close()
+
+
+def bench_queue(shape, frames: int) -> dict:
+    queue = mp.Queue(maxsize=4)
+    producer = mp.Process(target=_queue_producer, args=(queue, shape, frames))
+    start = time.perf_counter()
+    producer.start()
+    latencies = []
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        sent_at, image = item
+        latencies.append(time.perf_counter() - sent_at)
+        _consume(image)
+    elapsed = time.perf_counter() - start
+    producer.join()
+    return {"frames": len(latencies), "elapsed": elapsed, "latencies": latencies}
+
+
+def bench_ring(shape, frames: int, slots: int) -> dict:
+    ring = FrameRing.create(shape=shape, slots=slots)
+    # 書き込み側は最大速度で書き込む（読み取りが追いつかない分は読み飛ばされる）
+    producer = mp.Process(target=_ring_producer, args=(ring.spec(), shape, frames, 0.0))
+    start = time.perf_counter()
+    producer.start()
+    latencies = []
+    overwritten = 0
+    seq = 0
+    while seq < frames:
+        frame = ring.wait_latest(after=seq, timeout=5.0, poll_interval=0.0005)
+        if frame is None:
+            break
+        latencies.append(time.perf_counter() - frame.captured_at)
+        _consume(frame.image)
+        if not ring.is_current(frame):
+            overwritten += 1
+        seq = frame.seq
+    elapsed = time.perf_counter() - start
+    producer.join()
+    ring.close()
+    return {"frames": len(latencies), "elapsed": elapsed, "latencies": latencies, "overwritten": overwritten}
+
+
+def _report(name: str, result: dict, written: int):
+    lat = np.array(result["latencies"]) * 1000
+    print(
+        f"{name:<14} 読み取り {result['frames']:>5}/{written}枚, "
+        f"{written / result['elapsed']:>8.1f} fps（書き込み側）, "
+        f"遅延 p50 {np.percentile(lat, 50):6.2f}ms / p95 {np.percentile(lat, 95):6.2f}ms"
+        + (f", 読み取り中の上書き {result['overwritten']}回" if "overwritten" in result else "")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フレーム受け渡しのベンチマーク（Queue vs 共有メモリ）")
+    parser.add_argument('--frames', type=int, default=300, help='渡すフレーム数（デフォルト: 300）')
+    parser.add_argument('--width', type=int, default=1280, help='フレームの幅（デフォルト: 1280）')
+    parser.add_argument('--height', type=int, default=720, help='フレームの高さ（デフォルト: 720）')
+    parser.add_argument('--slots', type=int, default=4, help='リングのスロット数（デフォルト: 4）')
+    args = parser.parse_args()
+
+    shape = (args.height, args.width, 3)
+    print(f"フレーム: {args.width}x{args.height} BGR（{np.prod(shape) / 1024 / 1024:.1f}MB）, {args.frames}枚")
+    _report("Queue", bench_queue(shape, args.frames), args.frames)
+    _report("FrameRing", bench_ring(shape, args.frames, args.slots), args.frames)
+    print("※ FrameRing は最新フレームだけを読むため、推論が追いつかない分は読み飛ばします")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+占有状況フィルタ（平滑化・不感帯）の圧縮率の計測
+
+記録済みの読み取り（occupancy_history、またはCSV）を教室ごとに撮影順に
+services/occupancy_filter.py の OccupancyFilter に通し、次を表示します。
+
+- occupancy の書き込み回数と履歴の行数（フィルタなしでは読み取り1件ごとに1回）
+- 圧縮率（読み取り数 / 書き込み数）
+- 公開される人数と検出された人数の差（平均・最大）
+
+OCCUPANCY_FILTER_ENABLED で記録した履歴は既に間引かれているため、フィルタを
+有効にする前の期間を指定してください。
+
+使用方法:
+    python benchmark_occupancy_filter.py                          # .env の DATABASE_URL、直近7日
+    python benchmark_occupancy_filter.py --days 30 --deadband 3
+    python benchmark_occupancy_filter.py --csv history.csv        # 列: classroom_id,timestamp,count
+    python benchmark_occupancy_filter.py --synthetic              # 揺らぎのある合成データ
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, select
+
+from services.occupancy_filter import OccupancyFilter
+from services.occupancy_writer import Reading, classrooms_table, history_table
+
+
+def _load_database(database_url: str, days: int):
+    engine = create_engine(database_url)
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(classrooms_table.c.id, history_table.c.timestamp, history_table.c.count)
+            .join_from(history_table, classrooms_table, classrooms_table.c.short_id == history_table.c.classroom_key)
+            .where(history_table.c.timestamp >= since)
+            .order_by(history_table.c.timestamp)
+        ).all()
+    return [Reading(classroom_id, count, 1.0, captured_at=timestamp) for classroom_id, timestamp, count in rows]
+
+
+def _load_csv(path: str):
+    with open(path, newline='') as f:
+        return [
+            Reading(row['classroom_id'], int(row['count']), 1.0, captured_at=datetime.fromisoformat(row['timestamp']))
+            for row in csv.DictReader(f)
+        ]
+
+
+def _synthetic(classrooms: int, hours: int, interval: float):
+    """授業（90分）と休み時間を繰り返し、検出人数が±1〜2人揺らぐデータ"""
+    rng = random.Random(0)
+    start = datetime(2026, 4, 13, 8, 50, tzinfo=timezone.utc)
+    readings = []
+    for c in range(classrooms):
+        steps = int(hours * 3600 / interval)
+        for i in range(steps):
+            t = i * interval
+            in_class = (t % 6000) < 5400
+            true_count = (20 + c % 30) if in_class else 0
+            noise = rng.choice([-2, -1, 0, 0, 0, 1, 1, 2]) if true_count else rng.choice([0, 0, 0, 0, 0, 0, 1])
+            readings.append(Reading(f"room-{c}", max(0, true_count + noise), 0.8, captured_at=start + timedelta(seconds=t)))
+    return readings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="占有状況フィルタの圧縮率の計測")
+    parser.add_argument('--database-url', type=str, default=None, help='読み取りを取得するデータベース（省略時は .env の DATABASE_URL）')
+    parser.add_argument('--days', type=int, default=7, help='直近何日分の履歴を使うか（デフォルト: 7）')
+    parser.add_argument('--csv', type=str, default=None, help='classroom_id,timestamp,count のCSV')
+    parser.add_argument('--synthetic', action='store_true', help='合成データを使う')
+    parser.add_argument('--window', type=int, default=3, help='移動中央値の読み取り数（デフォルト: 3）')
+    parser.add_argument('--deadband', type=int, default=2, help='不感帯（人、デフォルト: 2）')
+    parser.add_argument('--max-age', type=float, default=20.0, help='occupancy を書き込む最大間隔（秒、デフォルト: 20）')
+    parser.add_argument('--heartbeat', type=float, default=300.0, help='履歴を記録する最大間隔（秒、デフォルト: 300）')
+    parser.add_argument('--top', type=int, default=10, help='表示する教室数（デフォルト: 10）')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        readings = _synthetic(classrooms=20, hours=10, interval=5.0)
+        source = "合成データ（20教室・10時間・5秒間隔）"
+    elif args.csv:
+        readings = _load_csv(args.csv)
+        source = args.csv
+    else:
+        load_dotenv()
+        database_url = args.database_url or os.getenv("DATABASE_URL")
+        if not database_url:
+            sys.exit("DATABASE_URLが設定されていません（--database-url・--csv・--synthetic のいずれかを指定してください）")
+        readings = _load_database(database_url, args.days)
+        source = f"occupancy_history（直近{args.days}日）"
+    if not readings:
+        sys.exit("読み取りがありません")
+
+    occupancy_filter = OccupancyFilter(
+        window=args.window, deadband=args.deadband, max_age=args.max_age, heartbeat=args.heartbeat,
+    )
+    by_classroom = defaultdict(list)
+    for reading in readings:
+        by_classroom[reading.classroom_id].append(reading)
+
+    stats = {}
+    for classroom_id, classroom_readings in by_classroom.items():
+        classroom_readings.sort(key=lambda r: r.captured_at)
+        published = None
+        writes = history = 0
+        errors = []
+        for reading in classroom_readings:
+            for written, record_history in occupancy_filter.apply([reading]):
+                published = written.count
+                writes += 1
+                history += record_history
+            errors.append(abs(reading.count - published))
+        stats[classroom_id] = (len(classroom_readings), writes, history, sum(errors) / len(errors), max(errors))
+
+    print(f"データ: {source}, 読み取り {len(readings)}件, 教室 {len(stats)}")
+    print(
+        f"フィルタ: 移動中央値 {args.window}件, 不感帯 {args.deadband}人, "
+        f"occupancy 最大 {args.max_age:.0f}秒, 履歴 最大 {args.heartbeat:.0f}秒"
+    )
+    print(f"  {'教室':<16} {'読み取り':>8} {'occupancy':>10} {'履歴':>8} {'圧縮率(履歴)':>12} {'誤差 平均/最大':>14}")
+    for classroom_id, (count, writes, history, mean_error, max_error) in sorted(
+        stats.items(), key=lambda item: -item[1][0]
+    )[:args.top]:
+        print(
+            f"  {classroom_id:<16} {count:8d} {writes:10d} {history:8d} "
+            f"{count / history:11.1f}x {mean_error:8.2f}/{max_error:<4d}"
+        )
+
+    metrics = occupancy_filter.metrics()
+    print(
+        f"合計: occupancy の書き込み {metrics['occupancy_writes']}回（x{metrics['occupancy_compression']}）, "
+        f"履歴 {metrics['history_writes']}行（x{metrics['history_compression']}）, "
+        f"人数の変化点 {metrics['changes']}回"
+    )
+
+
+if __name__ == "__main__":
+    main()
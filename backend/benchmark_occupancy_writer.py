@@ -0,0 +1,195 @@
+"""
+占有状況の書き込みのベンチマーク
+
+従来の書き込み（Occupancy を SELECT してから INSERT/UPDATE し、履歴を INSERT）と
+services/occupancy_writer.py の OccupancyWriter（upsert + 履歴を1回で実行）で、
+読み取り1件あたりのSQL文の数（ラウンドトリップ）とスループットを比較します。
+
+--database-url を省略すると一時ファイルのSQLiteで計測します。SQLiteはネットワークの
+往復が無いため、--latency-ms でSQL文ごとの往復時間（Supabaseのプーラー経由で数ms）を
+模擬できます。PostgreSQLでは upsert と履歴の追加が1つの文になります。
+
+最後に履歴を書き込み遅延バッファ（services/history_buffer.py）に回した場合を計測します。
+リクエスト側は occupancy の upsert だけになり、履歴はバックグラウンドでまとめて追加されます
+（SQL文の数にはバックグラウンドの書き込みも含みます）。
+
+使用方法:
+    python benchmark_occupancy_writer.py
+    python benchmark_occupancy_writer.py --readings 2000 --latency-ms 2
+    python benchmark_occupancy_writer.py --database-url postgresql://... --readings 500
+"""
+import argparse
+import itertools
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database.session import Base
+import database.models  # noqa: F401  （全テーブルを登録）
+from database.models.classroom import Building, Classroom
+from database.models.occupancy import Occupancy, OccupancyHistory
+from services.history_buffer import HistoryBuffer
+from services.occupancy_writer import Reading, occupancy_writer
+
+BENCH_PREFIX = "bench-"
+
+
+def _legacy_write(db, reading: Reading, classroom_keys: dict, history_ids):
+    """従来の書き込み（SELECT → INSERT/UPDATE → 履歴 INSERT）"""
+    occupancy = db.query(Occupancy).filter(Occupancy.classroom_id == reading.classroom_id).first()
+    if occupancy:
+        occupancy.current_count = reading.count
+        occupancy.detection_confidence = reading.confidence
+        occupancy.last_updated = reading.captured_at
+    else:
+        db.add(Occupancy(
+            id=f"occ_{reading.classroom_id}",
+            classroom_id=reading.classroom_id,
+            current_count=reading.count,
+            detection_confidence=reading.confidence,
+            last_updated=reading.captured_at,
+        ))
+    db.add(OccupancyHistory(
+        # SQLiteには複合主キーの自動採番が無い（PostgreSQLではIDENTITY）
+        id=next(history_ids) if history_ids else None,
+        classroom_key=classroom_keys[reading.classroom_id],
+        timestamp=reading.captured_at,
+        count=reading.count,
+        detection_confidence=reading.confidence,
+        camera_id=None,
+    ))
+
+
+def _make_readings(classrooms: int, count: int, offset: int):
+    start = datetime.now(timezone.utc) + timedelta(hours=offset)
+    return [
+        Reading(f"{BENCH_PREFIX}{i % classrooms}", i % 40, 0.8, captured_at=start + timedelta(milliseconds=i))
+        for i in range(count)
+    ]
+
+
+def _setup(session_factory, classrooms: int) -> dict:
+    """ベンチマーク用の教室を作成し、教室ID → short_id を返す"""
+    db = session_factory()
+    sqlite = db.get_bind().dialect.name == "sqlite"
+    if db.get(Building, f"{BENCH_PREFIX}building") is None:
+        db.add(Building(id=f"{BENCH_PREFIX}building", name="benchmark", faculty="benchmark", floors="[1]"))
+    for i in range(classrooms):
+        if db.get(Classroom, f"{BENCH_PREFIX}{i}") is None:
+            db.add(Classroom(
+                id=f"{BENCH_PREFIX}{i}", room_number=str(i), building_id=f"{BENCH_PREFIX}building",
+                faculty="benchmark", floor=1, capacity=40,
+                # SQLiteにはIDENTITYが無いため明示する
+                **({"short_id": i + 1} if sqlite else {}),
+            ))
+    db.commit()
+    keys = dict(db.query(Classroom.id, Classroom.short_id).filter(Classroom.id.like(f"{BENCH_PREFIX}%")))
+    db.close()
+    return keys
+
+
+def _cleanup(session_factory):
+    db = session_factory()
+    keys = db.query(Classroom.short_id).filter(Classroom.id.like(f"{BENCH_PREFIX}%")).scalar_subquery()
+    db.query(OccupancyHistory).filter(OccupancyHistory.classroom_key.in_(keys)).delete(synchronize_session=False)
+    db.query(Occupancy).filter(Occupancy.classroom_id.like(f"{BENCH_PREFIX}%")).delete(synchronize_session=False)
+    db.query(Classroom).filter(Classroom.id.like(f"{BENCH_PREFIX}%")).delete(synchronize_session=False)
+    db.query(Building).filter(Building.id == f"{BENCH_PREFIX}building").delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def _run(name: str, session_factory, statements: list, readings, write, batch_size: int = 1):
+    """1リクエスト = batch_size 件の読み取りを書き込んでコミット"""
+    db = session_factory()
+    statements[0] = 0
+    start = time.perf_counter()
+    for i in range(0, len(readings), batch_size):
+        write(db, readings[i:i + batch_size])
+        db.commit()
+    elapsed = time.perf_counter() - start
+    db.close()
+    print(
+        f"  {name:<32} {len(readings) / elapsed:9.1f}件/秒, "
+        f"SQL文 {statements[0] / len(readings):5.2f}/件（COMMITを除く）"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="占有状況の書き込みのベンチマーク")
+    parser.add_argument('--database-url', type=str, default=None, help='計測するデータベース（省略時は一時ファイルのSQLite）')
+    parser.add_argument('--readings', type=int, default=1000, help='書き込む読み取りの数（デフォルト: 1000）')
+    parser.add_argument('--classrooms', type=int, default=50, help='教室数（デフォルト: 50）')
+    parser.add_argument('--batch-size', type=int, default=50, help='一括書き込みの件数（デフォルト: 50）')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='SQL文ごとに加える往復時間（ミリ秒、デフォルト: 0）')
+    args = parser.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        path = Path(tempfile.mkdtemp()) / "benchmark_occupancy.db"
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(engine)
+
+    statements = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_):
+        statements[0] += 1
+        if args.latency_ms:
+            time.sleep(args.latency_ms / 1000)
+
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    classroom_keys = _setup(session_factory, args.classrooms)
+    history_ids = itertools.count(1) if engine.dialect.name == "sqlite" else None
+    print(
+        f"{engine.dialect.name}: 読み取り {args.readings}件, 教室 {args.classrooms}, "
+        f"往復 {args.latency_ms}ms/文"
+    )
+
+    def legacy(db, batch):
+        for reading in batch:
+            _legacy_write(db, reading, classroom_keys, history_ids)
+
+    def writer(db, batch):
+        occupancy_writer.write_many(db, batch)
+
+    try:
+        _run("従来（1件ずつ）", session_factory, statements, _make_readings(args.classrooms, args.readings, 0), legacy)
+        _run("OccupancyWriter（1件ずつ）", session_factory, statements, _make_readings(args.classrooms, args.readings, 1), writer)
+        _run(
+            f"OccupancyWriter（{args.batch_size}件ずつ）", session_factory, statements,
+            _make_readings(args.classrooms, args.readings, 2), writer, args.batch_size,
+        )
+
+        buffer = HistoryBuffer(flush_rows=args.batch_size * 10)
+        buffer.start(engine)
+        occupancy_writer.history_buffer = buffer
+        try:
+            _run(
+                "OccupancyWriter（履歴はバッファ）", session_factory, statements,
+                _make_readings(args.classrooms, args.readings, 3), writer,
+            )
+        finally:
+            occupancy_writer.history_buffer = None
+            buffer.stop()
+        metrics = buffer.metrics()
+        print(
+            f"    履歴の一括書き込み: {metrics['flushes']}回, 平均 {metrics['flush_time']['avg_ms']}ms, "
+            f"書き込み {metrics['written']}件, 破棄 {metrics['dropped']}件"
+        )
+    finally:
+        _cleanup(session_factory)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 """
 Camera and detection package
 """
-from .detector import PersonDetector, detect_people
+from .detector import PersonDetector, DetectionResult, detect_people
 from .processor import CameraProcessor
 
-__all__ = ["PersonDetector", "detect_people", "CameraProcessor"]
+__all__ = ["PersonDetector", "DetectionResult", "detect_people", "CameraProcessor"]
 
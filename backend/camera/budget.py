@@ -0,0 +1,168 @@
+"""
+Global inference budget for image-uploading cameras
+
+サーバー側で推論する画像アップロードのカメラが増えても、推論の総量が
+``frames_per_second`` を超えないように、各カメラに次のアップロード時刻（スロット）を
+割り当てます。予算は優先度に比例して配分し、状態が変わりつつある教室と
+お気に入り登録の多い教室ほど短い間隔になります。スロットは 1/frames_per_second 秒
+刻みで1枚ずつ予約するため、カメラが同時にアップロードすることもありません。
+"""
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+# 優先度の重み（基本は1.0）
+CHANGE_WEIGHT = 2.0  # 状態（空き・一部使用・混雑）が変わった直後、または人数が変動している
+FAVORITE_WEIGHT = 0.5  # log(1 + お気に入り登録数) あたり
+# 変動スコアの減衰（1回の観測ごと）
+CHANGE_DECAY = 0.5
+
+
+def _status_bucket(count: int, capacity: int) -> int:
+    """占有率の区分（routes/occupancy.py の状態判定と同じしきい値）"""
+    rate = count / capacity if capacity else 0.0
+    if rate >= 0.5:
+        return 2
+    if rate >= 0.1:
+        return 1
+    return 0
+
+
+class InferenceBudget:
+    """推論予算（フレーム/秒）をカメラに配分し、次のアップロードのスロットを決める"""
+
+    def __init__(
+        self,
+        frames_per_second: float,
+        min_interval: float = 5.0,
+        max_interval: float = 25.0,
+        active_window: float = 120.0,
+        favorites_ttl: float = 300.0,
+    ):
+        """
+        Args:
+            frames_per_second: サーバー全体で推論できるフレーム数/秒
+            min_interval: 1台のカメラのアップロード間隔の下限（秒）
+            max_interval: 上限（秒）。オフライン扱い（30秒）にならないようにする
+            active_window: この秒数アップロードが無いカメラは配分の対象から外す
+            favorites_ttl: お気に入り登録数を再読み込みする間隔（秒）
+        """
+        self.frames_per_second = frames_per_second
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.active_window = active_window
+        self.favorites_ttl = favorites_ttl
+        self._lock = threading.Lock()
+        self._last_seen: Dict[str, float] = {}
+        self._bucket: Dict[str, int] = {}
+        self._last_count: Dict[str, int] = {}
+        self._change: Dict[str, float] = {}
+        self._favorites: Dict[str, int] = {}
+        self._favorites_loaded_at: Optional[float] = None
+        self._slots: Dict[int, str] = {}
+        self.granted = 0
+
+    def favorites_stale(self) -> bool:
+        """お気に入り登録数を読み込み直す必要があるか"""
+        return self._favorites_loaded_at is None or time.monotonic() - self._favorites_loaded_at >= self.favorites_ttl
+
+    def set_favorites(self, counts: Dict[str, int]):
+        """教室ごとのお気に入り登録数を設定する"""
+        with self._lock:
+            self._favorites = dict(counts)
+            self._favorites_loaded_at = time.monotonic()
+
+    def observe(self, classroom_id: str, count: int, capacity: int):
+        """検出結果を記録する（状態の変化を優先度に反映する）"""
+        with self._lock:
+            bucket = _status_bucket(count, capacity)
+            change = self._change.get(classroom_id, 0.0) * CHANGE_DECAY
+            previous = self._last_count.get(classroom_id)
+            if previous is not None:
+                if bucket != self._bucket.get(classroom_id):
+                    change = 1.0
+                else:
+                    change = max(change, min(1.0, abs(count - previous) / 3))
+            self._bucket[classroom_id] = bucket
+            self._last_count[classroom_id] = count
+            self._change[classroom_id] = change
+
+    def priority(self, classroom_id: str) -> float:
+        return (
+            1.0
+            + CHANGE_WEIGHT * self._change.get(classroom_id, 0.0)
+            + FAVORITE_WEIGHT * math.log1p(self._favorites.get(classroom_id, 0))
+        )
+
+    def _intervals(self, now: float) -> Dict[str, float]:
+        """アクティブなカメラごとのアップロード間隔（優先度に比例して予算を配分）"""
+        for classroom_id, seen in list(self._last_seen.items()):
+            if now - seen > self.active_window:
+                del self._last_seen[classroom_id]
+        priorities = {cid: self.priority(cid) for cid in self._last_seen}
+
+        # 上限（1/min_interval）に達したカメラの余りを他のカメラに配り直す（water-filling）
+        rates: Dict[str, float] = {}
+        remaining = dict(priorities)
+        budget = self.frames_per_second
+        while remaining:
+            total = sum(remaining.values())
+            capped = {
+                cid for cid, p in remaining.items()
+                if budget * p / total >= 1.0 / self.min_interval
+            }
+            if not capped:
+                for cid, p in remaining.items():
+                    rates[cid] = budget * p / total
+                break
+            for cid in capped:
+                rates[cid] = 1.0 / self.min_interval
+                budget -= rates[cid]
+                del remaining[cid]
+
+        return {
+            cid: min(self.max_interval, max(self.min_interval, 1.0 / rate if rate > 0 else self.max_interval))
+            for cid, rate in rates.items()
+        }
+
+    def next_slot(self, classroom_id: str) -> float:
+        """
+        カメラの次のアップロードまでの秒数
+
+        配分された間隔の後で、まだ予約されていない最初のスロットを予約します
+        （max_interval を超える場合は予約せずに max_interval を返します）。
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[classroom_id] = now
+            interval = self._intervals(now)[classroom_id]
+
+            width = 1.0 / self.frames_per_second
+            current = math.floor(now / width)
+            for index in [i for i in self._slots if i < current]:
+                del self._slots[index]
+
+            index = math.ceil((now + interval) / width)
+            last = math.floor((now + self.max_interval) / width)
+            while index in self._slots and index < last:
+                index += 1
+            if index in self._slots:
+                return self.max_interval
+            self._slots[index] = classroom_id
+            self.granted += 1
+            return round(index * width - now, 3)
+
+    def metrics(self) -> dict:
+        """予算・アクティブなカメラ数・配分された間隔"""
+        now = time.monotonic()
+        with self._lock:
+            intervals = self._intervals(now)
+            return {
+                "frames_per_second": self.frames_per_second,
+                "active_cameras": len(intervals),
+                "allocated_fps": round(sum(1.0 / i for i in intervals.values()), 2),
+                "reserved_slots": len(self._slots),
+                "granted": self.granted,
+                "shortest_intervals": {cid: round(i, 2) for cid, i in sorted(intervals.items(), key=lambda item: item[1])[:10]},
+            }
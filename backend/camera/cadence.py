@@ -0,0 +1,104 @@
+"""
+Schedule-aware sampling cadence
+
+教室の人数が大きく変わるのは授業の開始・終了の前後（PERIOD_TIMES の境界）だけです。
+境界の前後と、直近の人数のばらつきが大きいときは短い間隔で、授業の途中は
+普通の間隔で、夜間・日曜は長い間隔で検出します。
+
+PERIOD_TIMES は大学の時刻（日本時間）のため、判定は ``timezone`` の時刻で行います
+（サーバー・コンテナのタイムゾーンがUTCでもずれません）。
+"""
+import statistics
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+from database.models.schedule import PERIOD_TIMES
+
+
+class CadencePolicy:
+    """時刻と直近の人数から次の検出までの間隔を決める
+
+    dense_interval: 授業の開始・終了の前後 ``window_minutes`` 分、または人数が変動しているとき
+    normal_interval: 授業中・休み時間
+    sparse_interval: 1時限の前と7時限の後（``window_minutes`` 分を除く）、および日曜
+    timezone: PERIOD_TIMES のタイムゾーン（``now`` はこのタイムゾーンに変換して判定する。
+        タイムゾーンの無い ``now`` はシステムのローカル時刻とみなす）
+    """
+
+    def __init__(
+        self,
+        dense_interval: float = 5.0,
+        normal_interval: float = 30.0,
+        sparse_interval: float = 300.0,
+        window_minutes: float = 10.0,
+        variance_threshold: float = 2.0,
+        timezone: str = "Asia/Tokyo",
+    ):
+        self.dense_interval = dense_interval
+        self.normal_interval = normal_interval
+        self.sparse_interval = sparse_interval
+        self.window = timedelta(minutes=window_minutes)
+        self.variance_threshold = variance_threshold
+        self.tz = ZoneInfo(timezone)
+        self._boundaries = sorted({t for period in PERIOD_TIMES.values() for t in period})
+        self._lock = threading.Lock()
+        self._planned: Dict[str, int] = defaultdict(int)
+        self._actual: Dict[str, int] = defaultdict(int)
+
+    def _near_boundary(self, now: datetime) -> bool:
+        for boundary in self._boundaries:
+            at = datetime.combine(now.date(), boundary, tzinfo=now.tzinfo)
+            if abs(now - at) <= self.window:
+                return True
+        return False
+
+    def mode(self, now: datetime, recent_counts: Sequence[int] = ()) -> str:
+        """
+        現在の検出モード
+
+        Returns:
+            str: "dense", "normal", "sparse"
+        """
+        now = now.astimezone(self.tz)
+        first = datetime.combine(now.date(), self._boundaries[0], tzinfo=now.tzinfo) - self.window
+        last = datetime.combine(now.date(), self._boundaries[-1], tzinfo=now.tzinfo) + self.window
+        if now.weekday() == 6 or not first <= now <= last:
+            return "sparse"
+        if self._near_boundary(now):
+            return "dense"
+        if len(recent_counts) >= 2 and statistics.pvariance(recent_counts) >= self.variance_threshold:
+            return "dense"
+        return "normal"
+
+    def interval(self, now: datetime, recent_counts: Sequence[int] = ()) -> float:
+        """次の検出までの間隔（秒）"""
+        return {
+            "dense": self.dense_interval,
+            "normal": self.normal_interval,
+            "sparse": self.sparse_interval,
+        }[self.mode(now, recent_counts)]
+
+    def plan(self, camera: str, now: datetime, recent_counts: Sequence[int] = ()) -> float:
+        """次の検出までの間隔を決め、予定した検出として記録する"""
+        with self._lock:
+            self._planned[camera] += 1
+        return self.interval(now, recent_counts)
+
+    def record_sample(self, camera: str):
+        """実際に検出したことを記録する"""
+        with self._lock:
+            self._actual[camera] += 1
+
+    def stats(self, camera: Optional[str] = None) -> dict:
+        """予定した検出数と実際の検出数（camera を省略すると全カメラの合計）"""
+        with self._lock:
+            if camera is not None:
+                return {"planned": self._planned[camera], "actual": self._actual[camera]}
+            return {
+                "planned": sum(self._planned.values()),
+                "actual": sum(self._actual.values()),
+                "cameras": len(self._planned),
+            }
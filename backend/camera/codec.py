@@ -0,0 +1,185 @@
+"""
+JPEG codec for the camera ingest path
+
+アップロードされる画像は検出器の入力サイズ（例: 長辺640px）より大きいことが多く、
+フル解像度でデコードしてから縮小するのは無駄です。JPEGはDCT係数の段階で
+1/2・1/4・1/8に縮小してデコードできる（libjpeg-turbo のスケーリング）ため、
+検出器の入力サイズ（ROIの切り出し後）を下回らない範囲で最も小さい縮尺を選びます。
+
+PyTurboJPEG（turbojpeg）がインストールされていればそれを使い、無い場合は
+OpenCV の IMREAD_REDUCED_COLOR_n（OpenCV同梱の libjpeg-turbo）にフォールバックします。
+"""
+import logging
+import struct
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from turbojpeg import TJPF_BGR, TurboJPEG
+
+    _turbo = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # パッケージが無い、または libturbojpeg の共有ライブラリが見つからない
+    _turbo = None
+
+# DCT領域で縮小できる倍率（大きい順）
+REDUCTIONS = (8, 4, 2)
+
+_CV2_REDUCED = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# 画像サイズを持つSOFマーカー（DHT=C4, JPG=C8, DAC=CC を除く）
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def backend_name() -> str:
+    """使用しているJPEGライブラリ"""
+    return "turbojpeg" if _turbo is not None else "opencv"
+
+
+@dataclass
+class DecodedImage:
+    """デコードした画像と元の解像度"""
+    image: np.ndarray
+    # 元の解像度 / デコードした解像度（検出結果の座標を元の解像度に戻すのに使う）
+    scale: float
+    # 元の画像の形状（高さ, 幅, チャンネル）
+    shape: Tuple[int, int, int]
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    JPEGのヘッダーから画像サイズを読み取る（デコードはしない）
+
+    Returns:
+        Tuple of (幅, 高さ)。JPEGでない・ヘッダーが壊れている場合はNone
+    """
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    pos = 2
+    length = len(data)
+    while pos + 4 <= length:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # フィルバイト
+            pos += 1
+            continue
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # SOFより前にEOI/SOSが来た
+            return None
+        (segment_length,) = struct.unpack(">H", data[pos + 2:pos + 4])
+        if marker in _SOF_MARKERS:
+            if pos + 9 > length:
+                return None
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return (width, height) if width and height else None
+        pos += 2 + segment_length
+    return None
+
+
+def choose_reduction(
+    width: int,
+    height: int,
+    min_size: Optional[int],
+    roi: Optional[Sequence[Tuple[float, float]]] = None,
+) -> int:
+    """
+    検出器の入力サイズを下回らない最大の縮小倍率（1, 2, 4, 8）
+
+    Args:
+        width, height: 元の画像サイズ
+        min_size: 検出器に渡す画像の長辺（None = フル解像度が必要）
+        roi: 推論プロファイルのROI（幅・高さに対する割合の多角形）。ROIの外接矩形の
+            長辺が min_size を下回らないようにする
+    """
+    if not min_size:
+        return 1
+    frac_w = frac_h = 1.0
+    if roi:
+        polygon = np.clip(np.asarray(roi, dtype=np.float32), 0.0, 1.0)
+        frac_w, frac_h = (polygon.max(axis=0) - polygon.min(axis=0)).tolist()
+        if frac_w <= 0 or frac_h <= 0:
+            frac_w = frac_h = 1.0
+    longest = max(width * frac_w, height * frac_h)
+    for reduction in REDUCTIONS:
+        if longest / reduction >= min_size:
+            return reduction
+    return 1
+
+
+def decode(
+    data: bytes,
+    min_size: Optional[int] = None,
+    roi: Optional[Sequence[Tuple[float, float]]] = None,
+) -> Optional[DecodedImage]:
+    """
+    画像をBGRにデコードする（JPEGは min_size に合わせてDCT領域で縮小する）
+
+    Args:
+        data: エンコード済み画像のバイトデータ（JPEG以外はOpenCVでフル解像度デコード）
+        min_size: 検出器に渡す画像の長辺（None = 縮小しない）
+        roi: 推論プロファイルのROI
+
+    Returns:
+        DecodedImage（デコードに失敗した場合はNone）
+    """
+    size = jpeg_size(data)
+    reduction = choose_reduction(size[0], size[1], min_size, roi) if size else 1
+
+    image = None
+    if size and _turbo is not None:
+        try:
+            image = _turbo.decode(
+                data,
+                pixel_format=TJPF_BGR,
+                scaling_factor=(1, reduction) if reduction > 1 else None,
+            )
+        except (OSError, ValueError) as e:
+            logger.debug(f"TurboJPEG decode failed, falling back to OpenCV: {e}")
+    if image is None:
+        buffer = np.frombuffer(data, np.uint8)
+        flags = _CV2_REDUCED[reduction] if size and reduction > 1 else cv2.IMREAD_COLOR
+        image = cv2.imdecode(buffer, flags)
+    if image is None:
+        return None
+
+    if size is None:
+        return DecodedImage(image=image, scale=1.0, shape=tuple(image.shape))
+    width, height = size
+    return DecodedImage(
+        image=image,
+        scale=width / image.shape[1],
+        shape=(height, width, image.shape[2] if image.ndim == 3 else 1),
+    )
+
+
+def encode(image: np.ndarray, quality: int = 85) -> Optional[bytes]:
+    """BGR画像をJPEGにエンコードする（失敗した場合はNone）"""
+    if _turbo is not None:
+        try:
+            return _turbo.encode(image, quality=quality, pixel_format=TJPF_BGR)
+        except (OSError, ValueError) as e:
+            logger.debug(f"TurboJPEG encode failed, falling back to OpenCV: {e}")
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+
+def encode_thumbnail(image: np.ndarray, width: int = 640, quality: int = 70) -> Optional[bytes]:
+    """解析結果画像を幅 width 以下に縮小してJPEGにエンコードする（エッジ検出のサムネイル用）"""
+    h, w = image.shape[:2]
+    if w > width:
+        image = cv2.resize(image, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+    return encode(image, quality=quality)
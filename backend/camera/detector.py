@@ -3,63 +3,263 @@ Person detection using computer vision
 """
 import cv2
 import numpy as np
+from dataclasses import dataclass, field
 from typing import List, Tuple, Optional
 from pathlib import Path
 import logging
+import threading
+import time
+
+from .profiles import InferenceProfile, DEFAULT_PROFILE
 
 logger = logging.getLogger(__name__)
 
+# COCO class ID for "person"
+PERSON_CLASS_ID = 0
+
+
+def _empty_boxes() -> np.ndarray:
+    return np.zeros((0, 4), dtype=np.float32)
+
+
+def _empty_scores() -> np.ndarray:
+    return np.zeros(0, dtype=np.float32)
+
+
+@dataclass
+class DetectionResult:
+    """Person detections for one image, stored as NumPy arrays
+    
+    boxes are xyxy pixel coordinates (N x 4), scores and classes have length N.
+    The annotated image is not rendered here; call :meth:`annotate` only when
+    somebody actually needs to look at it.
+    """
+    boxes: np.ndarray = field(default_factory=_empty_boxes)
+    scores: np.ndarray = field(default_factory=_empty_scores)
+    classes: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int16))
+    
+    @property
+    def count(self) -> int:
+        """Number of detected people"""
+        return int(len(self.boxes))
+    
+    @property
+    def confidence(self) -> float:
+        """Average detection confidence (0.0 when nobody was detected)"""
+        return float(self.scores.mean()) if len(self.scores) > 0 else 0.0
+    
+    @classmethod
+    def from_arrays(cls, boxes, scores, classes=None, class_id: Optional[int] = PERSON_CLASS_ID) -> "DetectionResult":
+        """Build a result from raw arrays, keeping only ``class_id`` with one vectorized mask"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        if classes is None:
+            classes = np.full(len(boxes), PERSON_CLASS_ID, dtype=np.int16)
+        else:
+            classes = np.asarray(classes).reshape(-1).astype(np.int16)
+        if class_id is not None:
+            mask = classes == class_id
+            boxes, scores, classes = boxes[mask], scores[mask], classes[mask]
+        return cls(boxes=boxes, scores=scores, classes=classes)
+    
+    @classmethod
+    def from_yolo(cls, result) -> "DetectionResult":
+        """Build a person-only result from an ultralytics ``Results`` object"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls()
+        return cls.from_arrays(
+            boxes.xyxy.cpu().numpy(),
+            boxes.conf.cpu().numpy(),
+            boxes.cls.cpu().numpy(),
+        )
+    
+    def select(self, mask: np.ndarray) -> "DetectionResult":
+        """Keep only the detections where ``mask`` is True"""
+        return DetectionResult(self.boxes[mask], self.scores[mask], self.classes[mask])
+
+    def scaled(self, factor: float) -> "DetectionResult":
+        """Boxes multiplied by ``factor`` (maps detections on a reduced decode back to full resolution)"""
+        if factor == 1.0:
+            return self
+        return DetectionResult(self.boxes * np.float32(factor), self.scores, self.classes)
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form (boxes rounded to 0.1 px)"""
+        return {
+            "boxes": self.boxes.round(1).tolist(),
+            "scores": self.scores.round(4).tolist(),
+            "classes": self.classes.tolist(),
+        }
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "DetectionResult":
+        """Inverse of :meth:`to_dict`"""
+        return cls.from_arrays(
+            data.get("boxes", []),
+            data.get("scores", []),
+            data.get("classes"),
+            class_id=None,
+        )
+    
+    def annotate(self, image: np.ndarray) -> np.ndarray:
+        """Draw the stored boxes on a copy of the image"""
+        annotated = image.copy()
+        for (x1, y1, x2, y2), score in zip(self.boxes, self.scores):
+            cv2.rectangle(annotated, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
+            cv2.putText(
+                annotated,
+                f"person {score:.2f}",
+                (int(x1), max(int(y1) - 5, 10)),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                (0, 255, 0),
+                1,
+            )
+        return annotated
+
+
+def crop_to_roi(
+    image: np.ndarray, roi: Optional[Tuple[Tuple[float, float], ...]]
+) -> Tuple[np.ndarray, Optional[np.ndarray], Tuple[int, int]]:
+    """
+    Crop an image to the bounding box of a region-of-interest polygon
+    
+    Args:
+        image: Input image
+        roi: Polygon vertices as fractions of width/height (None = whole image)
+        
+    Returns:
+        Tuple of (cropped view, polygon in crop pixel coordinates or None, (x_offset, y_offset))
+    """
+    if not roi:
+        return image, None, (0, 0)
+    
+    h, w = image.shape[:2]
+    polygon = np.asarray(roi, dtype=np.float32) * np.array([w, h], dtype=np.float32)
+    x0, y0 = np.floor(polygon.min(axis=0)).clip(0, [w, h]).astype(int)
+    x1, y1 = np.ceil(polygon.max(axis=0)).clip(0, [w, h]).astype(int)
+    if x1 <= x0 or y1 <= y0:
+        logger.warning(f"ROI lies outside the image ({w}x{h}); using the whole image")
+        return image, None, (0, 0)
+    
+    polygon -= np.array([x0, y0], dtype=np.float32)
+    return image[y0:y1, x0:x1], polygon, (int(x0), int(y0))
+
+
+def restore_from_roi(
+    result: DetectionResult, polygon: Optional[np.ndarray], offset: Tuple[int, int]
+) -> DetectionResult:
+    """
+    Drop detections whose box center is outside the ROI polygon and map the
+    remaining boxes from crop coordinates back to full-image coordinates
+    """
+    if polygon is None or result.count == 0:
+        return result
+    
+    centers = (result.boxes[:, :2] + result.boxes[:, 2:]) / 2
+    contour = polygon.reshape(-1, 1, 2)
+    inside = np.array(
+        [cv2.pointPolygonTest(contour, (float(x), float(y)), False) >= 0 for x, y in centers],
+        dtype=bool,
+    )
+    result = result.select(inside)
+    result.boxes = result.boxes + np.array([*offset, *offset], dtype=np.float32)
+    return result
+
 
 class PersonDetector:
     """Detect people in images using OpenCV"""
     
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(self, model_path: Optional[str] = None, profile: InferenceProfile = DEFAULT_PROFILE):
         """Initialize person detector"""
         self.model_path = model_path
+        self.profile = profile
         self.hog_detector = cv2.HOGDescriptor()
         self.hog_detector.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
         
-    def detect(self, image: np.ndarray) -> Tuple[int, float]:
+    def detect(self, image: np.ndarray, profile: Optional[InferenceProfile] = None) -> Tuple[int, float]:
         """
         Detect people in an image
         
         Args:
             image: Input image as numpy array
+            profile: Inference profile (defaults to the detector's profile)
             
         Returns:
             Tuple of (count, average_confidence)
         """
+        result = self.detect_result(image, profile)
+        return result.count, result.confidence
+    
+    def detect_result(self, image: np.ndarray, profile: Optional[InferenceProfile] = None) -> DetectionResult:
+        """
+        Detect people and return their bounding boxes
+        
+        The image is cropped to the bounding box of ``profile.roi`` and
+        downscaled so its longest side is ``profile.input_size`` before running
+        the HOG pyramid; boxes are mapped back to full resolution and
+        detections centered outside the ROI polygon are dropped.
+        
+        Args:
+            image: Input image as numpy array
+            profile: Inference profile (defaults to the detector's profile)
+            
+        Returns:
+            DetectionResult with xyxy boxes and HOG weights as scores
+        """
+        profile = profile or self.profile
         try:
+            image, polygon, offset = crop_to_roi(image, profile.roi)
+            
             # Convert to grayscale if needed
             if len(image.shape) == 3:
                 gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             else:
                 gray = image
             
+            # Downscale to the profile's input size
+            factor = 1.0
+            longest = max(gray.shape[:2])
+            if profile.input_size and longest > profile.input_size:
+                factor = profile.input_size / longest
+                gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+            
             # Detect people
             rects, weights = self.hog_detector.detectMultiScale(
                 gray,
-                winStride=(4, 4),
+                winStride=(profile.win_stride, profile.win_stride),
                 padding=(8, 8),
-                scale=1.05,
+                scale=profile.scale,
                 finalThreshold=2.0,
             )
             
-            count = len(rects)
-            avg_confidence = np.mean(weights) if len(weights) > 0 else 0.0
+            boxes = np.asarray(rects, dtype=np.float32).reshape(-1, 4)
+            boxes[:, 2:] += boxes[:, :2]  # xywh -> xyxy
+            boxes /= factor
             
-            return count, avg_confidence
+            result = DetectionResult.from_arrays(boxes, weights)
+            if profile.conf_threshold is not None:
+                result = result.select(result.scores >= profile.conf_threshold)
+            return restore_from_roi(result, polygon, offset)
             
         except Exception as e:
             logger.error(f"Error detecting people: {e}")
-            return 0, 0.0
+            return DetectionResult()
+    
+    def detect_batch(
+        self, images: List[np.ndarray], profile: Optional[InferenceProfile] = None
+    ) -> List[DetectionResult]:
+        """Detect people in several images (one at a time for HOG)"""
+        return [self.detect_result(image, profile) for image in images]
 
 
 class YOLODetector:
     """YOLO-based person detector (for production use)"""
     
-    def __init__(self, model_path: str = "yolov8n.pt"):
+    def __init__(self, model_path: str = "yolov8n.pt", profile: InferenceProfile = DEFAULT_PROFILE):
         """Initialize YOLO detector"""
+        self.profile = profile
         try:
             from ultralytics import YOLO
             self.model = YOLO(model_path)
@@ -68,118 +268,341 @@ class YOLODetector:
         except ImportError:
             logger.error("ultralytics not installed. Falling back to HOG detector.")
             self.model = None
-            self.hog_detector = PersonDetector()
+            self.hog_detector = PersonDetector(profile=profile)
         except Exception as e:
             logger.error(f"Error loading YOLO model: {e}. Falling back to HOG detector.")
             self.model = None
-            self.hog_detector = PersonDetector()
+            self.hog_detector = PersonDetector(profile=profile)
         
-    def detect(self, image: np.ndarray) -> Tuple[int, float]:
+    def detect(self, image: np.ndarray, profile: Optional[InferenceProfile] = None) -> Tuple[int, float]:
         """
         Detect people using YOLO (class_id=0 for person)
         
         Args:
             image: Input image as numpy array (BGR format)
+            profile: Inference profile (defaults to the detector's profile)
             
         Returns:
             Tuple of (count, average_confidence)
         """
+        result = self.detect_result(image, profile)
+        return result.count, result.confidence
+    
+    def detect_result(self, image: np.ndarray, profile: Optional[InferenceProfile] = None) -> DetectionResult:
+        """
+        Detect people and return boxes, scores and classes as NumPy arrays
+        
+        Args:
+            image: Input image as numpy array (BGR format)
+            profile: Inference profile (defaults to the detector's profile)
+            
+        Returns:
+            DetectionResult (person class only)
+        """
+        return self.detect_batch([image], profile)[0]
+    
+    def detect_batch(
+        self, images: List[np.ndarray], profile: Optional[InferenceProfile] = None
+    ) -> List[DetectionResult]:
+        """
+        Detect people in several images with a single forward pass
+        
+        Args:
+            images: List of input images (BGR format)
+            profile: Inference profile; input_size maps to ``imgsz``,
+                conf_threshold to ``conf``, and images are cropped to ``roi``
+            
+        Returns:
+            List of DetectionResult, one per image
+        """
+        if not images:
+            return []
+        
+        profile = profile or self.profile
+        
         if self.model is None:
             # Fallback to HOG
-            return self.hog_detector.detect(image)
+            return self.hog_detector.detect_batch(images, profile)
         
         try:
-            # YOLOv8 expects RGB format, but OpenCV uses BGR
-            # Convert BGR to RGB
-            if len(image.shape) == 3:
-                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            else:
-                image_rgb = image
+            crops = [crop_to_roi(image, profile.roi) for image in images]
             
-            # Run inference
-            results = self.model(image_rgb, verbose=False)
-            
-            # Filter for person class (class_id=0)
-            person_count = 0
-            confidences = []
+            # YOLOv8 expects RGB format, but OpenCV uses BGR
+            images_rgb = [
+                cv2.cvtColor(crop, cv2.COLOR_BGR2RGB) if len(crop.shape) == 3 else crop
+                for crop, _, _ in crops
+            ]
             
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        # Check if class_id is 0 (person)
-                        if int(box.cls) == 0:
-                            person_count += 1
-                            confidences.append(float(box.conf))
+            options = {}
+            if profile.input_size:
+                # ultralytics expects a multiple of the model stride (32)
+                options["imgsz"] = max(32, int(round(profile.input_size / 32)) * 32)
+            if profile.conf_threshold is not None:
+                options["conf"] = profile.conf_threshold
             
-            avg_confidence = np.mean(confidences) if len(confidences) > 0 else 0.0
+            # Run inference
+            results = self.model(images_rgb, verbose=False, **options)
             
-            return person_count, avg_confidence
+            # Filter for person class (class_id=0) with one mask per image
+            return [
+                restore_from_roi(DetectionResult.from_yolo(result), polygon, offset)
+                for result, (_, polygon, offset) in zip(results, crops)
+            ]
             
         except Exception as e:
             logger.error(f"Error in YOLO detection: {e}")
             # Fallback to HOG
             if hasattr(self, 'hog_detector'):
-                return self.hog_detector.detect(image)
-            return 0, 0.0
+                return self.hog_detector.detect_batch(images, profile)
+            return [DetectionResult() for _ in images]
     
     def detect_with_annotations(self, image: np.ndarray) -> Tuple[np.ndarray, int, float]:
         """
         Detect people and return annotated image with bounding boxes
         
+        Prefer :meth:`detect_result` on hot paths and render with
+        :meth:`DetectionResult.annotate` only when the image is needed.
+        
         Args:
             image: Input image as numpy array (BGR format)
             
         Returns:
             Tuple of (annotated_image, count, average_confidence)
         """
-        if self.model is None:
-            # Fallback to HOG
-            count, confidence = self.hog_detector.detect(image)
-            # Draw HOG detections (simple rectangles)
-            annotated = image.copy()
-            return annotated, count, confidence
-        
-        try:
-            # YOLOv8 expects RGB format
-            if len(image.shape) == 3:
-                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        result = self.detect_result(image)
+        return result.annotate(image), result.count, result.confidence
+
+
+class _CameraState:
+    """Per-camera state of the cascade's cheap stage"""
+    
+    def __init__(self):
+        self.background: Optional[np.ndarray] = None  # learned empty-room frame
+        self.noise = 0.0  # foreground ratio of frames confirmed empty (sensor noise / flicker)
+        self.reference: Optional[np.ndarray] = None  # frame of the last full inference
+        self.result: Optional[DetectionResult] = None  # result of the last full inference
+        self.skips = 0  # frames answered by the cheap stage since the last full inference
+
+
+class CascadeDetector:
+    """Cascade of a cheap per-camera frame-difference stage and a full detector
+    
+    Every frame is first shrunk to ``small_width`` px and compared with two
+    per-camera references:
+    
+    - "unchanged": almost no pixels differ from the frame of the last full
+      inference, so the cached result is returned
+    - "empty": almost no pixels differ from the learned empty-room background
+      (frames the full detector found nobody in), so an empty result is returned
+    
+    Only ambiguous frames reach the wrapped detector. After ``max_skips``
+    consecutive cheap answers the next frame always goes to the full detector
+    so slow drift cannot hide people indefinitely.
+    """
+    
+    def __init__(
+        self,
+        detector,
+        small_width: int = 80,
+        pixel_threshold: int = 25,
+        min_foreground_ratio: float = 0.005,
+        max_skips: int = 30,
+        background_rate: float = 0.1,
+    ):
+        """
+        Args:
+            detector: Full detector (YOLODetector, ONNXDetector or PersonDetector)
+            small_width: Width of the frames compared by the cheap stage
+            pixel_threshold: Gray-level difference counted as foreground
+            min_foreground_ratio: Foreground ratio below which a frame is "clearly" empty/unchanged
+            max_skips: Frames the cheap stage may answer before forcing a full inference
+            background_rate: Update rate of the learned empty-room background
+        """
+        self.detector = detector
+        self.profile = getattr(detector, "profile", DEFAULT_PROFILE)
+        self.small_width = small_width
+        self.pixel_threshold = pixel_threshold
+        self.min_foreground_ratio = min_foreground_ratio
+        self.max_skips = max_skips
+        self.background_rate = background_rate
+        self._states = {}
+        self._lock = threading.Lock()
+        self._counts = {"frames": 0, "empty": 0, "unchanged": 0, "full": 0}
+        self._stage_times = {"cheap": 0.0, "full": 0.0}
+    
+    def _small(self, image: np.ndarray, profile: InferenceProfile) -> np.ndarray:
+        image, _, _ = crop_to_roi(image, profile.roi)
+        if len(image.shape) == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        h, w = image.shape[:2]
+        height = max(1, int(round(h * self.small_width / w)))
+        small = cv2.resize(image, (self.small_width, height), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (3, 3), 0).astype(np.float32)
+    
+    def _foreground_ratio(self, small: np.ndarray, reference: Optional[np.ndarray]) -> float:
+        if reference is None or reference.shape != small.shape:
+            return 1.0
+        return float(np.count_nonzero(np.abs(small - reference) > self.pixel_threshold)) / small.size
+    
+    def _threshold(self, state: _CameraState) -> float:
+        # Cameras with more sensor noise / flicker need a higher foreground ratio
+        return max(self.min_foreground_ratio, 2.0 * state.noise)
+    
+    def _cheap_stage(self, state: _CameraState, small: np.ndarray) -> Optional[DetectionResult]:
+        """Return a result when the frame is clearly unchanged or clearly empty, else None"""
+        if state.skips >= self.max_skips:
+            return None
+        threshold = self._threshold(state)
+        if state.result is not None and self._foreground_ratio(small, state.reference) < threshold:
+            self._counts["unchanged"] += 1
+            return state.result
+        if self._foreground_ratio(small, state.background) < threshold:
+            self._counts["empty"] += 1
+            return DetectionResult()
+        return None
+    
+    def _learn(self, state: _CameraState, small: np.ndarray, result: DetectionResult):
+        """Remember a full-inference result and learn the background from empty frames"""
+        if result.count == 0:
+            if state.background is None or state.background.shape != small.shape:
+                state.background = small.copy()
             else:
-                image_rgb = image
-            
-            # Run inference
-            results = self.model(image_rgb, verbose=False)
-            
-            # Get annotated image (YOLO returns annotated image in RGB)
-            annotated_rgb = results[0].plot()
-            
-            # Convert back to BGR for OpenCV
-            annotated = cv2.cvtColor(annotated_rgb, cv2.COLOR_RGB2BGR)
-            
-            # Count people (class_id=0)
-            person_count = 0
-            confidences = []
-            
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        if int(box.cls) == 0:
-                            person_count += 1
-                            confidences.append(float(box.conf))
-            
-            avg_confidence = np.mean(confidences) if len(confidences) > 0 else 0.0
-            
-            return annotated, person_count, avg_confidence
+                ratio = self._foreground_ratio(small, state.background)
+                state.noise += self.background_rate * (ratio - state.noise)
+                cv2.accumulateWeighted(small, state.background, self.background_rate)
+        state.reference = small
+        state.result = result
+        state.skips = 0
+    
+    def detect(self, image: np.ndarray, profile: Optional[InferenceProfile] = None) -> Tuple[int, float]:
+        """Detect people with the full detector (no camera ID, so no cascade)"""
+        return self.detector.detect(image, profile)
+    
+    def detect_result(self, image: np.ndarray, profile: Optional[InferenceProfile] = None) -> DetectionResult:
+        """Detect people with the full detector (no camera ID, so no cascade)"""
+        return self.detector.detect_result(image, profile)
+    
+    def detect_batch(
+        self,
+        images: List[np.ndarray],
+        profile: Optional[InferenceProfile] = None,
+        camera_ids: Optional[List[Optional[str]]] = None,
+    ) -> List[DetectionResult]:
+        """
+        Detect people in several images, skipping the full detector where possible
+        
+        Args:
+            images: List of input images (BGR format)
+            profile: Inference profile
+            camera_ids: Camera (classroom) ID per image; images without an ID
+                always go to the full detector
             
-        except Exception as e:
-            logger.error(f"Error in YOLO detection with annotations: {e}")
-            # Fallback to HOG
-            if hasattr(self, 'hog_detector'):
-                count, confidence = self.hog_detector.detect(image)
-                annotated = image.copy()
-                return annotated, count, confidence
-            return image.copy(), 0, 0.0
+        Returns:
+            List of DetectionResult, one per image
+        """
+        if not images:
+            return []
+        
+        profile = profile or self.profile
+        camera_ids = camera_ids or [None] * len(images)
+        results: List[Optional[DetectionResult]] = [None] * len(images)
+        
+        started_at = time.perf_counter()
+        smalls = {
+            i: self._small(image, profile)
+            for i, (image, camera_id) in enumerate(zip(images, camera_ids))
+            if camera_id is not None
+        }
+        with self._lock:
+            self._counts["frames"] += len(images)
+            for i, small in smalls.items():
+                state = self._states.setdefault(camera_ids[i], _CameraState())
+                results[i] = self._cheap_stage(state, small)
+                if results[i] is not None:
+                    state.skips += 1
+            self._stage_times["cheap"] += time.perf_counter() - started_at
+        
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            started_at = time.perf_counter()
+            detections = self.detector.detect_batch([images[i] for i in pending], profile)
+            with self._lock:
+                self._stage_times["full"] += time.perf_counter() - started_at
+                self._counts["full"] += len(pending)
+                for i, result in zip(pending, detections):
+                    results[i] = result
+                    if i in smalls:
+                        self._learn(self._states[camera_ids[i]], smalls[i], result)
+        return results
+    
+    def detect_with_annotations(self, image: np.ndarray) -> Tuple[np.ndarray, int, float]:
+        """Detect people with the full detector and return an annotated image"""
+        result = self.detect_result(image)
+        return result.annotate(image), result.count, result.confidence
+    
+    def metrics(self) -> dict:
+        """Per-stage hit rates and average time per frame"""
+        with self._lock:
+            counts = dict(self._counts)
+            stage_times = dict(self._stage_times)
+            cameras = len(self._states)
+        frames = counts["frames"]
+        return {
+            **counts,
+            "empty_rate": round(counts["empty"] / frames, 3) if frames else 0.0,
+            "unchanged_rate": round(counts["unchanged"] / frames, 3) if frames else 0.0,
+            "full_rate": round(counts["full"] / frames, 3) if frames else 0.0,
+            "cheap_stage_avg_ms": round(stage_times["cheap"] / frames * 1000, 2) if frames else 0.0,
+            "full_stage_avg_ms": round(stage_times["full"] / counts["full"] * 1000, 1) if counts["full"] else 0.0,
+            "cameras": cameras,
+        }
+
+
+def detect_batch_for_cameras(
+    detector,
+    images: List[np.ndarray],
+    profile: Optional[InferenceProfile],
+    camera_ids: List[Optional[str]],
+) -> List[DetectionResult]:
+    """Run ``detect_batch``, passing camera IDs to detectors that keep per-camera state"""
+    if isinstance(detector, CascadeDetector):
+        return detector.detect_batch(images, profile, camera_ids)
+    return detector.detect_batch(images, profile)
+
+
+def create_detector(
+    backend: str = "yolo",
+    model_path: str = "yolov8n.pt",
+    quantize: bool = False,
+    profile: InferenceProfile = DEFAULT_PROFILE,
+    cascade: bool = False,
+):
+    """
+    Create a person detector for the configured backend
+    
+    All backends share the detect / detect_result / detect_batch /
+    detect_with_annotations interface.
+    
+    Args:
+        backend: "yolo" (ultralytics), "onnx" (ONNX Runtime CPU) or "hog" (OpenCV)
+        model_path: Model file (.pt for yolo, .onnx for onnx)
+        quantize: Use int8 dynamic quantization (onnx only)
+        profile: Default inference profile
+        cascade: Wrap the detector in a CascadeDetector (empty/unchanged pre-filter)
+        
+    Raises:
+        ValueError: Unknown backend
+    """
+    if backend == "yolo":
+        detector = YOLODetector(model_path=model_path, profile=profile)
+    elif backend == "onnx":
+        from .onnx_detector import ONNXDetector
+        detector = ONNXDetector(model_path=model_path, quantize=quantize, profile=profile)
+    elif backend == "hog":
+        detector = PersonDetector(profile=profile)
+    else:
+        raise ValueError(f"Unknown detection backend: {backend}. Use 'yolo', 'onnx' or 'hog'")
+    return CascadeDetector(detector) if cascade else detector
 
 
 def detect_people(image_path: str) -> Tuple[int, float]:
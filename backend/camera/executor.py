@@ -0,0 +1,498 @@
+"""
+Bounded inference executor for the camera ingest path
+
+推論（画像デコード・人物検出・結果画像の保存）をイベントループの外の
+スレッド／プロセスプールで実行し、待ち行列に上限を設けてバックプレッシャーをかけます。
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class WorkerModel:
+    """1世代分の検出器・推論プロファイル・フレームキャッシュ
+
+    スレッドモードでは同じ世代のスレッドが1つの検出器を共有します。
+    Ultralytics / PyTorch のモデルは同時に predict を呼び出すと安全ではないため、
+    検出器の呼び出しは ``lock`` で直列化します（デコードやフレームの保存は並列のまま）。
+    """
+    detector: Any
+    profiles: Any = None
+    frame_cache: Any = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+# モデルの世代ごとの WorkerModel（プロセスモードではプロセスごと）
+_worker_models: Dict[int, WorkerModel] = {}
+_worker_lock = threading.Lock()
+
+# スレッドごとの状態（担当するモデルの世代、推論サーバーのクライアント）
+_worker_local = threading.local()
+
+
+def _init_worker(
+    backend: str,
+    model_path: str,
+    quantize: bool,
+    profiles_path: Optional[str],
+    cascade: bool = False,
+    frame_cache: Optional[dict] = None,
+    generation: int = 0,
+):
+    """ワーカー起動時に検出器とプロファイルを読み込み、ウォームアップする
+
+    frame_cache: FingerprintCache の引数（Noneの場合はキャッシュしない）
+    generation: モデルの世代。同じプールのスレッドは同じ世代の検出器（とそのロック）を
+        共有し、モデル差し替え中も古いプールのスレッドは古い世代の検出器を使い続ける
+    """
+    with _worker_lock:
+        if generation not in _worker_models:
+            from .detector import create_detector
+            from .fingerprint import FingerprintCache
+            from .profiles import ProfileStore
+
+            started_at = time.time()
+            profiles = ProfileStore(profiles_path)
+            detector = create_detector(backend, model_path, quantize, profiles.get(), cascade)
+            _warm_up(detector)
+            _worker_models[generation] = WorkerModel(
+                detector=detector,
+                profiles=profiles,
+                frame_cache=FingerprintCache(**frame_cache) if frame_cache is not None else None,
+            )
+            logger.info(f"Detector ready: {model_path} (generation {generation}, {time.time() - started_at:.1f}s)")
+    _worker_local.generation = generation
+
+
+def _current_model() -> WorkerModel:
+    """このワーカースレッドが担当する世代のモデル"""
+    return _worker_models[getattr(_worker_local, "generation", 0)]
+
+
+def _release_generation(generation: int):
+    """使われなくなった世代の検出器を解放する（スレッドモード）"""
+    with _worker_lock:
+        _worker_models.pop(generation, None)
+
+
+def _warm_up(detector, sizes=((480, 640), (720, 1280))):
+    """合成フレームで推論を実行し、初回推論の遅延（JIT・メモリ確保）を起動時に済ませる"""
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    for height, width in sizes:
+        frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        detector.detect_batch([frame])
+
+
+def _ping() -> dict:
+    """ワーカーの検出器の状態を返す（読み込み・ウォームアップの完了待ちに使う）"""
+    detector = _current_model().detector
+    detector = getattr(detector, "detector", detector)  # CascadeDetector
+    return {
+        "generation": getattr(_worker_local, "generation", 0),
+        "detector": type(detector).__name__,
+        # モデルの読み込みに失敗してHOGにフォールバックしているか
+        "fallback": getattr(detector, "model", True) is None or getattr(detector, "session", True) is None,
+    }
+
+
+def _summarize(result, shape) -> dict:
+    return {
+        "person_count": result.count,
+        "confidence": result.confidence,
+        "shape": tuple(shape) if shape is not None else None,
+    }
+
+
+_INVALID = {"person_count": 0, "confidence": 0.0, "shape": None}
+
+
+def run_detection(image_bytes: bytes, classroom_id: Optional[str] = None) -> dict:
+    """
+    JPEGをデコードして人物検出を行い、最新フレームとして保存する（ワーカー内で実行）
+
+    Args:
+        image_bytes: エンコード済み画像のバイトデータ
+        classroom_id: フレームを保存する教室ID（Noneの場合は保存しない）
+
+    Returns:
+        dict: person_count, confidence, shape（デコード失敗時はshape=None）
+    """
+    return run_batch_detection([image_bytes], [classroom_id])[0]
+
+
+def run_batch_detection(images: List[bytes], classroom_ids: List[Optional[str]]) -> List[dict]:
+    """
+    複数の画像を1回のバッチ推論で処理し、最新フレームとして保存する（ワーカー内で実行）
+
+    解析結果画像はここでは描画しません（/static/processed/{id}.jpg の要求時に描画）。
+
+    Args:
+        images: エンコード済み画像のバイトデータのリスト
+        classroom_ids: 画像ごとの教室ID（Noneの場合は保存しない）
+
+    Returns:
+        List[dict]: 画像ごとの person_count, confidence, shape（デコード失敗時はshape=None）
+    """
+    from . import codec
+    from .fingerprint import detect_with_cache
+    from .frame_store import frame_store
+    from .profiles import ProfileStore, group_by_profile
+
+    model = _current_model()
+
+    results = [dict(_INVALID) for _ in images]
+    store = model.profiles or ProfileStore()
+    # 教室ごとの推論プロファイルが同じ画像をまとめて推論する
+    # （前回とほぼ同じフレームはキャッシュの結果を使う）
+    for profile, indices in group_by_profile(store, list(enumerate(classroom_ids))):
+        # プロファイルの入力サイズに合わせてDCT領域で縮小デコードする
+        decoded = {i: codec.decode(images[i], profile.input_size, profile.roi) for i in indices}
+        valid = [i for i in indices if decoded[i] is not None]
+        if not valid:
+            continue
+        with model.lock:
+            detections = detect_with_cache(
+                model.detector,
+                model.frame_cache,
+                [decoded[i].image for i in valid],
+                profile,
+                [classroom_ids[i] for i in valid],
+            )
+        for i, result in zip(valid, detections):
+            # 座標を元の解像度に戻す（保存するフレームはフル解像度のまま）
+            result = result.scaled(decoded[i].scale)
+            if classroom_ids[i]:
+                frame_store.save(classroom_ids[i], images[i], result)
+            results[i] = _summarize(result, decoded[i].shape)
+    return results
+
+
+def _get_client(socket_path: str):
+    """スレッドごとの推論サーバークライアントを取得"""
+    from .inference_server import InferenceClient
+
+    client = getattr(_worker_local, "client", None)
+    if client is None or client.socket_path != socket_path:
+        client = InferenceClient(socket_path)
+        _worker_local.client = client
+    return client
+
+
+def run_remote_detection(image_bytes: bytes, classroom_id: Optional[str], socket_path: str) -> dict:
+    """
+    推論サーバーで人物検出を行い、最新フレームとして保存する（ワーカー内で実行）
+
+    Args:
+        image_bytes: エンコード済み画像のバイトデータ
+        classroom_id: フレームを保存する教室ID（Noneの場合は保存しない）
+        socket_path: 推論サーバーのUnixソケット
+
+    Returns:
+        dict: person_count, confidence, shape（デコード失敗時はshape=None）
+    """
+    return run_remote_batch_detection([image_bytes], [classroom_id], socket_path)[0]
+
+
+def run_remote_batch_detection(
+    images: List[bytes], classroom_ids: List[Optional[str]], socket_path: str
+) -> List[dict]:
+    """
+    複数の画像を推論サーバーに送信し、最新フレームとして保存する（ワーカー内で実行）
+
+    Returns:
+        List[dict]: 画像ごとの person_count, confidence, shape（デコード失敗時はshape=None）
+
+    Raises:
+        InferenceUnavailable: 推論サーバーに接続できない・タイムアウトした・サーバー側で
+            推論に失敗した場合（画像の問題ではないため 400 にはしない）
+    """
+    from .detector import DetectionResult
+    from .frame_store import frame_store
+
+    try:
+        responses = _get_client(socket_path).detect_many(images, classroom_ids)
+    except (OSError, ValueError) as e:
+        # OSError: 接続失敗・タイムアウト・切断、ValueError: 壊れた応答
+        raise InferenceUnavailable(f"Inference server unavailable: {e}") from e
+
+    results = []
+    for image_bytes, classroom_id, response in zip(images, classroom_ids, responses):
+        if "error" in response:
+            if not response.get("invalid_image"):
+                raise InferenceUnavailable(f"Inference server error: {response['error']}")
+            results.append(dict(_INVALID))
+            continue
+
+        result = DetectionResult.from_dict(response)
+        if classroom_id:
+            frame_store.save(classroom_id, image_bytes, result)
+        results.append(_summarize(result, response["shape"]))
+    return results
+
+
+def _timed_call(fn: Callable, enqueued_at: float, *args) -> tuple:
+    """キュー待ち時間と実行時間を計測しながら関数を実行する"""
+    started_at = time.time()
+    result = fn(*args)
+    return result, started_at - enqueued_at, time.time() - started_at
+
+
+class InferenceQueueFull(Exception):
+    """推論キューが満杯の場合に送出される"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferenceUnavailable(Exception):
+    """推論サーバーを利用できない場合に送出される（接続失敗・タイムアウト・サーバー側の推論失敗）
+
+    ``retry_after`` は :meth:`InferenceExecutor.submit` が設定します。
+    """
+
+    retry_after: int = 5
+
+
+class InferenceExecutor:
+    """待ち行列に上限を持つ推論エグゼキューター
+
+    実行中のジョブ数 + 待機中のジョブ数が ``max_workers + max_queue`` に達した場合、
+    新しいジョブは即座に :class:`InferenceQueueFull` で拒否されます。
+    ``model_path`` が None の場合、ワーカーは検出器を読み込みません（推論サーバー利用時）。
+
+    モデルのライフサイクル:
+        - :meth:`preload` で起動時に全ワーカーの検出器を読み込み・ウォームアップする
+        - :meth:`swap_model` で新しいモデルを別のプールに読み込み、準備ができてから
+          プールを差し替える（古いプールに投入済みのジョブは古いモデルで完了する）
+    """
+
+    def __init__(
+        self,
+        model_path: Optional[str],
+        backend: str = "yolo",
+        quantize: bool = False,
+        profiles_path: Optional[str] = None,
+        cascade: bool = False,
+        frame_cache: Optional[dict] = None,
+        mode: str = "thread",
+        max_workers: int = 1,
+        max_queue: int = 8,
+        retry_after: int = 5,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor mode: {mode}. Use 'thread' or 'process'")
+
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+
+        self._worker_args = (backend, quantize, profiles_path, cascade, frame_cache)
+        self.model_path = model_path
+        self.generation = 0
+        # loading / ready / failed（推論サーバー利用時は読み込むモデルが無いため最初から ready）
+        self.state = "ready" if model_path is None else "loading"
+        self.detector_info: Optional[dict] = None
+        self.warmup_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._swap_lock = asyncio.Lock()
+        self._executor: Executor = self._create_pool(model_path, self.generation)
+
+        self._pending = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._unavailable = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_times = deque(maxlen=256)
+        self._run_times = deque(maxlen=256)
+
+        logger.info(
+            f"Inference executor started: mode={mode}, workers={self.max_workers}, queue={self.max_queue}"
+        )
+
+    def _create_pool(self, model_path: Optional[str], generation: int) -> Executor:
+        executor_cls = ThreadPoolExecutor if self.mode == "thread" else ProcessPoolExecutor
+        if model_path is None:
+            return executor_cls(max_workers=self.max_workers)
+        backend, quantize, profiles_path, cascade, frame_cache = self._worker_args
+        return executor_cls(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(backend, model_path, quantize, profiles_path, cascade, frame_cache, generation),
+        )
+
+    async def _warm_pool(self, pool: Executor) -> dict:
+        """プールの全ワーカーを起動し、検出器の読み込みとウォームアップを待つ"""
+        loop = asyncio.get_running_loop()
+        infos = await asyncio.gather(*(loop.run_in_executor(pool, _ping) for _ in range(self.max_workers)))
+        return infos[0]
+
+    async def preload(self):
+        """起動時に検出器を読み込み、合成フレームでウォームアップする"""
+        if self.model_path is None:
+            return
+        started_at = time.time()
+        try:
+            self.detector_info = await self._warm_pool(self._executor)
+        except Exception as e:
+            self.state = "failed"
+            self.last_error = str(e)
+            logger.error(f"Failed to load detector {self.model_path}: {e}")
+            return
+
+        self.warmup_seconds = time.time() - started_at
+        self.state = "ready"
+        if self.detector_info["fallback"]:
+            logger.warning(f"Model could not be loaded, serving with the HOG fallback: {self.model_path}")
+        logger.info(f"Inference workers ready in {self.warmup_seconds:.1f}s: {self.detector_info}")
+
+    async def swap_model(self, model_path: str) -> dict:
+        """
+        モデルを無停止で差し替える
+
+        新しいモデルを別のプールで読み込み・ウォームアップし、準備ができた時点で
+        新しいジョブの投入先を切り替えます。古いプールに投入済みのジョブは
+        古いモデルで最後まで処理されます。
+
+        Raises:
+            RuntimeError: 推論サーバー利用時（モデルはサーバー側で管理）
+            ValueError: モデルを読み込めなかった場合（現在のモデルをそのまま使う）
+        """
+        if self.model_path is None:
+            raise RuntimeError("Models are managed by the inference server in this mode")
+
+        async with self._swap_lock:
+            generation = self.generation + 1
+            pool = self._create_pool(model_path, generation)
+            started_at = time.time()
+            try:
+                info = await self._warm_pool(pool)
+                if info["fallback"]:
+                    raise ValueError(f"Model could not be loaded: {model_path}")
+            except Exception as e:
+                asyncio.get_running_loop().run_in_executor(None, self._retire_pool, pool, generation)
+                self.last_error = str(e)
+                logger.error(f"Model swap to {model_path} failed, keeping {self.model_path}: {e}")
+                raise ValueError(str(e)) from e
+
+            old_pool, old_path, old_generation = self._executor, self.model_path, self.generation
+            self._executor = pool
+            self.model_path = model_path
+            self.generation = generation
+            self.detector_info = info
+            self.warmup_seconds = time.time() - started_at
+            self.last_error = None
+            self.state = "ready"
+            # 投入済みのジョブは古いプールで完了させてから停止し、古い検出器を解放する
+            asyncio.get_running_loop().run_in_executor(None, self._retire_pool, old_pool, old_generation)
+
+        logger.info(f"Model swapped: {old_path} -> {model_path} (generation {generation})")
+        return self.model_status()
+
+    def _retire_pool(self, pool: Executor, generation: int):
+        pool.shutdown(wait=True)
+        if self.mode == "thread":
+            _release_generation(generation)
+
+    def model_status(self) -> dict:
+        """モデルの読み込み状態（/health 用）"""
+        return {
+            "state": self.state,
+            "ready": self.state == "ready",
+            "model_path": self.model_path,
+            "generation": self.generation,
+            "detector": self.detector_info,
+            "warmup_seconds": round(self.warmup_seconds, 2) if self.warmup_seconds is not None else None,
+            "last_error": self.last_error,
+        }
+
+    @property
+    def capacity(self) -> int:
+        """同時に受け付けられるジョブ数（実行中 + 待機中）"""
+        return self.max_workers + self.max_queue
+
+    async def submit(self, fn: Callable, *args) -> Any:
+        """
+        ジョブをワーカーで実行し、結果を待つ
+
+        Raises:
+            InferenceQueueFull: 待ち行列が満杯の場合
+            InferenceUnavailable: 推論サーバーを利用できない場合
+        """
+        if self._pending >= self.capacity:
+            self._rejected += 1
+            raise InferenceQueueFull(self.retry_after)
+
+        self._pending += 1
+        self._submitted += 1
+        loop = asyncio.get_running_loop()
+        try:
+            result, wait_time, run_time = await loop.run_in_executor(
+                self._executor, _timed_call, fn, time.time(), *args
+            )
+        except InferenceUnavailable as e:
+            self._failed += 1
+            self._unavailable += 1
+            e.retry_after = self.retry_after
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        self._completed += 1
+        self._wait_times.append(wait_time)
+        self._run_times.append(run_time)
+        return result
+
+    def metrics(self) -> dict:
+        """キュー深さ・待ち時間などのメトリクスを返す"""
+        def _stats(values) -> dict:
+            if not values:
+                return {"avg_ms": 0.0, "max_ms": 0.0}
+            return {
+                "avg_ms": round(sum(values) / len(values) * 1000, 1),
+                "max_ms": round(max(values) * 1000, 1),
+            }
+
+        metrics = {
+            "mode": self.mode,
+            "model": self.model_status(),
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._pending,
+            "queue_depth": max(0, self._pending - self.max_workers),
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "unavailable": self._unavailable,
+            "wait_time": _stats(self._wait_times),
+            "run_time": _stats(self._run_times),
+        }
+        # スレッドモードでは検出器を共有しているため、カスケードの段ごとのヒット率と
+        # フレームキャッシュのヒット率も返す
+        model = _worker_models.get(self.generation) if self.mode == "thread" else None
+        if model is not None:
+            if hasattr(model.detector, "metrics"):
+                metrics["cascade"] = model.detector.metrics()
+            if model.frame_cache is not None:
+                metrics["frame_cache"] = model.frame_cache.metrics()
+        return metrics
+
+    def shutdown(self, wait: bool = True):
+        """ワーカーを停止する"""
+        self._executor.shutdown(wait=wait)
+        logger.info("Inference executor stopped")
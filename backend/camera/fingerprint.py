@@ -0,0 +1,128 @@
+"""
+Frame fingerprint cache
+
+カメラは静止した場面でも --interval 秒ごとに画像を送ってくるため、
+デコードしたフレームの知覚ハッシュ（dHash）を計算し、教室の前回推論時の
+フレームとほぼ同じであれば推論を省略して前回の検出結果を再利用します。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from .detector import DetectionResult, crop_to_roi, detect_batch_for_cameras
+from .profiles import InferenceProfile
+
+
+def dhash(image: np.ndarray, hash_size: int = 16) -> int:
+    """
+    差分ハッシュ（dHash）を計算する
+
+    画像を (hash_size + 1) x hash_size のグレースケールに縮小し、隣り合う画素の
+    明暗の大小関係をビット列にします（hash_size=16 で256ビット）。
+
+    Returns:
+        int: ハッシュ値
+    """
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つのハッシュ値で異なるビット数"""
+    return bin(a ^ b).count("1")
+
+
+class FingerprintCache:
+    """教室ごとに直近の推論フレームのハッシュと検出結果を保持するLRUキャッシュ
+
+    ハッシュの差が ``max_distance`` ビット以内なら前回の結果を返します。
+    前回の推論から ``max_age`` 秒以上経った場合は、変化が無くても推論し直します。
+    """
+
+    def __init__(self, max_entries: int = 256, max_distance: int = 6, max_age: float = 300.0):
+        self.max_entries = max(1, max_entries)
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, classroom_id: str, fingerprint: int) -> Optional[DetectionResult]:
+        """前回とほぼ同じフレームなら前回の検出結果を返す（それ以外はNone）"""
+        with self._lock:
+            entry = self._entries.get(classroom_id)
+            if entry is not None:
+                previous, result, stored_at = entry
+                if (
+                    hamming_distance(previous, fingerprint) <= self.max_distance
+                    and time.monotonic() - stored_at < self.max_age
+                ):
+                    self._entries.move_to_end(classroom_id)
+                    self.hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, classroom_id: str, fingerprint: int, result: DetectionResult):
+        """推論したフレームのハッシュと検出結果を保存する"""
+        with self._lock:
+            self._entries[classroom_id] = (fingerprint, result, time.monotonic())
+            self._entries.move_to_end(classroom_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def metrics(self) -> dict:
+        """ヒット数・ミス数・ヒット率"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+def detect_with_cache(
+    detector,
+    cache: Optional[FingerprintCache],
+    images: List[np.ndarray],
+    profile: Optional[InferenceProfile],
+    classroom_ids: List[Optional[str]],
+) -> List[DetectionResult]:
+    """
+    前回とほぼ同じフレームはキャッシュの結果を使い、残りだけを推論する
+
+    ハッシュはプロファイルの関心領域（roi）内だけで計算します。
+    教室IDの無い画像は常に推論します。
+    """
+    if cache is None:
+        return detect_batch_for_cameras(detector, images, profile, classroom_ids)
+
+    roi = profile.roi if profile is not None else None
+    results: List[Optional[DetectionResult]] = [None] * len(images)
+    fingerprints = {}
+    for i, (image, classroom_id) in enumerate(zip(images, classroom_ids)):
+        if classroom_id is None:
+            continue
+        fingerprints[i] = dhash(crop_to_roi(image, roi)[0])
+        results[i] = cache.get(classroom_id, fingerprints[i])
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        detections = detect_batch_for_cameras(
+            detector, [images[i] for i in pending], profile, [classroom_ids[i] for i in pending]
+        )
+        for i, result in zip(pending, detections):
+            results[i] = result
+            if i in fingerprints:
+                cache.put(classroom_ids[i], fingerprints[i], result)
+    return results
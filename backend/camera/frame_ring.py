@@ -0,0 +1,211 @@
+"""
+Shared-memory frame ring between capture and detection processes
+
+撮影プロセスと推論プロセスを分けると、推論に時間がかかってもカメラの読み取りが
+止まりません。フレームをQueueで渡すと 1280x720 のBGR画像を毎回pickleして
+コピーすることになるため、共有メモリ上の固定サイズのスロットにフレームを書き込み、
+推論側はスロットをそのままnumpy配列として参照します（コピーなし）。
+
+1つのリングにつき書き込みは1プロセス（1台のカメラ）だけです。スロットごとの
+シーケンス番号で、読み取り中に上書きされたかを確認できます。
+
+使用例:
+    ring = FrameRing.create(shape=(720, 1280, 3))
+    worker = multiprocessing.Process(
+        target=capture_worker, args=(ring.spec(), "pc", "0", stop_event)
+    )
+    worker.start()
+
+    frame = ring.wait_latest(after=0, timeout=5.0)
+    result = detector.detect_result(frame.image)
+    if not ring.is_current(frame):
+        ...  # 推論中に上書きされた（スロット数を増やす）
+"""
+import logging
+import struct
+import sys
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ヘッダー: 最新のシーケンス番号（int64）
+_HEADER = struct.Struct("q")
+# スロットごとのメタデータ: シーケンス番号（int64、書き込み中は-1）, 撮影時刻（float64）
+_SLOT_META = struct.Struct("qd")
+
+
+@dataclass(frozen=True)
+class FrameView:
+    """リング内のフレーム（image は共有メモリを直接参照する）"""
+    seq: int
+    slot: int
+    captured_at: float
+    image: np.ndarray
+
+
+class FrameRing:
+    """共有メモリ上の固定サイズのフレームスロットのリングバッファ"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, shape: Tuple[int, int, int], owner: bool):
+        self._shm = shm
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.owner = owner
+
+        meta_size = _HEADER.size + _SLOT_META.size * slots
+        self._header = np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=0)
+        self._meta = np.ndarray(
+            (slots,), dtype=[("seq", np.int64), ("captured_at", np.float64)],
+            buffer=shm.buf, offset=_HEADER.size,
+        )
+        self._frames = np.ndarray(
+            (slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=meta_size,
+        )
+
+    @staticmethod
+    def _size(slots: int, shape: Tuple[int, int, int]) -> int:
+        return _HEADER.size + _SLOT_META.size * slots + slots * int(np.prod(shape))
+
+    @classmethod
+    def create(cls, shape: Tuple[int, int, int] = (720, 1280, 3), slots: int = 4, name: Optional[str] = None) -> "FrameRing":
+        """
+        共有メモリを確保してリングを作成する（作成したプロセスが close() で解放する）
+
+        Args:
+            shape: フレームの形状（高さ, 幅, チャンネル）。異なるサイズのフレームは縮小して書き込む
+            slots: スロット数（推論中に上書きされないよう、3以上を推奨）
+        """
+        if slots < 2:
+            raise ValueError("FrameRing needs at least 2 slots")
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls._size(slots, shape))
+        ring = cls(shm, slots, shape, owner=True)
+        ring._header[0] = 0
+        ring._meta["seq"] = 0
+        ring._meta["captured_at"] = 0.0
+        return ring
+
+    @classmethod
+    def attach(cls, spec: dict) -> "FrameRing":
+        """
+        別のプロセスで作成されたリングに接続する（spec は FrameRing.spec() の戻り値）
+
+        Python 3.12以前では、接続するプロセスは作成したプロセスから multiprocessing で
+        起動してください（resource_tracker を共有しないと、接続側の終了時に共有メモリが
+        解放されてしまうため）。
+        """
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=spec["name"], track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=spec["name"])
+        return cls(shm, spec["slots"], tuple(spec["shape"]), owner=False)
+
+    def spec(self) -> dict:
+        """他のプロセスに渡す接続情報（pickle可能）"""
+        return {"name": self._shm.name, "slots": self.slots, "shape": list(self.shape)}
+
+    @property
+    def latest_seq(self) -> int:
+        """最後に書き込まれたフレームのシーケンス番号（0 = まだ無い）"""
+        return int(self._header[0])
+
+    def write(self, frame: np.ndarray, captured_at: Optional[float] = None) -> int:
+        """
+        フレームを次のスロットに書き込む（書き込みは1プロセスだけが行う）
+
+        Returns:
+            int: 書き込んだフレームのシーケンス番号
+        """
+        seq = self.latest_seq + 1
+        slot = seq % self.slots
+        # 書き込み中は -1 にして、読み取り側が途中のフレームを使わないようにする
+        self._meta["seq"][slot] = -1
+        target = self._frames[slot]
+        if frame.shape == self.shape:
+            np.copyto(target, frame)
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=target, interpolation=cv2.INTER_AREA)
+        self._meta["captured_at"][slot] = time.time() if captured_at is None else captured_at
+        self._meta["seq"][slot] = seq
+        self._header[0] = seq
+        return seq
+
+    def latest(self, after: int = 0) -> Optional[FrameView]:
+        """
+        ``after`` より新しい最新のフレームを返す（無ければNone）
+
+        返される image は共有メモリを直接参照します。使い終わった後に
+        is_current() で上書きされていないことを確認してください。
+        """
+        seq = self.latest_seq
+        if seq <= after:
+            return None
+        slot = seq % self.slots
+        if int(self._meta["seq"][slot]) != seq:
+            return None
+        return FrameView(seq, slot, float(self._meta["captured_at"][slot]), self._frames[slot])
+
+    def wait_latest(self, after: int = 0, timeout: float = 1.0, poll_interval: float = 0.002) -> Optional[FrameView]:
+        """新しいフレームが書き込まれるまで待つ（タイムアウト時はNone）"""
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = self.latest(after)
+            if frame is not None or time.monotonic() >= deadline:
+                return frame
+            time.sleep(poll_interval)
+
+    def is_current(self, frame: FrameView) -> bool:
+        """フレームのスロットがまだ上書きされていないか"""
+        return int(self._meta["seq"][frame.slot]) == frame.seq
+
+    def close(self):
+        """共有メモリを閉じる（作成したプロセスでは解放も行う）"""
+        # numpy配列が共有メモリを参照している間は閉じられないため先に破棄する
+        self._header = self._meta = self._frames = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+def capture_worker(spec: dict, camera_type: str, camera_source: str, stop_event, reconnect_delay: float = 5.0):
+    """
+    カメラからフレームを読み取り続けてリングに書き込む（撮影プロセスのエントリポイント）
+
+    Args:
+        spec: FrameRing.spec() の戻り値
+        camera_type: カメラタイプ（"pc" または "raspberry_pi"）
+        camera_source: カメラソース
+        stop_event: multiprocessing.Event（セットされたら終了）
+    """
+    from .source import CameraSource
+
+    ring = FrameRing.attach(spec)
+    cap = None
+    try:
+        while not stop_event.is_set():
+            if cap is None:
+                cap = CameraSource.get_camera(camera_type, camera_source)
+                if not cap.isOpened():
+                    logger.error(f"Failed to open camera: type={camera_type}, source={camera_source}")
+                    cap.release()
+                    cap = None
+                    stop_event.wait(reconnect_delay)
+                    continue
+
+            ret, frame = cap.read()
+            if not ret:
+                logger.warning(f"Could not read frame from {camera_source}; reconnecting")
+                cap.release()
+                cap = None
+                stop_event.wait(reconnect_delay)
+                continue
+            ring.write(frame)
+    finally:
+        if cap is not None:
+            cap.release()
+        ring.close()
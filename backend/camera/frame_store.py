@@ -0,0 +1,163 @@
+"""
+Latest-frame store with lazily rendered annotated images
+
+取り込み時は受信したJPEGと検出結果（ボックス）をそのまま保存するだけにし、
+バウンディングボックス付きの解析結果画像は /static/processed/{id}.jpg が
+実際にリクエストされたときに描画します。
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from .detector import DetectionResult
+
+logger = logging.getLogger(__name__)
+
+# backend/static 以下
+STATIC_DIR = Path(__file__).parent.parent / "static"
+FRAMES_DIR = STATIC_DIR / "frames"
+PROCESSED_DIR = STATIC_DIR / "processed"
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def _atomic_write(path: Path, data: bytes):
+    # 推論ワーカーと配信スレッドが同じファイルを同時に書くことがあるため、
+    # 一時ファイル名は書き込みごとに一意にする
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False) as f:
+        f.write(data)
+    try:
+        os.replace(f.name, path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+
+
+class FrameStore:
+    """教室ごとの最新フレームと検出結果を保存する"""
+
+    def __init__(self, frames_dir: Path = FRAMES_DIR, processed_dir: Path = PROCESSED_DIR):
+        self.frames_dir = Path(frames_dir)
+        self.processed_dir = Path(processed_dir)
+
+    @staticmethod
+    def is_valid_id(classroom_id: str) -> bool:
+        """ファイル名として安全な教室IDかどうか"""
+        return bool(_VALID_ID.match(classroom_id)) and classroom_id not in (".", "..")
+
+    def frame_path(self, classroom_id: str) -> Path:
+        return self.frames_dir / f"{classroom_id}.jpg"
+
+    def result_path(self, classroom_id: str) -> Path:
+        return self.frames_dir / f"{classroom_id}.json"
+
+    def processed_path(self, classroom_id: str) -> Path:
+        return self.processed_dir / f"{classroom_id}.jpg"
+
+    def request_path(self, classroom_id: str) -> Path:
+        return self.frames_dir / f"{classroom_id}.request"
+
+    def save(self, classroom_id: str, image_bytes: bytes, result: DetectionResult):
+        """
+        受信したJPEGと検出結果を保存する（再エンコード・描画は行わない）
+
+        Args:
+            classroom_id: 教室ID
+            image_bytes: 受信したエンコード済み画像
+            result: 検出結果
+        """
+        if not self.is_valid_id(classroom_id):
+            raise ValueError(f"Invalid classroom ID for frame storage: {classroom_id}")
+
+        self.frames_dir.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.frame_path(classroom_id), image_bytes)
+        _atomic_write(self.result_path(classroom_id), json.dumps(result.to_dict()).encode("utf-8"))
+
+    def save_thumbnail(self, classroom_id: str, image_bytes: bytes):
+        """
+        エッジ側で描画済みの解析結果画像（サムネイル）をそのまま保存する
+
+        Args:
+            classroom_id: 教室ID
+            image_bytes: エンコード済みJPEG
+        """
+        if not self.is_valid_id(classroom_id):
+            raise ValueError(f"Invalid classroom ID for frame storage: {classroom_id}")
+
+        self.processed_dir.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.processed_path(classroom_id), image_bytes)
+        self.request_path(classroom_id).unlink(missing_ok=True)
+
+    def request_thumbnail(self, classroom_id: str) -> bool:
+        """
+        エッジ検出のカメラに、次の人数送信時にサムネイルを送るよう要求する
+
+        要求が既に残っている場合は何もしません（教室ごとに要求は高々1件）。
+        教室が存在するかどうかは呼び出し側で確認してください。
+
+        Returns:
+            bool: 新しく要求した場合True
+        """
+        if not self.is_valid_id(classroom_id):
+            return False
+        self.frames_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            os.close(os.open(self.request_path(classroom_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def pop_thumbnail_request(self, classroom_id: str) -> bool:
+        """サムネイルが要求されていればTrueを返し、要求を取り消す"""
+        if not self.is_valid_id(classroom_id):
+            return False
+        try:
+            self.request_path(classroom_id).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def render(self, classroom_id: str) -> Optional[Path]:
+        """
+        解析結果画像のパスを返す（最新フレームより古い場合は描画し直す）
+
+        Returns:
+            Path: 解析結果画像のパス（フレームも既存画像も無い場合はNone）
+        """
+        if not self.is_valid_id(classroom_id):
+            return None
+
+        processed = self.processed_path(classroom_id)
+        frame = self.frame_path(classroom_id)
+        result_file = self.result_path(classroom_id)
+
+        if not (frame.exists() and result_file.exists()):
+            # 保存済みフレームが無い場合は、既存の解析結果画像があればそれを返す
+            return processed if processed.exists() else None
+
+        if processed.exists() and processed.stat().st_mtime >= result_file.stat().st_mtime:
+            return processed
+
+        from . import codec
+
+        decoded = codec.decode(frame.read_bytes())
+        if decoded is None:
+            logger.warning(f"Stored frame could not be decoded: {frame}")
+            return processed if processed.exists() else None
+
+        result = DetectionResult.from_dict(json.loads(result_file.read_text(encoding="utf-8")))
+        encoded = codec.encode(result.annotate(decoded.image), quality=85)
+        if encoded is None:
+            return processed if processed.exists() else None
+
+        self.processed_dir.mkdir(parents=True, exist_ok=True)
+        _atomic_write(processed, encoded)
+        return processed
+
+
+# デフォルトのフレームストア
+frame_store = FrameStore()
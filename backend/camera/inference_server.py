@@ -0,0 +1,339 @@
+"""
+Micro-batching inference server shared by all API workers
+
+モデルを1プロセスだけで保持し、Unixソケット経由で複数のAPIワーカーから
+検出リクエストを受け付けます。同時に届いたフレームはマイクロバッチにまとめて
+1回の推論で処理します。
+
+使用方法:
+    python -m camera.inference_server --socket /tmp/yac-inference.sock
+
+API側の設定 (.env):
+    INFERENCE_SERVER_SOCKET=/tmp/yac-inference.sock
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+from . import codec
+from .fingerprint import FingerprintCache, detect_with_cache
+from .profiles import ProfileStore, group_by_profile
+
+logger = logging.getLogger(__name__)
+
+# メッセージ長のヘッダー（4バイト、ネットワークバイトオーダー）
+_HEADER = struct.Struct("!I")
+# リクエスト本文の先頭: 教室ID（プロファイル選択用）の長さ（2バイト）
+_KEY_HEADER = struct.Struct("!H")
+_MAX_MESSAGE_SIZE = 32 * 1024 * 1024
+
+
+def _pack_request(image_bytes: bytes, classroom_id: Optional[str]) -> bytes:
+    key = (classroom_id or "").encode("utf-8")
+    body = _KEY_HEADER.pack(len(key)) + key + image_bytes
+    return _HEADER.pack(len(body)) + body
+
+
+def _unpack_request(payload: bytes) -> Tuple[Optional[str], bytes]:
+    (key_length,) = _KEY_HEADER.unpack_from(payload)
+    start = _KEY_HEADER.size
+    key = payload[start:start + key_length].decode("utf-8") or None
+    return key, payload[start + key_length:]
+
+
+async def _read_message(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(_HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    if length > _MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message too large: {length} bytes")
+    return await reader.readexactly(length)
+
+
+def _write_message(writer: asyncio.StreamWriter, payload: bytes):
+    writer.write(_HEADER.pack(len(payload)) + payload)
+
+
+class InferenceServer:
+    """マイクロバッチ推論サーバー
+
+    最初のフレームが届いてから ``max_wait_ms`` 経過するか、``max_batch_size`` 枚
+    揃った時点でバッチを確定し、``detector.detect_batch`` を呼び出します
+    （教室ごとの推論プロファイルが異なる場合はプロファイル単位で呼び出します）。
+    """
+
+    def __init__(
+        self,
+        detector,
+        socket_path: str,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        profiles: Optional[ProfileStore] = None,
+        frame_cache: Optional[FingerprintCache] = None,
+    ):
+        self.detector = detector
+        self.profiles = profiles or ProfileStore()
+        self.frame_cache = frame_cache
+        self.socket_path = socket_path
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_sizes = deque(maxlen=256)
+        self._batch_times = deque(maxlen=256)
+        self._frames = 0
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """1接続で複数リクエストを受け付ける
+
+        リクエストはパイプライン化でき、レスポンスは受信順に返します。
+        1接続から連続で送られたフレームも同じバッチにまとめられます。
+        """
+        pending: asyncio.Queue = asyncio.Queue()
+
+        async def _respond():
+            while True:
+                future = await pending.get()
+                if future is None:
+                    break
+                try:
+                    response = await future
+                except Exception as e:
+                    response = {"error": str(e)}
+                _write_message(writer, json.dumps(response).encode("utf-8"))
+                await writer.drain()
+
+        responder = asyncio.create_task(_respond())
+        try:
+            while True:
+                try:
+                    payload = await _read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+
+                future = asyncio.get_running_loop().create_future()
+                await pending.put(future)
+                await self._queue.put((payload, future))
+
+            await pending.put(None)
+            await responder
+        except Exception as e:
+            logger.error(f"Inference client error: {e}")
+            responder.cancel()
+        finally:
+            writer.close()
+
+    async def _collect_batch(self) -> List[Tuple[bytes, asyncio.Future]]:
+        """最大バッチサイズか最大待ち時間に達するまでフレームを集める"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _run_batch(self, payloads: List[bytes]) -> List[dict]:
+        """バッチをデコードして推論する（推論スレッドで実行）"""
+        requests = [_unpack_request(p) for p in payloads]
+
+        # デコードできなかった画像はクライアントの責任（400）、それ以外のエラーは
+        # サーバー側の障害（503）としてクライアントが区別できるよう invalid_image を付ける
+        responses = [{"error": "画像の読み込みに失敗しました", "invalid_image": True} for _ in payloads]
+        for profile, indices in group_by_profile(self.profiles, [(i, request[0]) for i, request in enumerate(requests)]):
+            # プロファイルの入力サイズに合わせてDCT領域で縮小デコードする
+            images = {i: codec.decode(requests[i][1], profile.input_size, profile.roi) for i in indices}
+            valid = [i for i in indices if images[i] is not None]
+            if not valid:
+                continue
+            detections = detect_with_cache(
+                self.detector, self.frame_cache, [images[i].image for i in valid], profile, [requests[i][0] for i in valid]
+            )
+            for i, result in zip(valid, detections):
+                responses[i] = {**result.scaled(images[i].scale).to_dict(), "shape": list(images[i].shape)}
+        return responses
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            payloads = [payload for payload, _ in batch]
+            started_at = time.monotonic()
+            try:
+                responses = await loop.run_in_executor(None, self._run_batch, payloads)
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self._frames += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._batch_times.append(time.monotonic() - started_at)
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+
+    async def _log_stats(self, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            if self._batch_sizes:
+                avg_batch = sum(self._batch_sizes) / len(self._batch_sizes)
+                avg_ms = sum(self._batch_times) / len(self._batch_times) * 1000
+                logger.info(
+                    f"Inference stats: frames={self._frames}, avg_batch={avg_batch:.2f}, avg_batch_time={avg_ms:.1f}ms"
+                )
+                if hasattr(self.detector, "metrics"):
+                    logger.info(f"Cascade stats: {self.detector.metrics()}")
+                if self.frame_cache is not None:
+                    logger.info(f"Frame cache stats: {self.frame_cache.metrics()}")
+
+    async def serve_forever(self):
+        """Unixソケットで待ち受けを開始する"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self._queue = asyncio.Queue()
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        logger.info(
+            f"Inference server listening on {self.socket_path} "
+            f"(max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000:.0f})"
+        )
+
+        tasks = [asyncio.create_task(self._batch_loop()), asyncio.create_task(self._log_stats())]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class InferenceClient:
+    """推論サーバーへの同期クライアント（接続は使い回す）"""
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._sock = sock
+        return self._sock
+
+    def _recv_exactly(self, size: int) -> bytes:
+        chunks = []
+        while size > 0:
+            chunk = self._sock.recv(min(size, 1024 * 1024))
+            if not chunk:
+                raise ConnectionError("Inference server closed the connection")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def detect(self, image_bytes: bytes, classroom_id: Optional[str] = None) -> dict:
+        """
+        エンコード済み画像を送信して検出結果を受け取る
+
+        Returns:
+            dict: boxes, scores, classes, shape（DetectionResult.from_dict で復元可能）
+
+        Raises:
+            ValueError: サーバーが画像を処理できなかった場合
+        """
+        response = self.detect_many([image_bytes], [classroom_id])[0]
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def detect_many(self, images: List[bytes], classroom_ids: Optional[List[Optional[str]]] = None) -> List[dict]:
+        """
+        複数の画像をまとめて送信し、送信順に検出結果を受け取る
+
+        Args:
+            images: エンコード済み画像のリスト
+            classroom_ids: 画像ごとの教室ID（サーバー側で推論プロファイルの選択に使う）
+
+        Returns:
+            List[dict]: 画像ごとの検出結果（失敗した画像は ``error`` キーを含み、
+            デコードできなかった画像はさらに ``invalid_image`` が True）
+
+        Raises:
+            OSError: 接続・送受信に失敗した場合（タイムアウトを含む）
+        """
+        try:
+            sock = self._connect()
+            classroom_ids = classroom_ids or [None] * len(images)
+            sock.sendall(b"".join(_pack_request(image, cid) for image, cid in zip(images, classroom_ids)))
+            responses = []
+            for _ in images:
+                (length,) = _HEADER.unpack(self._recv_exactly(_HEADER.size))
+                responses.append(json.loads(self._recv_exactly(length)))
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+        return responses
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def main():
+    """メイン関数"""
+    from config import settings
+    from .detector import create_detector
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="マイクロバッチ推論サーバー")
+    parser.add_argument('--socket', type=str, default=settings.inference_server_socket or "/tmp/yac-inference.sock", help='Unixソケットのパス')
+    parser.add_argument('--backend', type=str, default=settings.detection_backend, choices=['yolo', 'onnx', 'hog'], help='検出バックエンド')
+    parser.add_argument('--model', type=str, default=settings.detection_model_path, help='モデルファイルのパス')
+    parser.add_argument('--quantize', action='store_true', default=settings.detection_onnx_quantize, help='int8量子化（onnxのみ）')
+    parser.add_argument('--cascade', action='store_true', default=settings.detection_cascade, help='空室・無変化フレームの事前判定を有効にする')
+    parser.add_argument('--max-batch-size', type=int, default=settings.inference_max_batch_size, help='最大バッチサイズ')
+    parser.add_argument('--max-wait-ms', type=float, default=settings.inference_max_wait_ms, help='バッチを確定するまでの最大待ち時間（ミリ秒）')
+    args = parser.parse_args()
+
+    detector = create_detector(args.backend, args.model, args.quantize, cascade=args.cascade)
+    server = InferenceServer(
+        detector,
+        socket_path=args.socket,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        profiles=ProfileStore(settings.inference_profiles_path or None),
+        frame_cache=FingerprintCache(
+            max_entries=settings.frame_cache_size,
+            max_distance=settings.frame_cache_max_distance,
+            max_age=settings.frame_cache_max_age,
+        ) if settings.frame_cache_size > 0 else None,
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("推論サーバーを終了します")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Frame change detection for the edge capture loop
+
+縮小したグレースケール画像の差分で、前回送信したフレームから場面が
+変化したかを判定します。変化の無いフレームは送信（エッジ検出の場合は推論も）
+せずに済ませ、一定時間送信が無い場合だけハートビートとして送信します。
+"""
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class ChangeDetector:
+    """前回送信したフレームとの差分で変化を判定する"""
+
+    def __init__(
+        self,
+        threshold: float = 0.02,
+        max_silence: float = 25.0,
+        width: int = 64,
+        pixel_threshold: int = 25,
+    ):
+        """
+        Args:
+            threshold: 変化ありとみなす画素の割合（0の場合は常に送信）
+            max_silence: 変化が無くてもこの秒数ごとに送信する（サーバーにオフラインと判定されないため）
+            width: 比較する縮小画像の幅（ピクセル）
+            pixel_threshold: 変化とみなす輝度差
+        """
+        self.threshold = threshold
+        self.max_silence = max_silence
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self._reference: Optional[np.ndarray] = None
+        self._last_sent: Optional[float] = None
+
+    def _small(self, frame: np.ndarray) -> np.ndarray:
+        if len(frame.shape) == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, int(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def change_ratio(self, frame: np.ndarray) -> float:
+        """前回送信したフレームから変化した画素の割合（初回は1.0）"""
+        small = self._small(frame)
+        if self._reference is None or self._reference.shape != small.shape:
+            return 1.0
+        diff = cv2.absdiff(small, self._reference)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def should_send(self, frame: np.ndarray, now: Optional[float] = None) -> str:
+        """
+        フレームを送信すべきか判定する
+
+        Returns:
+            str: "changed"（変化あり）, "heartbeat"（変化なしだが送信間隔の上限）, "" （送信しない）
+        """
+        now = time.time() if now is None else now
+        if self.threshold <= 0 or self.change_ratio(frame) >= self.threshold:
+            return "changed"
+        if self._last_sent is None or now - self._last_sent >= self.max_silence:
+            return "heartbeat"
+        return ""
+
+    def heartbeat_due(self, now: Optional[float] = None) -> bool:
+        """前回の送信から max_silence 秒経ったか（フレームを見ずに判定する）"""
+        now = time.time() if now is None else now
+        return self._last_sent is not None and now - self._last_sent >= self.max_silence
+
+    def mark_sent(self, frame: np.ndarray, now: Optional[float] = None, update_reference: bool = True):
+        """
+        送信したことを記録する
+
+        Args:
+            update_reference: 比較の基準フレームを更新するか（ハートビートでは
+                更新しないことで、ゆっくりした変化も基準との差として検出できる）
+        """
+        self._last_sent = time.time() if now is None else now
+        if update_reference:
+            self._reference = self._small(frame)
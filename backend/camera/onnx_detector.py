@@ -0,0 +1,241 @@
+"""
+ONNX Runtime person detector for CPU-only servers
+
+ultralytics/PyTorch を読み込まずに、エクスポート済みのYOLOv8 ONNXモデルを
+ONNX Runtime の CPUExecutionProvider で実行します。前処理（レターボックス）と
+後処理（人物クラスの抽出・NMS）はNumPyで行います。
+
+モデルのエクスポート:
+    yolo export model=yolov8n.pt format=onnx
+"""
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .detector import DetectionResult, PersonDetector, PERSON_CLASS_ID, crop_to_roi, restore_from_roi
+from .profiles import InferenceProfile, DEFAULT_PROFILE
+
+logger = logging.getLogger(__name__)
+
+
+def letterbox(image: np.ndarray, size: int) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """
+    アスペクト比を保ったまま size x size にリサイズし、余白をグレー(114)で埋める
+
+    Returns:
+        Tuple of (padded image, scale, (pad_x, pad_y))
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return padded, scale, (left, top)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    NumPyによるNon-Maximum Suppression
+
+    Args:
+        boxes: Nx4 xyxy
+        scores: N
+        iou_threshold: これを超えて重なるボックスを抑制する
+
+    Returns:
+        残すボックスのインデックス（スコア降順）
+    """
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def quantize_model(model_path: str) -> str:
+    """
+    ONNXモデルを動的int8量子化する（結果は <name>.int8.onnx にキャッシュ）
+
+    Returns:
+        量子化済みモデルのパス
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = Path(model_path)
+    target = source.with_name(f"{source.stem}.int8.onnx")
+    if not target.exists() or target.stat().st_mtime < source.stat().st_mtime:
+        logger.info(f"Quantizing ONNX model to int8: {target}")
+        quantize_dynamic(str(source), str(target), weight_type=QuantType.QUInt8)
+    return str(target)
+
+
+class ONNXDetector:
+    """ONNX Runtime-based person detector (CPU)"""
+
+    def __init__(
+        self,
+        model_path: str = "yolov8n.onnx",
+        quantize: bool = False,
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.7,
+        max_detections: int = 300,
+        num_threads: int = 0,
+        profile: InferenceProfile = DEFAULT_PROFILE,
+    ):
+        """Initialize ONNX detector"""
+        self.profile = profile
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        try:
+            import onnxruntime as ort
+
+            if quantize:
+                model_path = quantize_model(model_path)
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if num_threads > 0:
+                options.intra_op_num_threads = num_threads
+
+            self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+            self.model_path = model_path
+
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            self.dynamic_size = not isinstance(model_input.shape[2], int)
+            self.input_size = 640 if self.dynamic_size else int(model_input.shape[2])
+            self.dynamic_batch = not isinstance(model_input.shape[0], int)
+            logger.info(
+                f"ONNX model loaded: {model_path} "
+                f"(input={'dynamic' if self.dynamic_size else self.input_size}, dynamic_batch={self.dynamic_batch})"
+            )
+        except ImportError:
+            logger.error("onnxruntime not installed. Falling back to HOG detector.")
+            self.session = None
+            self.hog_detector = PersonDetector(profile=profile)
+        except Exception as e:
+            logger.error(f"Error loading ONNX model: {e}. Falling back to HOG detector.")
+            self.session = None
+            self.hog_detector = PersonDetector(profile=profile)
+
+    def _input_size(self, profile: InferenceProfile) -> int:
+        """モデルの入力サイズ（空間方向が可変のモデルのみプロファイルの解像度を使う）"""
+        if self.dynamic_size and profile.input_size:
+            return max(32, int(round(profile.input_size / 32)) * 32)
+        return self.input_size
+
+    def _preprocess(self, image: np.ndarray, size: int) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+        if len(image.shape) == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        padded, scale, pad = letterbox(image, size)
+        # BGR HWC uint8 -> RGB CHW float32 [0, 1]
+        blob = padded[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+        return blob, scale, pad
+
+    def _postprocess(
+        self, output: np.ndarray, scale: float, pad: Tuple[float, float], shape, conf_threshold: float
+    ) -> DetectionResult:
+        # YOLOv8 output: (4 + num_classes, num_anchors) -> (num_anchors, 4 + num_classes)
+        predictions = output.T
+        scores = predictions[:, 4 + PERSON_CLASS_ID]
+        mask = scores > conf_threshold
+        if not mask.any():
+            return DetectionResult()
+
+        candidates, scores = predictions[mask, :4], scores[mask]
+        cx, cy, w, h = candidates.T
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+        keep = nms(boxes, scores, self.iou_threshold)[: self.max_detections]
+        boxes, scores = boxes[keep], scores[keep]
+
+        # レターボックス座標 -> 元画像座標
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / scale).clip(0, shape[1])
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / scale).clip(0, shape[0])
+        return DetectionResult.from_arrays(boxes, scores)
+
+    def detect(self, image: np.ndarray, profile: Optional[InferenceProfile] = None) -> Tuple[int, float]:
+        """
+        Detect people using ONNX Runtime
+
+        Args:
+            image: Input image as numpy array (BGR format)
+            profile: Inference profile (defaults to the detector's profile)
+
+        Returns:
+            Tuple of (count, average_confidence)
+        """
+        result = self.detect_result(image, profile)
+        return result.count, result.confidence
+
+    def detect_result(self, image: np.ndarray, profile: Optional[InferenceProfile] = None) -> DetectionResult:
+        """Detect people and return a DetectionResult"""
+        return self.detect_batch([image], profile)[0]
+
+    def detect_batch(
+        self, images: List[np.ndarray], profile: Optional[InferenceProfile] = None
+    ) -> List[DetectionResult]:
+        """
+        Detect people in several images
+
+        Models exported with a dynamic batch axis run the whole list in one call;
+        fixed-batch models run one image per call. ``profile.input_size`` only
+        applies to models exported with dynamic height/width; ``profile.roi``
+        crops every image before letterboxing.
+        """
+        if not images:
+            return []
+
+        profile = profile or self.profile
+        if self.session is None:
+            return self.hog_detector.detect_batch(images, profile)
+
+        conf_threshold = self.conf_threshold if profile.conf_threshold is None else profile.conf_threshold
+        size = self._input_size(profile)
+        try:
+            crops = [crop_to_roi(image, profile.roi) for image in images]
+            prepared = [self._preprocess(crop, size) for crop, _, _ in crops]
+            if self.dynamic_batch:
+                batch = np.stack([blob for blob, _, _ in prepared])
+                outputs = self.session.run(None, {self.input_name: batch})[0]
+            else:
+                outputs = [self.session.run(None, {self.input_name: blob[None]})[0][0] for blob, _, _ in prepared]
+
+            return [
+                restore_from_roi(self._postprocess(output, scale, pad, crop.shape, conf_threshold), polygon, offset)
+                for output, (_, scale, pad), (crop, polygon, offset) in zip(outputs, prepared, crops)
+            ]
+        except Exception as e:
+            logger.error(f"Error in ONNX detection: {e}")
+            if hasattr(self, 'hog_detector'):
+                return self.hog_detector.detect_batch(images, profile)
+            return [DetectionResult() for _ in images]
+
+    def detect_with_annotations(self, image: np.ndarray) -> Tuple[np.ndarray, int, float]:
+        """
+        Detect people and return annotated image with bounding boxes
+
+        Returns:
+            Tuple of (annotated_image, count, average_confidence)
+        """
+        result = self.detect_result(image)
+        return result.annotate(image), result.count, result.confidence
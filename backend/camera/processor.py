@@ -2,25 +2,59 @@
 Camera processing and occupancy updates
 """
 import asyncio
+import heapq
+import json
 import logging
-from typing import Optional
-from datetime import datetime
+import random
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
 from database.session import SessionLocal
-from database.models.occupancy import Occupancy, OccupancyHistory
-from database.models.classroom import Classroom
+from database.models.occupancy import Occupancy
 from .detector import PersonDetector
+from .cadence import CadencePolicy
+from .stream_pool import StreamReaderPool
+from services.occupancy_writer import Reading, occupancy_writer
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Refresh last_updated for connected cameras sampled less often than this (seconds),
+# so sparse cadence does not make them look offline (the UI treats 30 s as offline)
+HEARTBEAT_INTERVAL = 20.0
+
 
 class CameraProcessor:
     """Process camera feeds and update occupancy data"""
     
-    def __init__(self):
-        """Initialize camera processor"""
+    def __init__(self, max_concurrency: Optional[int] = None, jitter: float = 0.1, flush_interval: float = 1.0):
+        """
+        Initialize camera processor
+        
+        Args:
+            max_concurrency: Max cameras detected at the same time (defaults to settings)
+            jitter: Random fraction of the interval added to each camera's next due time
+            flush_interval: Seconds between batched commits of finished readings
+        """
         self.detector = PersonDetector()
+        # Fewer samples around mid-period / overnight (None = fixed interval)
+        self.cadence = CadencePolicy(
+            dense_interval=settings.camera_update_interval,
+            normal_interval=settings.camera_cadence_normal_interval,
+            sparse_interval=settings.camera_cadence_sparse_interval,
+            timezone=settings.camera_cadence_timezone,
+        ) if settings.camera_adaptive_cadence else None
+        # Long-lived readers so each detection gets a fresh frame without reconnecting
+        # (kept alive across the longest cadence interval)
+        self.streams = StreamReaderPool(idle_timeout=max(300.0, 2 * settings.camera_cadence_sparse_interval))
         self.running = False
+        self.jitter = jitter
+        self.flush_interval = flush_interval
+        self._semaphore = asyncio.Semaphore(max_concurrency or settings.camera_max_concurrency)
+        self._pending: List[Tuple[str, int, float, datetime]] = []
+        self._lag = deque(maxlen=1000)
+        self._recent_counts: Dict[str, deque] = {}
+        self._last_sample: Dict[str, float] = {}
         
     async def update_classroom_occupancy(
         self,
@@ -38,45 +72,21 @@ class CameraProcessor:
             count: Manual count override (optional)
             confidence: Manual confidence override (optional)
         """
+        # If camera URL provided, detect from image
+        if camera_url:
+            count, confidence = await self._detect_from_url(camera_url)
+        
         db = SessionLocal()
         try:
-            # Get or create occupancy record
-            occupancy = db.query(Occupancy).filter(Occupancy.classroom_id == classroom_id).first()
-            
-            if occupancy is None:
-                occupancy = Occupancy(
-                    id=f"occ_{classroom_id}",
-                    classroom_id=classroom_id,
-                    current_count=0,
-                    detection_confidence=0.0,
-                )
-                db.add(occupancy)
-            
-            # If camera URL provided, detect from image
-            if camera_url:
-                detection_count, detection_confidence = await self._detect_from_url(camera_url)
-                count = detection_count
-                confidence = detection_confidence
-            
-            # Update occupancy if values provided
-            if count is not None:
-                occupancy.current_count = count
-            if confidence is not None:
-                occupancy.detection_confidence = confidence
-            
-            occupancy.last_updated = datetime.utcnow()
-            
-            # Create history entry
-            history = OccupancyHistory(
-                id=f"hist_{classroom_id}_{datetime.utcnow().timestamp()}",
-                classroom_id=classroom_id,
-                timestamp=datetime.utcnow(),
-                count=occupancy.current_count,
-                detection_confidence=occupancy.detection_confidence,
-                camera_id=None,
-            )
-            db.add(history)
+            if count is None or confidence is None:
+                # Keep the stored value for whatever was not provided
+                current = db.query(Occupancy).filter(Occupancy.classroom_id == classroom_id).first()
+                if count is None:
+                    count = current.current_count if current else 0
+                if confidence is None:
+                    confidence = current.detection_confidence if current else 0.0
             
+            occupancy_writer.write(db, Reading(classroom_id, count, confidence))
             db.commit()
             logger.info(f"Updated occupancy for classroom {classroom_id}: count={count}, confidence={confidence}")
             
@@ -97,14 +107,10 @@ class CameraProcessor:
             Tuple of (count, confidence)
         """
         try:
-            import cv2
-            cap = cv2.VideoCapture(url)
-            ret, frame = cap.read()
-            cap.release()
+            frame = await asyncio.to_thread(self.streams.read, url)
             
-            if ret:
-                count, confidence = self.detector.detect(frame)
-                return count, confidence
+            if frame is not None:
+                return await asyncio.to_thread(self.detector.detect, frame)
             else:
                 logger.warning(f"Could not read frame from {url}")
                 return 0, 0.0
@@ -112,35 +118,157 @@ class CameraProcessor:
             logger.error(f"Error detecting from URL {url}: {e}")
             return 0, 0.0
     
-    async def process_all_classrooms(self):
-        """Process all classrooms with cameras"""
+    def load_camera_urls(self) -> Dict[str, str]:
+        """Camera stream URL per classroom (JSON file at settings.camera_streams_path)"""
+        if not settings.camera_streams_path:
+            return {}
+        try:
+            with open(settings.camera_streams_path, encoding="utf-8") as f:
+                return {str(k): str(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load camera streams from {settings.camera_streams_path}: {e}")
+            return {}
+    
+    async def _sample(self, classroom_id: str, url: str):
+        """Detect one camera and queue the reading for the next batched commit"""
+        async with self._semaphore:
+            count, confidence = await self._detect_from_url(url)
+        self._pending.append((classroom_id, count, confidence, datetime.utcnow()))
+        self._recent_counts.setdefault(classroom_id, deque(maxlen=6)).append(count)
+        self._last_sample[classroom_id] = asyncio.get_running_loop().time()
+        if self.cadence is not None:
+            self.cadence.record_sample(classroom_id)
+    
+    def _next_interval(self, classroom_id: str, interval: float) -> float:
+        """Seconds until the camera's next sample (cadence policy or fixed interval)"""
+        if self.cadence is None:
+            return interval
+        return self.cadence.plan(classroom_id, datetime.now(timezone.utc), list(self._recent_counts.get(classroom_id, ())))
+    
+    def _touch(self, classroom_ids: List[str]):
+        """Mark cameras as alive without writing a reading"""
         db = SessionLocal()
         try:
-            classrooms = db.query(Classroom).all()
-            
-            for classroom in classrooms:
-                # Here you would get the actual camera URL for this classroom
-                # For now, we'll skip or use a placeholder
-                await asyncio.sleep(0.1)  # Rate limiting
-                
+            db.query(Occupancy).filter(Occupancy.classroom_id.in_(classroom_ids)).update(
+                {Occupancy.last_updated: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
         except Exception as e:
-            logger.error(f"Error processing all classrooms: {e}")
+            db.rollback()
+            logger.error(f"Error refreshing camera heartbeats: {e}")
         finally:
             db.close()
     
+    async def _heartbeat(self, cameras: Dict[str, str]):
+        """Refresh last_updated for connected cameras that are sampled sparsely"""
+        now = asyncio.get_running_loop().time()
+        streams = self.streams.stats()
+        idle = [
+            cid for cid, url in cameras.items()
+            if cid in self._last_sample
+            and now - self._last_sample[cid] >= HEARTBEAT_INTERVAL
+            and streams.get(url, {}).get("connected")
+        ]
+        if idle:
+            await asyncio.to_thread(self._touch, idle)
+    
+    def _commit_readings(self, readings: List[Tuple[str, int, float, datetime]]):
+        """Write a batch of readings (occupancy + history) in one transaction"""
+        db = SessionLocal()
+        try:
+            occupancy_writer.write_many(db, [
+                Reading(classroom_id, count, confidence, captured_at=timestamp)
+                for classroom_id, count, confidence, timestamp in readings
+            ])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error committing {len(readings)} occupancy readings: {e}")
+        finally:
+            db.close()
+    
+    async def _flush(self):
+        """Commit the readings collected since the last flush"""
+        if not self._pending:
+            return
+        readings, self._pending = self._pending, []
+        await asyncio.to_thread(self._commit_readings, readings)
+    
+    async def process_all_classrooms(self):
+        """Detect every classroom with a camera once, then commit in one batch"""
+        cameras = self.load_camera_urls()
+        await asyncio.gather(*(self._sample(cid, url) for cid, url in cameras.items()))
+        await self._flush()
+    
     async def run_continuous_updates(self, interval: int):
-        """Run continuous updates at specified interval"""
+        """
+        Poll every camera about once per interval
+        
+        With CAMERA_ADAPTIVE_CADENCE the interval comes from the cadence policy
+        instead (dense around period boundaries, sparse overnight).
+        
+        Each camera has its own next-due time in a heap. Start times are spread
+        over the first interval and every reschedule adds jitter so cameras do
+        not line up. At most ``max_concurrency`` detections run at once, and
+        finished readings are committed together every ``flush_interval``.
+        """
         self.running = True
+        loop = asyncio.get_running_loop()
+        cameras = self.load_camera_urls()
+        if not cameras:
+            logger.warning("No camera streams configured (CAMERA_STREAMS_PATH)")
         
-        while self.running:
-            try:
-                await self.process_all_classrooms()
-            except Exception as e:
-                logger.error(f"Error in continuous updates: {e}")
-            
-            await asyncio.sleep(interval)
+        start = loop.time()
+        heap = [(start + random.uniform(0, interval), cid, url) for cid, url in cameras.items()]
+        heapq.heapify(heap)
+        tasks = set()
+        last_flush = last_heartbeat = start
+        
+        try:
+            while self.running:
+                now = loop.time()
+                while heap and heap[0][0] <= now:
+                    due, classroom_id, url = heapq.heappop(heap)
+                    self._lag.append(now - due)
+                    task = asyncio.create_task(self._sample(classroom_id, url))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    next_due = due + self._next_interval(classroom_id, interval) * (1 + random.uniform(-self.jitter, self.jitter))
+                    # A camera that fell behind skips the missed slots instead of bursting
+                    heapq.heappush(heap, (max(next_due, now), classroom_id, url))
+                
+                if now - last_flush >= self.flush_interval:
+                    last_flush = now
+                    await self._flush()
+                
+                if self.cadence is not None and now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    last_heartbeat = now
+                    await self._heartbeat(cameras)
+                
+                wake = heap[0][0] if heap else now + interval
+                await asyncio.sleep(max(0.0, min(wake, last_flush + self.flush_interval) - loop.time()))
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await self._flush()
+    
+    def scheduler_stats(self) -> dict:
+        """How late samples start relative to their due time, and work in progress"""
+        lag = list(self._lag)
+        return {
+            "samples": len(lag),
+            "lag_avg_ms": round(sum(lag) / len(lag) * 1000, 1) if lag else 0.0,
+            "lag_max_ms": round(max(lag) * 1000, 1) if lag else 0.0,
+            "pending_commits": len(self._pending),
+            "cadence": self.cadence.stats() if self.cadence is not None else None,
+        }
+    
+    def stream_stats(self) -> dict:
+        """Per-stream fps, last frame age and reconnect count"""
+        return self.streams.stats()
     
     def stop(self):
-        """Stop continuous updates"""
+        """Stop continuous updates and release camera streams"""
         self.running = False
+        self.streams.close()
 
@@ -0,0 +1,253 @@
+"""
+Per-camera inference profiles and resolution auto-calibration
+
+カメラ（教室）ごとに推論解像度・HOGのピラミッド倍率とストライド・信頼度の下限を
+設定します。roi（関心領域）を指定すると、その多角形の外接矩形だけを推論し、
+中心が多角形の外にある検出（廊下・窓・スクリーンなど）を捨てます。
+自動キャリブレーションでは、キャリブレーション画像でフル解像度と
+同じ人数になる最小の解像度を選びます。
+
+プロファイルファイル（JSON）の例:
+    {
+        "default": {"input_size": 640},
+        "bus1-105": {"input_size": 480, "scale": 1.1, "win_stride": 8, "conf_threshold": 0.3,
+                     "roi": [[0.05, 0.35], [0.95, 0.35], [1.0, 1.0], [0.0, 1.0]]}
+    }
+
+roi の座標は画像の幅・高さに対する比率（0.0〜1.0）で、解像度が変わっても同じ領域を指します。
+
+キャリブレーション:
+    python -m camera.profiles --classroom-id bus1-105 --images sample_images/bus1-105 --backend hog
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, fields, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# キャリブレーションで試す推論解像度（長辺のピクセル数、小さい順）
+DEFAULT_CANDIDATE_SIZES = (320, 416, 480, 640, 800, 960)
+
+
+@dataclass(frozen=True)
+class InferenceProfile:
+    """1台のカメラの推論設定
+
+    input_size: 推論時の長辺のピクセル数（None = フル解像度／モデルの既定値）
+    scale: HOGの画像ピラミッド倍率
+    win_stride: HOGのウィンドウストライド（ピクセル）
+    conf_threshold: これ未満の信頼度の検出を捨てる（None = 検出器の既定値）
+    roi: 関心領域の多角形の頂点 ((x, y), ...)、画像サイズに対する比率（None = 画像全体）
+    """
+    input_size: Optional[int] = None
+    scale: float = 1.05
+    win_stride: int = 4
+    conf_threshold: Optional[float] = None
+    roi: Optional[Tuple[Tuple[float, float], ...]] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "InferenceProfile":
+        known = {f.name for f in fields(cls)}
+        values = {k: v for k, v in data.items() if k in known}
+        if values.get("roi") is not None:
+            # JSONのリストは辞書のキーにできないためタプルに変換する
+            roi = tuple((float(x), float(y)) for x, y in values["roi"])
+            if len(roi) < 3:
+                raise ValueError(f"ROI needs at least 3 points: {values['roi']}")
+            values["roi"] = roi
+        return cls(**values)
+
+    def to_dict(self) -> dict:
+        data = {k: v for k, v in asdict(self).items() if v is not None}
+        if "roi" in data:
+            data["roi"] = [list(point) for point in data["roi"]]
+        return data
+
+
+DEFAULT_PROFILE = InferenceProfile()
+
+
+class ProfileStore:
+    """JSONファイルに保存されたカメラごとのプロファイル
+
+    ファイルの更新時刻を確認し、変更されていれば自動で再読み込みします
+    （キャリブレーション結果を再起動なしで反映するため）。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else None
+        self._profiles: Dict[str, InferenceProfile] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self):
+        if self.path is None:
+            return
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            self._profiles, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self._profiles = {key: InferenceProfile.from_dict(value) for key, value in data.items()}
+            self._mtime = mtime
+            logger.info(f"Inference profiles loaded: {self.path} ({len(self._profiles)} entries)")
+        except (ValueError, TypeError) as e:
+            logger.error(f"Invalid inference profile file {self.path}: {e}")
+
+    def get(self, classroom_id: Optional[str] = None) -> InferenceProfile:
+        """教室のプロファイルを取得（無ければ "default"、それも無ければ既定値）"""
+        with self._lock:
+            self._reload_if_changed()
+            if classroom_id and classroom_id in self._profiles:
+                return self._profiles[classroom_id]
+            return self._profiles.get("default", DEFAULT_PROFILE)
+
+    def set(self, classroom_id: str, profile: InferenceProfile):
+        """教室のプロファイルを保存する"""
+        if self.path is None:
+            raise ValueError("Profile store has no file path")
+        with self._lock:
+            self._reload_if_changed()
+            self._profiles[classroom_id] = profile
+            data = {key: value.to_dict() for key, value in self._profiles.items()}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+            self._mtime = self.path.stat().st_mtime
+
+
+def group_by_profile(store: ProfileStore, items: Sequence) -> List:
+    """
+    (index, classroom_id) の列をプロファイルごとにまとめる
+
+    Returns:
+        List of (profile, [index, ...])
+    """
+    groups: Dict[InferenceProfile, List[int]] = {}
+    for index, classroom_id in items:
+        groups.setdefault(store.get(classroom_id), []).append(index)
+    return list(groups.items())
+
+
+def calibrate_profile(
+    detector,
+    images: List,
+    base_profile: InferenceProfile = DEFAULT_PROFILE,
+    candidate_sizes: Sequence[int] = DEFAULT_CANDIDATE_SIZES,
+    count_tolerance: int = 0,
+    max_latency: Optional[float] = None,
+) -> dict:
+    """
+    フル解像度と同じ人数になる最小の推論解像度を選ぶ
+
+    Args:
+        detector: detect_result(image, profile) を持つ検出器
+        images: キャリブレーション画像（BGR）
+        base_profile: 解像度以外の設定
+        candidate_sizes: 試す解像度（長辺のピクセル数）
+        count_tolerance: フル解像度との人数の許容差（画像ごと）
+        max_latency: 1枚あたりの許容推論時間（秒）。撮影間隔に収めたい場合に指定
+
+    Returns:
+        dict: profile（選ばれたプロファイル）と各解像度の計測結果
+    """
+    if not images:
+        raise ValueError("Calibration needs at least one image")
+
+    def _measure(profile: InferenceProfile):
+        counts = []
+        start = time.perf_counter()
+        for image in images:
+            counts.append(detector.detect_result(image, profile).count)
+        return counts, (time.perf_counter() - start) / len(images)
+
+    full_size = max(max(image.shape[:2]) for image in images)
+    full_profile = replace(base_profile, input_size=full_size)
+    reference, full_latency = _measure(full_profile)
+    trials = [{"input_size": full_size, "counts": reference, "latency_ms": round(full_latency * 1000, 1), "match": True}]
+
+    chosen = full_profile
+    for size in sorted(s for s in candidate_sizes if s < full_size):
+        profile = replace(base_profile, input_size=size)
+        counts, latency = _measure(profile)
+        match = all(abs(c - r) <= count_tolerance for c, r in zip(counts, reference))
+        trials.append({"input_size": size, "counts": counts, "latency_ms": round(latency * 1000, 1), "match": match})
+        if match and (max_latency is None or latency <= max_latency):
+            chosen = profile
+            break
+
+    chosen_trial = next(t for t in trials if t["input_size"] == chosen.input_size)
+    if max_latency is not None and chosen_trial["latency_ms"] > max_latency * 1000:
+        logger.warning(
+            f"No calibrated resolution fits the latency budget ({max_latency * 1000:.0f}ms); "
+            f"using {chosen.input_size}px ({chosen_trial['latency_ms']}ms)"
+        )
+
+    return {"profile": chosen, "reference_counts": reference, "trials": trials}
+
+
+def main():
+    """メイン関数（キャリブレーションを実行してプロファイルファイルに保存）"""
+    import cv2
+    from config import settings
+    from .detector import create_detector
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="カメラごとの推論解像度キャリブレーション")
+    parser.add_argument('--classroom-id', type=str, required=True, help='教室ID（プロファイルのキー）')
+    parser.add_argument('--images', type=str, required=True, help='キャリブレーション画像のディレクトリ')
+    parser.add_argument('--backend', type=str, default=settings.detection_backend, choices=['yolo', 'onnx', 'hog'], help='検出バックエンド')
+    parser.add_argument('--model', type=str, default=settings.detection_model_path, help='モデルファイルのパス')
+    parser.add_argument('--profiles', type=str, default=settings.inference_profiles_path or 'camera_profiles.json', help='プロファイルファイル')
+    parser.add_argument('--tolerance', type=int, default=0, help='フル解像度との人数の許容差（デフォルト: 0）')
+    parser.add_argument('--interval', type=float, default=None, help='撮影間隔（秒）。1枚の推論がこれに収まる解像度を選ぶ')
+    args = parser.parse_args()
+
+    image_paths = sorted(
+        p for p in Path(args.images).iterdir()
+        if p.suffix.lower() in {'.jpg', '.jpeg', '.png', '.bmp'}
+    )
+    images = [img for img in (cv2.imread(str(p)) for p in image_paths) if img is not None]
+    if not images:
+        logger.error(f"キャリブレーション画像が見つかりません: {args.images}")
+        return 1
+
+    store = ProfileStore(args.profiles)
+    detector = create_detector(args.backend, args.model, settings.detection_onnx_quantize)
+    report = calibrate_profile(
+        detector,
+        images,
+        base_profile=store.get(args.classroom_id),
+        count_tolerance=args.tolerance,
+        max_latency=args.interval,
+    )
+
+    for trial in report["trials"]:
+        logger.info(
+            f"{trial['input_size']:>5}px: {trial['latency_ms']:>8.1f}ms/枚, "
+            f"人数={trial['counts']} {'✓' if trial['match'] else '✗'}"
+        )
+
+    profile = report["profile"]
+    store.set(args.classroom_id, profile)
+    logger.info(f"プロファイルを保存しました: {args.profiles} [{args.classroom_id}] = {profile.to_dict()}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,268 @@
+"""
+Offline spool for edge readings
+
+APIサーバーに接続できない間に検出した人数（撮影時刻付き）をローカルのSQLiteに
+保存し、接続が戻ったらバックグラウンドで撮影順に再送します。再送の間隔は
+ジッター付きの指数バックオフで、複数のカメラが一斉に再送を始めないようにします。
+サーバーは captured_at を使って履歴に正しい時刻で記録し、より新しい状態を
+古い読み取りで上書きしません。
+
+再送には :func:`replay_reading` / :func:`replay_readings` を使います（capture_camera.py と
+edge_agent.py で共通）。``requests.Session`` を渡すと再送のたびに接続し直さず、
+keep-alive の接続を再利用します。
+"""
+import json
+import logging
+import random
+import sqlite3
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def is_retryable(status_code: Optional[int]) -> bool:
+    """
+    送信失敗を後で再送すべきか
+
+    接続できない場合（None）・サーバーエラー・429は再送し、それ以外の4xx
+    （教室が存在しない・値が不正など）は再送しても成功しないため捨てます。
+    """
+    return status_code is None or status_code >= 500 or status_code == 429
+
+
+class Backoff:
+    """ジッター付き指数バックオフ"""
+
+    def __init__(self, min_delay: float = 1.0, max_delay: float = 300.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.failures = 0
+
+    def next_delay(self) -> float:
+        """失敗を記録し、次の再試行までの待ち時間（秒）を返す"""
+        delay = min(self.max_delay, self.min_delay * (2 ** self.failures))
+        self.failures += 1
+        # 0.5〜1.0倍のランダムな待ち時間（全カメラが同時に再送しないように）
+        return delay * random.uniform(0.5, 1.0)
+
+    def reset(self):
+        self.failures = 0
+
+
+class ReadingSpool:
+    """送信できなかった読み取りを保存するSQLiteのキュー
+
+    ``max_readings`` を超えた場合は古い読み取りから捨てます。
+    複数のスレッド（撮影ループと再送スレッド）から使用できます。
+    """
+
+    def __init__(self, path: str, max_readings: int = 100000):
+        self.path = path
+        self.max_readings = max_readings
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " captured_at TEXT NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS readings_captured_at ON readings (captured_at)")
+
+    def append(self, reading: dict):
+        """読み取り（/occupancy/update のペイロード）を保存する"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO readings (captured_at, payload) VALUES (?, ?)",
+                (reading.get("captured_at") or "", json.dumps(reading)),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+            if count > self.max_readings:
+                self._conn.execute(
+                    "DELETE FROM readings WHERE id IN (SELECT id FROM readings ORDER BY captured_at, id LIMIT ?)",
+                    (count - self.max_readings,),
+                )
+                logger.warning(f"スプールが上限（{self.max_readings}件）に達したため、古い読み取りを捨てました")
+
+    def peek(self, limit: int = 100) -> List[Tuple[int, dict]]:
+        """撮影時刻の古い順に読み取りを取得する（削除はしない）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM readings ORDER BY captured_at, id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def remove(self, ids: List[int]):
+        """送信済みの読み取りを削除する"""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM readings WHERE id = ?", [(i,) for i in ids])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def drain_once(
+    spool: ReadingSpool,
+    send: Callable[[dict], bool],
+    batch_size: int = 100,
+    send_batch: Optional[Callable[[List[dict]], Optional[bool]]] = None,
+) -> Tuple[int, bool]:
+    """
+    スプールの読み取りを撮影順に送信する
+
+    Args:
+        send: 読み取りを送信する関数。スプールから削除してよい場合（送信成功、または
+            再送しても成功しない場合）はTrue、後で再送する場合はFalseを返す
+        send_batch: 読み取りをまとめて送信する関数（/occupancy/bulk-update）。
+            True = 全件削除してよい、False = 後で再送、None = 一括送信できない
+            （1件ずつ send で送る）
+
+    Returns:
+        Tuple of (送信した件数, 途中で失敗したか)
+    """
+    sent = 0
+    while True:
+        batch = spool.peek(batch_size)
+        if not batch:
+            return sent, False
+        if send_batch is not None:
+            result = send_batch([reading for _, reading in batch])
+            if result is False:
+                return sent, True
+            if result:
+                spool.remove([row_id for row_id, _ in batch])
+                sent += len(batch)
+                continue
+        done = []
+        for row_id, reading in batch:
+            if not send(reading):
+                spool.remove(done)
+                return sent + len(done), True
+            done.append(row_id)
+        spool.remove(done)
+        sent += len(done)
+
+
+class SpoolDrainer:
+    """スプールをバックグラウンドで再送するスレッド"""
+
+    def __init__(
+        self,
+        spool: ReadingSpool,
+        send: Callable[[dict], bool],
+        batch_size: int = 100,
+        idle_interval: float = 5.0,
+        min_delay: float = 1.0,
+        max_delay: float = 300.0,
+        send_batch: Optional[Callable[[List[dict]], Optional[bool]]] = None,
+    ):
+        self.spool = spool
+        self.send = send
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.backoff = Backoff(min_delay, max_delay)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent, failed = drain_once(self.spool, self.send, self.batch_size, self.send_batch)
+            except Exception as e:
+                logger.error(f"スプールの再送中にエラーが発生しました: {e}")
+                sent, failed = 0, True
+
+            if sent:
+                logger.info(f"スプールから {sent}件 を再送しました（残り {len(self.spool)}件）")
+            if failed:
+                self._stop.wait(self.backoff.next_delay())
+            else:
+                self.backoff.reset()
+                self._stop.wait(self.idle_interval)
+
+
+def replay_reading(
+    reading: dict,
+    api_url: str = "http://localhost:8000",
+    session: Optional[requests.Session] = None,
+) -> bool:
+    """
+    スプールの読み取りを /api/v1/occupancy/update に再送（SpoolDrainer から呼ばれる）
+
+    Args:
+        session: 接続を再利用する requests.Session（None の場合は1回ごとに接続する）
+
+    Returns:
+        スプールから削除してよい場合True（送信成功、または再送しても成功しない場合）
+    """
+    try:
+        response = (session or requests).post(f"{api_url}/api/v1/occupancy/update", json=reading, timeout=10)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"✗ APIサーバーに接続できません: {api_url} ({type(e).__name__})")
+        return False
+
+    if response.status_code == 200:
+        return True
+    if is_retryable(response.status_code):
+        logger.error(f"✗ 再送失敗 - ステータスコード: {response.status_code}")
+        return False
+    logger.warning(f"読み取りを破棄しました（ステータスコード: {response.status_code}）: {reading}")
+    return True
+
+
+def replay_readings(
+    readings: List[dict],
+    api_url: str = "http://localhost:8000",
+    session: Optional[requests.Session] = None,
+) -> Optional[bool]:
+    """
+    スプールの読み取りを /api/v1/occupancy/bulk-update でまとめて再送（SpoolDrainer から呼ばれる）
+
+    サーバーは読み取りごとに結果を返し（存在しない教室は not_found）、1件ずつ再送しても
+    結果は変わらないため、200なら全件をスプールから削除します。
+
+    Args:
+        session: 接続を再利用する requests.Session（None の場合は1回ごとに接続する）
+
+    Returns:
+        True: 全件削除してよい、False: 後で再送、None: 一括送信できない（1件ずつ再送する）
+    """
+    try:
+        response = (session or requests).post(
+            f"{api_url}/api/v1/occupancy/bulk-update", json={"readings": readings}, timeout=30
+        )
+    except requests.exceptions.RequestException as e:
+        logger.error(f"✗ APIサーバーに接続できません: {api_url} ({type(e).__name__})")
+        return False
+
+    if response.status_code == 200:
+        result = response.json()
+        if result["rejected"]:
+            logger.warning(f"再送した読み取りのうち {result['rejected']}件 が破棄されました")
+        return True
+    if is_retryable(response.status_code):
+        return False
+    # 一括更新に対応していないサーバー（404/405）など
+    logger.warning(f"一括再送できません（ステータスコード: {response.status_code}）。1件ずつ再送します")
+    return None
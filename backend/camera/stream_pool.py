@@ -0,0 +1,161 @@
+"""
+Persistent stream readers for network cameras
+
+RTSP / MJPEG カメラは接続に数秒かかり、接続直後はバッファに溜まった古い
+フレームを返すことがあります。カメラURLごとに読み取りスレッドを常駐させ、
+grab() でバッファを進め続けて、要求されたときだけ最新のフレームをデコードします。
+切断された場合はジッター付きの指数バックオフで再接続します。
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from .spool import Backoff
+
+logger = logging.getLogger(__name__)
+
+
+class StreamReader:
+    """1つのカメラURLを読み続けるスレッド"""
+
+    def __init__(self, url: str, min_delay: float = 1.0, max_delay: float = 60.0):
+        self.url = url
+        self.backoff = Backoff(min_delay, max_delay)
+        self.reconnects = 0
+        self.last_used = time.monotonic()
+        self._cond = threading.Condition()
+        self._frame: Optional[np.ndarray] = None
+        self._frame_at: Optional[float] = None
+        self._decode_requested = False
+        self._connected = False
+        self._grab_times = deque(maxlen=60)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"stream-{url}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            cap = cv2.VideoCapture(self.url)
+            if not cap.isOpened():
+                cap.release()
+                delay = self.backoff.next_delay()
+                logger.warning(f"Could not open stream {self.url}; retrying in {delay:.1f}s")
+                self._stop.wait(delay)
+                continue
+
+            self._connected = True
+            self.backoff.reset()
+            logger.info(f"Stream connected: {self.url}")
+            try:
+                while not self._stop.is_set():
+                    # grab() はカメラのフレームレートでブロックするため、ループは空回りしない
+                    if not cap.grab():
+                        break
+                    self._grab_times.append(time.monotonic())
+                    if self._decode_requested:
+                        ret, frame = cap.retrieve()
+                        with self._cond:
+                            if ret:
+                                self._frame, self._frame_at = frame, time.monotonic()
+                            self._decode_requested = False
+                            self._cond.notify_all()
+            finally:
+                cap.release()
+                self._connected = False
+
+            if not self._stop.is_set():
+                self.reconnects += 1
+                delay = self.backoff.next_delay()
+                logger.warning(f"Stream lost: {self.url}; reconnecting in {delay:.1f}s")
+                self._stop.wait(delay)
+
+    def read(self, timeout: float = 5.0) -> Optional[np.ndarray]:
+        """
+        要求した時点より後に撮影されたフレームを返す
+
+        Returns:
+            np.ndarray: BGR画像（timeout 秒以内に取得できない場合はNone）
+        """
+        self.last_used = time.monotonic()
+        requested_at = time.monotonic()
+        deadline = requested_at + timeout
+        with self._cond:
+            self._decode_requested = True
+            while self._frame_at is None or self._frame_at < requested_at:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop.is_set():
+                    return None
+                self._cond.wait(remaining)
+            return self._frame
+
+    def stats(self) -> dict:
+        """接続状態・フレームレート・最後のフレームの経過時間"""
+        times = list(self._grab_times)
+        now = time.monotonic()
+        fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        return {
+            "connected": self._connected,
+            "fps": round(fps, 1),
+            "last_frame_age": round(now - times[-1], 2) if times else None,
+            "reconnects": self.reconnects,
+        }
+
+
+class StreamReaderPool:
+    """カメラURLごとの StreamReader を管理する
+
+    ``idle_timeout`` 秒以上使われていない読み取りスレッドは停止します。
+    """
+
+    def __init__(self, idle_timeout: float = 300.0):
+        self.idle_timeout = idle_timeout
+        self._readers: Dict[str, StreamReader] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> StreamReader:
+        """URLの読み取りスレッドを取得（無ければ開始する）"""
+        with self._lock:
+            self._evict_idle()
+            reader = self._readers.get(url)
+            if reader is None:
+                reader = StreamReader(url)
+                reader.start()
+                self._readers[url] = reader
+            return reader
+
+    def read(self, url: str, timeout: float = 5.0) -> Optional[np.ndarray]:
+        """URLの最新フレームを取得する"""
+        return self.get(url).read(timeout)
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for url, reader in list(self._readers.items()):
+            if now - reader.last_used > self.idle_timeout:
+                logger.info(f"Stopping idle stream reader: {url}")
+                reader.stop()
+                del self._readers[url]
+
+    def stats(self) -> Dict[str, dict]:
+        """URLごとの統計"""
+        with self._lock:
+            return {url: reader.stats() for url, reader in self._readers.items()}
+
+    def close(self):
+        """すべての読み取りスレッドを停止する"""
+        with self._lock:
+            for reader in self._readers.values():
+                reader.stop()
+            self._readers.clear()
@@ -13,18 +13,33 @@ PCカメラを使用する場合は、このスクリプトを使用してくだ
     --interval: 検出間隔（秒）（デフォルト: 5）
     --api-url: APIのベースURL（デフォルト: http://localhost:8000）
     --show-preview: プレビューウィンドウを表示（デフォルト: False）
+    --edge-detect: カメラ側で人数検出を行い、人数だけを送信する
+    --backend: エッジ検出の検出バックエンド（yolo / onnx / hog、デフォルト: yolo）
+    --model: エッジ検出のモデルファイル（デフォルト: yolov8n.pt）
+    --thumbnail-interval: エッジ検出時に解析結果サムネイルを送る間隔（秒）（デフォルト: 300、0で要求時のみ）
+    --change-threshold: 変化ありとみなす画素の割合（デフォルト: 0.02、0で常に送信）
+    --max-silence: 変化が無くても送信する間隔（秒）（デフォルト: 25）
+    --adaptive: 授業の開始・終了の前後だけ --interval 秒ごとに検出し、それ以外は間隔を空ける
+    --spool: エッジ検出で送信できなかった読み取りを保存するファイル（デフォルト: edge_spool.db、空文字で無効）
 """
 import argparse
 import time
+from collections import deque
+from datetime import datetime, timezone
 import requests
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import Optional
+from functools import partial
+from typing import Optional, Tuple
 import logging
 from io import BytesIO
 import os
+from camera import codec
 from camera.source import CameraSource
+from camera.motion import ChangeDetector
+from camera.cadence import CadencePolicy
+from camera.spool import ReadingSpool, SpoolDrainer, is_retryable, replay_reading, replay_readings
 
 # ログ設定
 logging.basicConfig(
@@ -39,17 +54,37 @@ def capture_and_detect(
     camera_id: int = 0,
     interval: int = 5,
     api_url: str = "http://localhost:8000",
-    show_preview: bool = False
+    show_preview: bool = False,
+    edge_detect: bool = False,
+    backend: str = "yolo",
+    model_path: str = "yolov8n.pt",
+    thumbnail_interval: int = 300,
+    change_threshold: float = 0.02,
+    max_silence: float = 25.0,
+    spool_path: str = "edge_spool.db",
+    adaptive: bool = False
 ):
     """
     PCカメラから画像をキャプチャして人数検出APIを呼び出す
     
+    エッジ検出モードでは、カメラ側で人数を検出して人数と信頼度だけを
+    /occupancy/update に送信します。解析結果サムネイルは thumbnail_interval 秒ごと、
+    またはサーバーから要求されたときだけ送信します。
+    
     Args:
         classroom_id: 教室ID
         camera_id: カメラデバイスID
         interval: 検出間隔（秒）
         api_url: APIのベースURL
         show_preview: プレビューウィンドウを表示するか
+        edge_detect: カメラ側で人数検出を行うか
+        backend: エッジ検出の検出バックエンド（yolo / onnx / hog）
+        model_path: エッジ検出のモデルファイル
+        thumbnail_interval: サムネイルを送る間隔（秒）（0の場合は要求時のみ）
+        change_threshold: 前回送信時から変化した画素の割合がこれ未満なら送信しない（0で常に送信）
+        max_silence: 変化が無くてもこの秒数ごとにハートビートとして送信する
+        spool_path: エッジ検出で送信できなかった読み取りを保存するSQLiteファイル（空文字で無効）
+        adaptive: 授業の開始・終了の前後だけ interval 秒ごとに検出し、それ以外は間隔を空ける
     """
     # 環境変数からカメラタイプとソースを取得（デフォルトはPCカメラ）
     camera_type = os.getenv("CAMERA_TYPE", "pc")
@@ -75,23 +110,66 @@ def capture_and_detect(
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
     
+    # エッジ検出モードでは検出器をカメラ側で読み込む
+    detector = None
+    if edge_detect:
+        from camera.detector import create_detector
+        detector = create_detector(backend, model_path)
+    
+    change_detector = ChangeDetector(threshold=change_threshold, max_silence=max_silence)
+    
+    # 送信できなかった読み取りはスプールに保存し、接続が戻ったら撮影順に再送する
+    # （再送は専用の requests.Session で接続を再利用する）
+    spool = None
+    drainer = None
+    if edge_detect and spool_path:
+        spool = ReadingSpool(spool_path)
+        replay_session = requests.Session()
+        drainer = SpoolDrainer(
+            spool,
+            partial(replay_reading, api_url=api_url, session=replay_session),
+            send_batch=partial(replay_readings, api_url=api_url, session=replay_session),
+        )
+        drainer.start()
+    
+    # 時間割に合わせた検出間隔（画像送信モードではハートビートを兼ねるため max_silence 秒以下）
+    cadence = None
+    if adaptive:
+        cadence = CadencePolicy(
+            dense_interval=interval,
+            normal_interval=30.0 if edge_detect else min(30.0, max_silence),
+            sparse_interval=300.0 if edge_detect else min(300.0, max_silence),
+        )
+    recent_counts = deque(maxlen=6)
+    
     logger.info(f"教室ID: {classroom_id}")
-    logger.info(f"検出間隔: {interval}秒")
+    logger.info(f"検出間隔: {interval}秒{'（時間割に合わせて調整）' if adaptive else ''}")
     logger.info(f"API URL: {api_url}")
     logger.info(f"プレビュー: {'有効' if show_preview else '無効'}")
+    logger.info(f"エッジ検出: {f'有効（{backend}）' if edge_detect else '無効'}")
+    logger.info(f"変化検出: {f'しきい値 {change_threshold:.1%}, ハートビート {max_silence:.0f}秒' if change_threshold > 0 else '無効'}")
     logger.info("=" * 60)
     logger.info("人数検出を開始します。Ctrl+Cで終了します。")
     logger.info("=" * 60)
     
     try:
         frame_count = 0
+        skipped_count = 0
+        current_interval = interval
         last_detect_time = time.time() - interval  # 初回実行を保証
+        last_thumbnail_time = None  # 初回はサムネイルを送信する
+        last_result = None  # エッジ検出の直近の結果（ハートビートで再送する）
         
         while True:
             current_time = time.time()
+            sample_due = current_time - last_detect_time >= current_interval
             
-            # フレームを読み取る
-            ret, frame = cap.read()
+            # 検出時とプレビュー表示時だけフレームをデコードし、それ以外は grab() で
+            # カメラのバッファを進めるだけにする（捨てるフレームはデコードしない）
+            if sample_due or show_preview:
+                ret, frame = cap.read()
+            else:
+                ret, frame = cap.grab(), None
             
             if not ret:
                 logger.error("フレームを読み取れませんでした")
@@ -114,7 +192,7 @@ def capture_and_detect(
                 )
                 cv2.putText(
                     preview_frame,
-                    f"Next detect in: {max(0, interval - (current_time - last_detect_time)):.1f}s",
+                    f"Next detect in: {max(0, current_interval - (current_time - last_detect_time)):.1f}s",
                     (10, 70),
                     cv2.FONT_HERSHEY_SIMPLEX,
                     0.7,
@@ -129,24 +207,87 @@ def capture_and_detect(
                     break
             
             # 指定間隔で検出を実行
-            if current_time - last_detect_time >= interval:
-                # 画像をJPEG形式にエンコード
-                _, img_encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            if sample_due:
+                last_detect_time = current_time
+                if cadence is not None:
+                    cadence.record_sample(classroom_id)
                 
-                # バイトデータに変換
-                img_bytes = img_encoded.tobytes()
+                # 前回送信したフレームから変化が無ければ送信しない
+                # （max_silence 秒送信が無い場合はハートビートとして送信）
+                decision = change_detector.should_send(frame, current_time)
+                upload_after = None
+                if decision == "heartbeat":
+                    logger.info("変化なし - ハートビートを送信します")
                 
-                # APIに送信
-                success = send_image_to_api(
-                    img_bytes,
-                    classroom_id,
-                    api_url
-                )
+                if not decision:
+                    skipped_count += 1
+                    success = False
+                    logger.debug(f"変化なし - 送信をスキップしました（累計 {skipped_count}回）")
+                elif detector is not None:
+                    # カメラ側で検出し、人数だけを送信
+                    # ハートビートでは場面が変わっていないため、推論せずに前回の結果を再送する
+                    captured_at = datetime.now(timezone.utc)
+                    if decision == "heartbeat" and last_result is not None:
+                        result = last_result
+                    else:
+                        result = detector.detect_result(frame)
+                    response = send_count_to_api(
+                        classroom_id,
+                        result.count,
+                        result.confidence,
+                        captured_at,
+                        api_url,
+                        spool
+                    )
+                    success = response is not None
+                    last_result = result
+                    recent_counts.append(result.count)
+                    
+                    # サムネイルはたまに、またはサーバーから要求されたときだけ送信
+                    thumbnail_due = last_thumbnail_time is None or (
+                        thumbnail_interval > 0 and current_time - last_thumbnail_time >= thumbnail_interval
+                    )
+                    if success and not response.get('spooled') and (thumbnail_due or response.get('thumbnail_requested')):
+                        send_thumbnail_to_api(codec.encode_thumbnail(result.annotate(frame)), classroom_id, api_url)
+                        last_thumbnail_time = current_time
+                else:
+                    # 画像をJPEG形式にエンコード
+                    img_bytes = codec.encode(frame, quality=85)
+                    
+                    # APIに送信
+                    response = send_image_to_api(
+                        img_bytes,
+                        classroom_id,
+                        api_url
+                    )
+                    success = response is not None
+                    # サーバーの推論予算で次の送信時刻が指定された場合は、それより前に送らない
+                    upload_after = (response or {}).get('next_upload_in')
                 
-                last_detect_time = current_time
+                if cadence is not None:
+                    current_interval = cadence.plan(classroom_id, datetime.now(timezone.utc), list(recent_counts))
+                else:
+                    current_interval = interval
+                if upload_after is not None:
+                    current_interval = max(current_interval, upload_after)
                 
                 if success:
-                    logger.info(f"次の検出まで {interval}秒待機します...")
+                    # ハートビートでは基準フレームを更新しない（ゆっくりした変化も検出できるように）
+                    change_detector.mark_sent(frame, current_time, update_reference=(decision == "changed"))
+                    logger.info(f"次の検出まで {current_interval:.0f}秒待機します...")
+            
+            elif cadence is not None and last_result is not None and change_detector.heartbeat_due(current_time):
+                # 検出間隔が長い間も前回の結果をハートビートとして送信する（オフライン扱いを防ぐ）
+                response = send_count_to_api(
+                    classroom_id,
+                    last_result.count,
+                    last_result.confidence,
+                    datetime.now(timezone.utc),
+                    api_url,
+                    spool
+                )
+                if response is not None:
+                    change_detector.mark_sent(None, current_time, update_reference=False)
             
             # 短い待機時間（CPU使用率を下げる）
             time.sleep(0.1)
@@ -157,6 +298,10 @@ def capture_and_detect(
         logger.error(f"エラーが発生しました: {e}", exc_info=True)
     finally:
         cap.release()
+        if drainer is not None:
+            drainer.stop()
+            replay_session.close()
+            spool.close()
         if show_preview:
             cv2.destroyAllWindows()
         logger.info("カメラを解放しました。")
@@ -166,7 +311,7 @@ def send_image_to_api(
     image_bytes: bytes,
     classroom_id: str,
     api_url: str = "http://localhost:8000"
-) -> bool:
+) -> Optional[dict]:
     """
     画像をAPIエンドポイントに送信
     
@@ -176,7 +321,7 @@ def send_image_to_api(
         api_url: APIのベースURL
         
     Returns:
-        成功した場合True、失敗した場合False
+        成功した場合はレスポンス（next_upload_in を含む）、失敗した場合None
     """
     try:
         url = f"{api_url}/api/v1/camera/detect"
@@ -196,14 +341,109 @@ def send_image_to_api(
             )
             if result.get('image_url'):
                 logger.info(f"  解析結果画像: {api_url}{result['image_url']}")
-            return True
+            return result
         else:
             logger.error(f"✗ 送信失敗 - ステータスコード: {response.status_code}, レスポンス: {response.text}")
-            return False
+            return None
             
     except requests.exceptions.ConnectionError:
         logger.error(f"✗ APIサーバーに接続できません: {api_url}")
         logger.info("ヒント: FastAPIサーバーが起動しているか確認してください")
+        return None
+    except Exception as e:
+        logger.error(f"✗ エラーが発生しました: {e}")
+        return None
+
+
+def send_count_to_api(
+    classroom_id: str,
+    count: int,
+    confidence: float,
+    captured_at: datetime,
+    api_url: str = "http://localhost:8000",
+    spool: Optional[ReadingSpool] = None
+) -> Optional[dict]:
+    """
+    カメラ側で検出した人数をAPIに送信（エッジ検出モード）
+    
+    Args:
+        classroom_id: 教室ID
+        count: 検出人数
+        confidence: 平均信頼度
+        captured_at: 撮影時刻
+        api_url: APIのベースURL
+        spool: 送信できなかった場合に読み取りを保存するスプール
+        
+    Returns:
+        成功した場合はレスポンス（thumbnail_requested を含む）、スプールに保存した場合は
+        {'spooled': True}、失敗した場合None
+    """
+    reading = {
+        'classroom_id': classroom_id,
+        'current_count': count,
+        'detection_confidence': round(min(max(float(confidence), 0.0), 1.0), 4),
+        'captured_at': captured_at.isoformat(),
+    }
+    status_code, result = post_reading(reading, api_url)
+    
+    if status_code == 200:
+        logger.info(f"✓ 人数送信成功 - 教室ID: {classroom_id}, 人数: {count}人, 信頼度: {confidence:.2f}")
+        return result
+    if spool is not None and is_retryable(status_code):
+        spool.append(reading)
+        logger.info(f"  読み取りをスプールに保存しました（接続が戻り次第再送します、{len(spool)}件）")
+        return {'spooled': True}
+    return None
+
+
+def post_reading(reading: dict, api_url: str = "http://localhost:8000") -> Tuple[Optional[int], Optional[dict]]:
+    """
+    読み取りを /api/v1/occupancy/update に送信
+    
+    Returns:
+        Tuple of (ステータスコード（接続できない場合None）, 成功した場合はレスポンス)
+    """
+    try:
+        url = f"{api_url}/api/v1/occupancy/update"
+        response = requests.post(url, json=reading, timeout=10)
+        
+        if response.status_code == 200:
+            return response.status_code, response.json()
+        logger.error(f"✗ 送信失敗 - ステータスコード: {response.status_code}, レスポンス: {response.text}")
+        return response.status_code, None
+            
+    except requests.exceptions.RequestException as e:
+        logger.error(f"✗ APIサーバーに接続できません: {api_url} ({type(e).__name__})")
+        logger.info("ヒント: FastAPIサーバーが起動しているか確認してください")
+        return None, None
+
+
+def send_thumbnail_to_api(
+    image_bytes: bytes,
+    classroom_id: str,
+    api_url: str = "http://localhost:8000"
+) -> bool:
+    """
+    解析結果サムネイルをAPIに送信（エッジ検出モード、サーバー側では推論しない）
+    
+    Returns:
+        成功した場合True、失敗した場合False
+    """
+    try:
+        url = f"{api_url}/api/v1/camera/thumbnail"
+        files = {'file': ('thumbnail.jpg', BytesIO(image_bytes), 'image/jpeg')}
+        data = {'classroom_id': classroom_id}
+        
+        response = requests.post(url, files=files, data=data, timeout=30)
+        
+        if response.status_code == 200:
+            logger.info(f"  サムネイルを送信しました ({len(image_bytes) // 1024}KB)")
+            return True
+        logger.error(f"✗ サムネイル送信失敗 - ステータスコード: {response.status_code}, レスポンス: {response.text}")
+        return False
+        
+    except requests.exceptions.ConnectionError:
+        logger.error(f"✗ APIサーバーに接続できません: {api_url}")
         return False
     except Exception as e:
         logger.error(f"✗ エラーが発生しました: {e}")
@@ -228,6 +468,9 @@ def main():
   
   # 別のカメラデバイスを使用
   python capture_camera.py --classroom-id bus1-105 --camera-id 1
+  
+  # カメラ側で検出して人数だけを送信（ラズパイではONNX推奨）
+  python capture_camera.py --classroom-id bus1-105 --edge-detect --backend onnx --model yolov8n.onnx
         """
     )
     
@@ -265,6 +508,61 @@ def main():
         help='プレビューウィンドウを表示'
     )
     
+    parser.add_argument(
+        '--edge-detect',
+        action='store_true',
+        help='カメラ側で人数検出を行い、人数だけを送信'
+    )
+    
+    parser.add_argument(
+        '--backend',
+        type=str,
+        default='yolo',
+        choices=['yolo', 'onnx', 'hog'],
+        help='エッジ検出の検出バックエンド（デフォルト: yolo）'
+    )
+    
+    parser.add_argument(
+        '--model',
+        type=str,
+        default='yolov8n.pt',
+        help='エッジ検出のモデルファイル（デフォルト: yolov8n.pt）'
+    )
+    
+    parser.add_argument(
+        '--thumbnail-interval',
+        type=int,
+        default=300,
+        help='エッジ検出時にサムネイルを送る間隔（秒）デフォルト: 300（0で要求時のみ）'
+    )
+    
+    parser.add_argument(
+        '--change-threshold',
+        type=float,
+        default=0.02,
+        help='変化ありとみなす画素の割合（デフォルト: 0.02、0で常に送信）'
+    )
+    
+    parser.add_argument(
+        '--max-silence',
+        type=float,
+        default=25.0,
+        help='変化が無くても送信する間隔（秒）デフォルト: 25（サーバーは30秒でオフライン扱い）'
+    )
+    
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help='授業の開始・終了の前後だけ --interval 秒ごとに検出し、授業中は30秒・夜間は300秒ごとにする'
+    )
+    
+    parser.add_argument(
+        '--spool',
+        type=str,
+        default='edge_spool.db',
+        help='エッジ検出で送信できなかった読み取りを保存するファイル（デフォルト: edge_spool.db、空文字で無効）'
+    )
+    
     args = parser.parse_args()
     
     # 人数検出を実行
@@ -273,7 +571,15 @@ def main():
         camera_id=args.camera_id,
         interval=args.interval,
         api_url=args.api_url,
-        show_preview=args.show_preview
+        show_preview=args.show_preview,
+        edge_detect=args.edge_detect,
+        backend=args.backend,
+        model_path=args.model,
+        thumbnail_interval=args.thumbnail_interval,
+        change_threshold=args.change_threshold,
+        max_silence=args.max_silence,
+        spool_path=args.spool,
+        adaptive=args.adaptive
     )
 
 
@@ -14,7 +14,6 @@ import cv2
 import logging
 import os
 import sys
-from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
@@ -25,6 +24,8 @@ from ultralytics import YOLO
 current_dir = Path(__file__).resolve().parent
 sys.path.append(str(current_dir))
 
+from services.occupancy_writer import Reading, occupancy_writer
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -54,64 +55,9 @@ def setup_database():
         sys.exit(1)
 
 def update_occupancy(db, classroom_id, count, confidence, camera_id="pc_direct"):
-    """データベースの占有状況を更新"""
+    """データベースの占有状況を更新（現在の状態のupsertと履歴の追加を1回で行う）"""
     try:
-        # 現在の時刻
-        now = datetime.now()
-        
-        # 既存のレコードを確認
-        check_query = text("""
-            SELECT id FROM occupancy WHERE classroom_id = :classroom_id
-        """)
-        result = db.execute(check_query, {"classroom_id": classroom_id}).fetchone()
-        
-        if result:
-            # 更新
-            update_query = text("""
-                UPDATE occupancy 
-                SET current_count = :count, 
-                    detection_confidence = :confidence,
-                    last_updated = :now,
-                    camera_id = :camera_id
-                WHERE classroom_id = :classroom_id
-            """)
-            db.execute(update_query, {
-                "count": count,
-                "confidence": confidence,
-                "now": now,
-                "camera_id": camera_id,
-                "classroom_id": classroom_id
-            })
-        else:
-            # 新規作成
-            insert_query = text("""
-                INSERT INTO occupancy (id, classroom_id, current_count, detection_confidence, last_updated, camera_id)
-                VALUES (:id, :classroom_id, :count, :confidence, :now, :camera_id)
-            """)
-            db.execute(insert_query, {
-                "id": f"occ_{classroom_id}",
-                "classroom_id": classroom_id,
-                "count": count,
-                "confidence": confidence,
-                "now": now,
-                "camera_id": camera_id
-            })
-            
-        # 履歴にも追加
-        history_id = f"hist_{classroom_id}_{now.timestamp()}"
-        history_query = text("""
-            INSERT INTO occupancy_history (id, classroom_id, timestamp, count, detection_confidence, camera_id)
-            VALUES (:id, :classroom_id, :timestamp, :count, :confidence, :camera_id)
-        """)
-        db.execute(history_query, {
-            "id": history_id,
-            "classroom_id": classroom_id,
-            "timestamp": now,
-            "count": count,
-            "confidence": confidence,
-            "camera_id": camera_id
-        })
-        
+        occupancy_writer.write(db, Reading(classroom_id, count, confidence, camera_id=camera_id))
         db.commit()
         return True
     except Exception as e:
@@ -29,8 +29,78 @@ class Settings(BaseSettings):
     # Camera Settings
     camera_enabled: bool = False  # Disabled for Vercel (dependencies too large)
     camera_update_interval: int = 5  # seconds
-    detection_model_path: str = "yolov8n.pt"  # YOLOv8 model path
-    
+    # Server-side polling (CameraProcessor): JSON file {"classroom_id": "rtsp://..."}
+    camera_streams_path: str = ""
+    camera_max_concurrency: int = 8  # Cameras detected at the same time
+    # Sample densely around period boundaries (camera_update_interval) and less often otherwise
+    camera_adaptive_cadence: bool = False
+    camera_cadence_normal_interval: float = 30.0  # Mid-period and breaks (seconds)
+    camera_cadence_sparse_interval: float = 300.0  # Before 1st / after 7th period and Sundays (seconds)
+    camera_cadence_timezone: str = "Asia/Tokyo"  # Time zone of the class periods (PERIOD_TIMES)
+    detection_model_path: str = "yolov8n.pt"  # YOLOv8 model path (.onnx for the onnx backend)
+    detection_backend: str = "yolo"  # Options: "yolo" (ultralytics), "onnx" (ONNX Runtime CPU), "hog"
+    detection_onnx_quantize: bool = False  # int8 dynamic quantization for the onnx backend
+    detection_cascade: bool = False  # Skip the model on clearly empty / unchanged frames
+    # Reuse the previous result when a classroom's frame hash (dHash) barely changed
+    frame_cache_size: int = 0  # Classrooms kept in the LRU cache (0 disables the cache, e.g. 256)
+    frame_cache_max_distance: int = 6  # Max differing hash bits (out of 256) to count as unchanged
+    frame_cache_max_age: float = 300.0  # Re-run inference at least this often (seconds)
+    # Token for POST /camera/model (model hot-swap); empty disables the endpoint
+    camera_admin_token: str = ""
+    # Per-camera inference profiles (input size, HOG scale/stride, confidence floor)
+    # JSON file written by: python -m camera.profiles --classroom-id ... --images ...
+    inference_profiles_path: str = ""
+
+    # Inference executor for /camera/detect (keeps the event loop free)
+    inference_executor: str = "thread"  # Options: "thread" (one shared detector, calls serialized) or "process"
+    inference_workers: int = 1  # Number of inference workers
+    inference_queue_size: int = 8  # Max frames waiting for a worker before returning 503
+    inference_retry_after: int = 5  # Retry-After (seconds) sent when the queue is full
+
+    # Shared micro-batching inference server (python -m camera.inference_server)
+    # When set, API workers send frames to this Unix socket instead of loading the model
+    inference_server_socket: str = ""
+    inference_max_batch_size: int = 8
+    inference_max_wait_ms: float = 10.0
+
+    # Global inference budget for image-uploading cameras: /camera/detect tells each
+    # camera when to upload next (next_upload_in), splitting this many frames/sec by
+    # priority (status changing, favorites). 0 disables the budget.
+    inference_budget_fps: float = 0.0
+    inference_budget_max_interval: float = 25.0  # Never slower than this (30 s = offline)
+
+    # POST /occupancy/bulk-update (building gateways, spool replay)
+    occupancy_bulk_max_readings: int = 1000  # Larger requests get 413
+    occupancy_bulk_slo_ms: float = 500.0  # Log a warning when a bulk update takes longer
+    classroom_id_cache_ttl: float = 60.0  # Seconds the known classroom IDs are cached
+
+    # Write-behind occupancy_history: readings update occupancy in the request and their
+    # history rows are batched by a background thread (long-running servers only; rows
+    # still buffered when the process dies are lost, at most history_buffer_max_rows)
+    history_buffer_enabled: bool = False
+    history_buffer_flush_rows: int = 500  # Flush when this many rows are waiting
+    history_buffer_flush_ms: float = 1000.0  # ...and at least this often
+    history_buffer_max_rows: int = 50000  # Oldest rows are dropped beyond this
+
+    # Smooth camera counts per classroom before writing: occupancy is written when the
+    # running median moves by occupancy_filter_deadband (or empty <-> occupied) and at
+    # least every occupancy_filter_max_age seconds (keep below the UI's 30 s offline
+    # threshold); history gets the change points plus a heartbeat row
+    occupancy_filter_enabled: bool = False
+    occupancy_filter_window: int = 3  # Readings in the running median
+    occupancy_filter_deadband: int = 2  # People
+    occupancy_filter_max_age: float = 20.0
+    occupancy_filter_heartbeat: float = 300.0
+
+    # occupancy_history is partitioned by month (PostgreSQL); manage_history_partitions.py
+    # prepares upcoming months and drops months older than the retention period
+    history_retention_months: int = 24  # 0 keeps everything
+    history_partition_months_ahead: int = 3
+
+    # Edge-detection cameras upload only counts; ask them for a fresh annotated
+    # thumbnail when a viewer requests an image older than this (seconds)
+    edge_thumbnail_max_age: int = 60
+
     # Camera source configuration
     # For PC: use device ID (e.g., "0", "1", "2")
     # For Raspberry Pi: use device path or URL (e.g., "/dev/video0", "http://...")
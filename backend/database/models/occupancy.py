@@ -1,7 +1,10 @@
 """
 Occupancy database models
 """
-from sqlalchemy import Column, String, Integer, DateTime, func, Float, ForeignKey
+from sqlalchemy import (
+    Column, String, Integer, SmallInteger, BigInteger, DateTime, func, Float, REAL, ForeignKey,
+    Identity, UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 from database.session import Base
 
@@ -41,15 +44,25 @@ class Occupancy(Base):
 
 
 class OccupancyHistory(Base):
-    """Historical occupancy data"""
+    """Historical occupancy data
+    
+    Compact rows (bigint identity, smallint classroom key) range-partitioned by month
+    on PostgreSQL; old months are dropped as whole partitions (services/history_partitions.py).
+    (classroom_key, timestamp) is unique, so a replayed reading is recorded once.
+    """
     
     __tablename__ = "occupancy_history"
+    __table_args__ = (
+        UniqueConstraint("classroom_key", "timestamp", name="occupancy_history_classroom_key_timestamp_key"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
     
-    id = Column(String, primary_key=True, index=True)
-    classroom_id = Column(String, ForeignKey("classrooms.id"), nullable=False, index=True)
-    timestamp = Column(DateTime(timezone=True), nullable=False, index=True)
-    count = Column(Integer, nullable=False)
-    detection_confidence = Column(Float, nullable=False)
+    # The partition key must be part of the primary key
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), Identity(), primary_key=True)
+    timestamp = Column(DateTime(timezone=True), primary_key=True)
+    classroom_key = Column(SmallInteger, ForeignKey("classrooms.short_id"), nullable=False)
+    count = Column(SmallInteger, nullable=False)
+    detection_confidence = Column(REAL, nullable=False)
     camera_id = Column(String, nullable=True)
     
     # Relationships
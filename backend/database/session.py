@@ -50,6 +50,26 @@ except Exception as e:
     logger.error(f"Failed to create database engine: {e}")
     raise
 
+
+def create_dedicated_engine(pool_size: int = 1):
+    """
+    Engine with its own connection pool for background workers (history buffer)
+
+    The request engine above has a single pooled connection; a background flush
+    holding it would make request handlers time out waiting for the pool.
+    """
+    return create_engine(
+        database_url,
+        echo=settings.database_echo,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_recycle=300,
+        pool_timeout=30,
+        connect_args=connect_args,
+    )
+
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,578 @@
+"""
+複数カメラのエッジエージェント
+
+1つのプロセスで複数の教室のカメラを扱います。カメラごとに capture_camera.py を
+起動する代わりに、設定ファイルに並べたカメラを asyncio で並行して処理し、
+HTTP接続（keep-alive）と検出器を全カメラで共有します。
+
+使用方法:
+    python edge_agent.py --config edge_agent.json
+
+設定ファイル（JSON、PyYAMLがインストールされていればYAMLも可）:
+    {
+        "api_url": "http://localhost:8000",
+        "edge_detect": true,
+        "backend": "onnx",
+        "model": "yolov8n.onnx",
+        "change_threshold": 0.02,
+        "max_silence": 25,
+        "thumbnail_interval": 300,
+        "spool_path": "edge_spool.db",
+        "capture_processes": false,
+        "cameras": [
+            {"classroom_id": "bus1-105", "camera_type": "pc", "source": "0", "interval": 5},
+            {"classroom_id": "bus1-106", "camera_type": "raspberry_pi", "source": "/dev/video2", "interval": 10}
+        ]
+    }
+
+カメラごとの項目（change_threshold / max_silence / thumbnail_interval / adaptive）は
+トップレベルの値を上書きできます。エッジ検出で送信できなかった読み取りは
+spool_path（空文字で無効）に保存し、接続が戻り次第撮影順に再送します。
+
+capture_processes を true にすると、カメラごとに撮影プロセス（camera/frame_ring.py の
+capture_worker）を起動し、共有メモリのフレームリングから最新のフレームを読み取って
+検出します。カメラの読み取りとデコードが推論と別のCPUコアで進むため、推論が遅くても
+撮影が止まりません（マルチコアの端末向け）。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import httpx
+import requests
+
+from camera import codec
+from camera.cadence import CadencePolicy
+from camera.detector import DetectionResult, create_detector
+from camera.frame_ring import FrameRing, capture_worker
+from camera.motion import ChangeDetector
+from camera.source import CameraSource
+from camera.spool import Backoff, ReadingSpool, SpoolDrainer, is_retryable, replay_reading, replay_readings
+
+# ログ設定
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# フレームを捨てる（grab）間隔（秒）
+GRAB_INTERVAL = 0.1
+# 連続してフレームを読み取れなかった場合にカメラを開き直すまでの回数
+MAX_READ_FAILURES = 10
+# この秒数以上動き続けたタスクが落ちた場合は、再起動の待ち時間を最初からやり直す
+SUPERVISOR_RESET_AFTER = 300.0
+# 撮影プロセスのフレームリング（_open_camera と同じ 1280x720）
+CAPTURE_SHAPE = (720, 1280, 3)
+CAPTURE_SLOTS = 4
+# 撮影プロセスから新しいフレームを待つ時間（秒）
+CAPTURE_FRAME_TIMEOUT = 2.0
+
+
+@dataclass
+class CameraConfig:
+    """1台のカメラの設定"""
+    classroom_id: str
+    source: str = "0"
+    camera_type: str = "pc"
+    interval: float = 5.0
+    change_threshold: float = 0.02
+    max_silence: float = 25.0
+    thumbnail_interval: float = 300.0
+    # 授業の開始・終了の前後だけ interval 秒ごとに検出し、それ以外は間隔を空ける
+    adaptive: bool = False
+
+
+@dataclass
+class AgentConfig:
+    """エージェント全体の設定"""
+    cameras: List[CameraConfig]
+    api_url: str = "http://localhost:8000"
+    edge_detect: bool = True
+    backend: str = "yolo"
+    model: str = "yolov8n.pt"
+    max_connections: int = 4
+    spool_path: str = "edge_spool.db"
+    # カメラごとに撮影プロセスを分け、共有メモリのフレームリング経由でフレームを受け取る
+    capture_processes: bool = False
+
+
+def load_config(path: str) -> AgentConfig:
+    """
+    設定ファイルを読み込む
+
+    Raises:
+        ValueError: 設定が不正な場合
+    """
+    text = Path(path).read_text(encoding="utf-8")
+    if Path(path).suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML設定ファイルには PyYAML が必要です（pip install pyyaml）")
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+
+    camera_keys = set(CameraConfig.__dataclass_fields__)
+    defaults = {k: v for k, v in data.items() if k in camera_keys - {"classroom_id", "source", "camera_type"}}
+    cameras = []
+    for entry in data.get("cameras", []):
+        if "classroom_id" not in entry:
+            raise ValueError(f"classroom_id がありません: {entry}")
+        values = {**defaults, **{k: v for k, v in entry.items() if k in camera_keys}}
+        values["source"] = str(values.get("source", "0"))
+        cameras.append(CameraConfig(**values))
+    if not cameras:
+        raise ValueError("cameras が空です")
+
+    classroom_ids = [c.classroom_id for c in cameras]
+    if len(set(classroom_ids)) != len(classroom_ids):
+        raise ValueError("同じ classroom_id が複数あります")
+
+    agent_keys = set(AgentConfig.__dataclass_fields__) - {"cameras"}
+    return AgentConfig(cameras=cameras, **{k: v for k, v in data.items() if k in agent_keys})
+
+
+class _CaptureProcess:
+    """1台のカメラの撮影プロセス（capture_worker）と共有メモリのフレームリング"""
+
+    def __init__(self, camera: CameraConfig):
+        # spawn: asyncio とスレッドを持つエージェントを fork しない
+        context = multiprocessing.get_context("spawn")
+        self.ring = FrameRing.create(shape=CAPTURE_SHAPE, slots=CAPTURE_SLOTS)
+        self._stop = context.Event()
+        self.process = context.Process(
+            target=capture_worker,
+            args=(self.ring.spec(), camera.camera_type, camera.source, self._stop),
+            name=f"capture-{camera.classroom_id}",
+            daemon=True,
+        )
+        try:
+            self.process.start()
+        except Exception:
+            self.ring.close()
+            raise
+        self._seq = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def read(self, timeout: float = CAPTURE_FRAME_TIMEOUT):
+        """
+        前回より新しい最新フレームを返す（届かない場合はNone）
+
+        推論中も撮影側は次々とスロットに書き込むため、検出に使うフレームだけを
+        コピーします（撮影されたフレームごとのコピーやpickleはありません）。
+        """
+        view = self.ring.wait_latest(after=self._seq, timeout=timeout)
+        if view is None:
+            return None
+        image = view.image.copy()
+        if not self.ring.is_current(view):
+            # コピー中に上書きされた
+            return None
+        self._seq = view.seq
+        return image
+
+    def close(self):
+        # 終了したプロセスが待っていた Event を set() すると応答を待ち続けるため、動いているときだけ
+        if self.process.is_alive():
+            self._stop.set()
+            self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.ring.close()
+
+
+@dataclass
+class _CameraState:
+    """カメラごとの送信状態"""
+    change_detector: ChangeDetector
+    last_sample: Optional[float] = None
+    last_thumbnail: Optional[float] = None
+    # エッジ検出の直近の結果（ハートビートで再送する）
+    last_result: Optional[DetectionResult] = None
+    interval: float = 5.0
+    cadence: Optional[CadencePolicy] = None
+    recent_counts: deque = field(default_factory=lambda: deque(maxlen=6))
+    # サーバーから指定された次の送信までの秒数（推論予算）
+    upload_after: Optional[float] = None
+
+
+class EdgeAgent:
+    """複数カメラを1プロセスで処理するエッジエージェント"""
+
+    def __init__(self, config: AgentConfig):
+        self.config = config
+        self.api_url = config.api_url.rstrip("/")
+        self.detector = None
+        # 推論は1スレッドで順番に実行する（検出器を全カメラで共有）
+        self._inference = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        # カメラの読み取り（grab/read）はブロックするためスレッドで実行する
+        self._camera_io = ThreadPoolExecutor(
+            max_workers=max(2, len(config.cameras)), thread_name_prefix="camera"
+        )
+        self.client: Optional[httpx.AsyncClient] = None
+        self._states: Dict[str, _CameraState] = {}
+        # 送信できなかった読み取りは接続が戻るまでスプールに保存し、capture_camera.py と
+        # 同じ SpoolDrainer（同じ再送・バックオフの規則）がバックグラウンドで撮影順に再送する。
+        # 再送スレッドはエージェントの requests.Session（keep-alive）を使い続ける
+        self.spool = ReadingSpool(config.spool_path) if config.edge_detect and config.spool_path else None
+        self._replay_session = requests.Session() if self.spool is not None else None
+        self._drainer = SpoolDrainer(
+            self.spool,
+            partial(replay_reading, api_url=self.api_url, session=self._replay_session),
+            send_batch=partial(replay_readings, api_url=self.api_url, session=self._replay_session),
+        ) if self.spool is not None else None
+
+    async def _run_in(self, executor: ThreadPoolExecutor, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    def _open_camera(self, camera: CameraConfig):
+        cap = CameraSource.get_camera(camera.camera_type, camera.source)
+        if cap.isOpened():
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        return cap
+
+    async def post_reading(self, reading: dict) -> Tuple[Optional[int], Optional[dict]]:
+        """
+        読み取りを /api/v1/occupancy/update に送信
+
+        Returns:
+            Tuple of (ステータスコード（接続できない場合None）, 成功した場合はレスポンス)
+        """
+        classroom_id = reading["classroom_id"]
+        try:
+            response = await self.client.post(f"{self.api_url}/api/v1/occupancy/update", json=reading)
+        except httpx.HTTPError as e:
+            logger.error(f"✗ [{classroom_id}] APIサーバーに接続できません: {type(e).__name__}")
+            return None, None
+        if response.status_code != 200:
+            logger.error(f"✗ [{classroom_id}] 送信失敗 - ステータスコード: {response.status_code}, レスポンス: {response.text}")
+            return response.status_code, None
+        return response.status_code, response.json()
+
+    async def send_count(self, classroom_id: str, count: int, confidence: float, captured_at: datetime) -> Optional[dict]:
+        """
+        検出した人数を送信
+
+        Returns:
+            成功時はレスポンス、スプールに保存した場合は {"spooled": True}、失敗した場合None
+        """
+        reading = {
+            "classroom_id": classroom_id,
+            "current_count": count,
+            "detection_confidence": round(min(max(float(confidence), 0.0), 1.0), 4),
+            "captured_at": captured_at.isoformat(),
+        }
+        status_code, result = await self.post_reading(reading)
+        if status_code == 200:
+            logger.info(f"✓ [{classroom_id}] 人数送信成功 - 人数: {count}人, 信頼度: {confidence:.2f}")
+            return result
+        if self.spool is not None and is_retryable(status_code):
+            await self._run_in(self._camera_io, self.spool.append, reading)
+            return {"spooled": True}
+        return None
+
+    async def send_image(self, classroom_id: str, image_bytes: bytes) -> Optional[dict]:
+        """画像を送信してサーバー側で検出（エッジ検出を使わない場合、成功時はレスポンスを返す）"""
+        files = {"file": ("image.jpg", image_bytes, "image/jpeg")}
+        try:
+            response = await self.client.post(
+                f"{self.api_url}/api/v1/camera/detect", files=files, data={"classroom_id": classroom_id}
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"✗ [{classroom_id}] APIサーバーに接続できません: {e}")
+            return None
+        if response.status_code != 200:
+            logger.error(f"✗ [{classroom_id}] 送信失敗 - ステータスコード: {response.status_code}, レスポンス: {response.text}")
+            return None
+        result = response.json()
+        logger.info(f"✓ [{classroom_id}] 検出成功 - 人数: {result['person_count']}人, 信頼度: {result['confidence']:.2f}")
+        return result
+
+    async def send_thumbnail(self, classroom_id: str, image_bytes: bytes) -> bool:
+        """解析結果サムネイルを送信"""
+        files = {"file": ("thumbnail.jpg", image_bytes, "image/jpeg")}
+        try:
+            response = await self.client.post(
+                f"{self.api_url}/api/v1/camera/thumbnail", files=files, data={"classroom_id": classroom_id}
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"✗ [{classroom_id}] サムネイルを送信できません: {e}")
+            return False
+        return response.status_code == 200
+
+    async def run_camera(self, camera: CameraConfig):
+        """1台のカメラの撮影・検出・送信ループ"""
+        classroom_id = camera.classroom_id
+        state = _CameraState(
+            ChangeDetector(threshold=camera.change_threshold, max_silence=camera.max_silence),
+            interval=camera.interval,
+        )
+        if camera.adaptive:
+            # 画像送信モードではハートビートを兼ねるため max_silence 秒以下にする
+            limit = float("inf") if self.config.edge_detect else camera.max_silence
+            state.cadence = CadencePolicy(
+                dense_interval=camera.interval,
+                normal_interval=min(30.0, limit),
+                sparse_interval=min(300.0, limit),
+            )
+        self._states[classroom_id] = state
+        loop = asyncio.get_running_loop()
+        cap = None
+        capture = None
+        failures = 0
+
+        try:
+            while True:
+                if self.config.capture_processes:
+                    if capture is not None and not capture.alive:
+                        logger.error(f"[{classroom_id}] 撮影プロセスが終了しました。起動し直します")
+                        await self._run_in(self._camera_io, capture.close)
+                        capture = None
+                    if capture is None:
+                        capture = await self._run_in(self._camera_io, _CaptureProcess, camera)
+                        logger.info(f"[{classroom_id}] 撮影プロセスを起動しました: {camera.source}（{camera.interval}秒間隔）")
+                elif cap is None:
+                    try:
+                        cap = await self._run_in(self._camera_io, self._open_camera, camera)
+                    except ValueError as e:
+                        logger.error(f"[{classroom_id}] カメラの初期化に失敗しました: {e}")
+                        return
+                    if not cap.isOpened():
+                        logger.error(f"[{classroom_id}] カメラを開けませんでした: {camera.source}（30秒後に再試行）")
+                        cap = None
+                        await asyncio.sleep(30)
+                        continue
+                    logger.info(f"[{classroom_id}] カメラを開きました: {camera.source}（{camera.interval}秒間隔）")
+
+                now = loop.time()
+                sample_due = state.last_sample is None or now - state.last_sample >= state.interval
+
+                if capture is not None:
+                    # 撮影プロセスが読み取り続けているため、検出時に最新のフレームを取るだけ
+                    if sample_due:
+                        frame = await self._run_in(self._camera_io, capture.read)
+                        ret = frame is not None
+                    else:
+                        ret, frame = True, None
+                # 検出時だけデコードし、それ以外は grab() でバッファを進めるだけにする
+                elif sample_due:
+                    ret, frame = await self._run_in(self._camera_io, cap.read)
+                else:
+                    ret, frame = await self._run_in(self._camera_io, cap.grab), None
+
+                if not ret:
+                    failures += 1
+                    if failures >= MAX_READ_FAILURES:
+                        logger.error(f"[{classroom_id}] フレームを読み取れません。カメラを開き直します")
+                        if capture is not None:
+                            await self._run_in(self._camera_io, capture.close)
+                            capture = None
+                        else:
+                            await self._run_in(self._camera_io, cap.release)
+                            cap = None
+                        failures = 0
+                    await asyncio.sleep(1)
+                    continue
+                failures = 0
+
+                if sample_due:
+                    state.last_sample = now
+                    decision = state.change_detector.should_send(frame)
+                    if decision:
+                        if decision == "heartbeat":
+                            logger.info(f"[{classroom_id}] 変化なし - ハートビートを送信します")
+                        if await self._process_frame(camera, state, frame, decision):
+                            state.change_detector.mark_sent(frame, update_reference=(decision == "changed"))
+                    if state.cadence is not None:
+                        state.cadence.record_sample(classroom_id)
+                        state.interval = state.cadence.plan(classroom_id, datetime.now(timezone.utc), list(state.recent_counts))
+                    else:
+                        state.interval = camera.interval
+                    if state.upload_after is not None:
+                        state.interval = max(state.interval, state.upload_after)
+                        state.upload_after = None
+                elif (
+                    state.cadence is not None
+                    and state.last_result is not None
+                    and state.change_detector.heartbeat_due()
+                ):
+                    # 検出間隔が長い間も前回の結果をハートビートとして送信する（オフライン扱いを防ぐ）
+                    result = state.last_result
+                    response = await self.send_count(classroom_id, result.count, result.confidence, datetime.now(timezone.utc))
+                    if response is not None:
+                        state.change_detector.mark_sent(None, update_reference=False)
+
+                await asyncio.sleep(GRAB_INTERVAL)
+        finally:
+            if cap is not None:
+                await self._run_in(self._camera_io, cap.release)
+            if capture is not None:
+                await self._run_in(self._camera_io, capture.close)
+
+    async def _process_frame(self, camera: CameraConfig, state: "_CameraState", frame, decision: str) -> bool:
+        """
+        1フレームを検出・送信する
+
+        Returns:
+            bool: 送信に成功したか
+        """
+        classroom_id = camera.classroom_id
+
+        if not self.config.edge_detect:
+            response = await self.send_image(classroom_id, codec.encode(frame, quality=85))
+            if response is None:
+                return False
+            # サーバーの推論予算で次の送信時刻が指定された場合は、それより前に送らない
+            state.upload_after = response.get("next_upload_in")
+            return True
+
+        # ハートビートでは場面が変わっていないため、推論せずに前回の結果を再送する
+        captured_at = datetime.now(timezone.utc)
+        if decision == "heartbeat" and state.last_result is not None:
+            result = state.last_result
+        else:
+            result = await self._run_in(self._inference, self.detector.detect_result, frame)
+
+        response = await self.send_count(classroom_id, result.count, result.confidence, captured_at)
+        if response is None:
+            return False
+        state.last_result = result
+        state.recent_counts.append(result.count)
+        if response.get("spooled"):
+            return True
+
+        now = asyncio.get_running_loop().time()
+        thumbnail_due = state.last_thumbnail is None or (
+            camera.thumbnail_interval > 0 and now - state.last_thumbnail >= camera.thumbnail_interval
+        )
+        if thumbnail_due or response.get("thumbnail_requested"):
+            thumbnail = await self._run_in(self._camera_io, lambda: codec.encode_thumbnail(result.annotate(frame)))
+            if await self.send_thumbnail(classroom_id, thumbnail):
+                state.last_thumbnail = now
+        return True
+
+    def cadence_stats(self) -> Dict[str, dict]:
+        """時間割に合わせたカメラごとの予定した検出数と実際の検出数"""
+        return {
+            classroom_id: state.cadence.stats(classroom_id)
+            for classroom_id, state in self._states.items()
+            if state.cadence is not None
+        }
+
+    async def log_stats(self, interval: float = 600.0):
+        """検出数の統計を定期的にログに出力する"""
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.cadence_stats()
+            if stats:
+                logger.info(f"検出数（予定/実際）: {stats}")
+
+    async def _supervise(self, name: str, factory):
+        """
+        タスクを実行し、予期しないエラーで終了した場合はジッター付き指数バックオフで再起動する
+
+        1台のカメラの例外（デコードエラー・HTTPクライアントのエラーなど）で
+        他のカメラが止まらないよう、カメラごと・再送ごとに独立して再起動します。
+        タスクが正常に終了した場合（カメラの設定が不正など）は再起動しません。
+        """
+        backoff = Backoff(min_delay=1.0, max_delay=60.0)
+        loop = asyncio.get_running_loop()
+        while True:
+            started_at = loop.time()
+            try:
+                await factory()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if loop.time() - started_at >= SUPERVISOR_RESET_AFTER:
+                    backoff.reset()
+                delay = backoff.next_delay()
+                logger.exception(f"[{name}] 予期しないエラーで停止しました。{delay:.0f}秒後に再起動します")
+                await asyncio.sleep(delay)
+
+    async def run(self):
+        """全カメラのループを開始する"""
+        if self.config.edge_detect:
+            self.detector = await self._run_in(
+                self._inference, create_detector, self.config.backend, self.config.model
+            )
+
+        limits = httpx.Limits(
+            max_connections=self.config.max_connections,
+            max_keepalive_connections=self.config.max_connections,
+        )
+        async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+            self.client = client
+            logger.info("=" * 60)
+            logger.info(f"エッジエージェントを開始します: カメラ {len(self.config.cameras)}台, API URL: {self.api_url}")
+            logger.info(f"エッジ検出: {f'有効（{self.config.backend}）' if self.config.edge_detect else '無効'}")
+            if self.config.capture_processes:
+                logger.info("撮影: カメラごとの撮影プロセス（共有メモリのフレームリング）")
+            logger.info("=" * 60)
+            if self._drainer is not None:
+                self._drainer.start()
+            try:
+                # カメラごとに独立して再起動する（1台の例外で全カメラが止まらないように）
+                tasks = [
+                    self._supervise(camera.classroom_id, partial(self.run_camera, camera))
+                    for camera in self.config.cameras
+                ]
+                if any(camera.adaptive for camera in self.config.cameras):
+                    tasks.append(self._supervise("stats", self.log_stats))
+                await asyncio.gather(*tasks)
+            finally:
+                if self._drainer is not None:
+                    await self._run_in(self._camera_io, self._drainer.stop)
+                    self._replay_session.close()
+                if self.spool is not None:
+                    self.spool.close()
+                self._inference.shutdown(wait=False)
+                self._camera_io.shutdown(wait=False)
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description="複数カメラのエッジエージェント",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  python edge_agent.py --config edge_agent.json
+        """
+    )
+    parser.add_argument('--config', type=str, required=True, help='設定ファイル（JSONまたはYAML）')
+    args = parser.parse_args()
+
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        logger.error(f"設定ファイルを読み込めませんでした: {e}")
+        return 1
+
+    try:
+        asyncio.run(EdgeAgent(config).run())
+    except KeyboardInterrupt:
+        logger.info("\nエッジエージェントを終了します。")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
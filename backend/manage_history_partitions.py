@@ -0,0 +1,84 @@
+"""
+occupancy_history の月別パーティションの管理
+
+翌月以降のパーティションを事前に作成し、保存期間（HISTORY_RETENTION_MONTHS）を
+過ぎた月のパーティションを丸ごと削除します（DELETE は使わないため、テーブルと
+インデックスの肥大化・VACUUM の負荷がありません）。cron などで毎日実行してください。
+
+使用方法:
+    python manage_history_partitions.py                       # 設定どおりに作成・削除
+    python manage_history_partitions.py --dry-run             # 変更内容の確認のみ
+    python manage_history_partitions.py --retention-months 36 --months-ahead 6
+    python manage_history_partitions.py --list                # パーティションの一覧と行数
+
+cron の例（毎日 4:10）:
+    10 4 * * * cd /path/to/backend && python manage_history_partitions.py
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import text
+
+from config import settings
+from database.session import engine
+from services.history_partitions import DEFAULT_PARTITION, list_partitions, maintain
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _print_partitions(conn):
+    partitions = sorted(list_partitions(conn).items(), key=lambda item: item[1])
+    for name in [name for name, _ in partitions] + [DEFAULT_PARTITION]:
+        rows, size = conn.execute(text(
+            f"SELECT count(*), pg_size_pretty(pg_total_relation_size('{name}')) FROM {name}"
+        )).one()
+        print(f"  {name:<32} {rows:>10}行 {size:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="occupancy_history の月別パーティションの管理")
+    parser.add_argument('--retention-months', type=int, default=settings.history_retention_months,
+                        help=f'当月以外に保存する月数（0で削除しない、デフォルト: {settings.history_retention_months}）')
+    parser.add_argument('--months-ahead', type=int, default=settings.history_partition_months_ahead,
+                        help=f'事前に作成する月数（デフォルト: {settings.history_partition_months_ahead}）')
+    parser.add_argument('--dry-run', action='store_true', help='変更せずに内容を表示する')
+    parser.add_argument('--list', action='store_true', help='パーティションの一覧と行数を表示する')
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        logger.error("パーティションの管理は PostgreSQL でのみ使用できます")
+        sys.exit(1)
+
+    if args.list:
+        with engine.connect() as conn:
+            _print_partitions(conn)
+        return
+
+    with engine.begin() as conn:
+        result = maintain(
+            conn,
+            retention_months=args.retention_months,
+            months_ahead=args.months_ahead,
+            dry_run=args.dry_run,
+        )
+    prefix = "（dry-run）" if args.dry_run else ""
+    for name in result["created"]:
+        logger.info(f"{prefix}作成: {name}")
+    for name in result["dropped"]:
+        logger.info(f"{prefix}削除: {name}")
+    if not result["created"] and not result["dropped"]:
+        logger.info("変更はありません")
+
+
+if __name__ == "__main__":
+    main()
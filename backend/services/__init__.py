@@ -0,0 +1,19 @@
+"""
+Application services shared by the API routes and the camera scripts
+"""
+from .classroom_ids import ClassroomIdCache, classroom_ids
+from .history_buffer import HistoryBuffer, history_buffer
+from .occupancy_filter import OccupancyFilter, occupancy_filter
+from .occupancy_writer import OccupancyWriter, Reading, occupancy_writer
+
+__all__ = [
+    "ClassroomIdCache",
+    "classroom_ids",
+    "HistoryBuffer",
+    "history_buffer",
+    "OccupancyFilter",
+    "occupancy_filter",
+    "OccupancyWriter",
+    "Reading",
+    "occupancy_writer",
+]
@@ -0,0 +1,55 @@
+"""
+Cached set of known classroom IDs
+
+Bulk ingestion validates every reading's classroom_id; instead of querying the
+classrooms table per request, the IDs are cached for ``ttl`` seconds. IDs that
+are not in the cache are looked up once (a classroom created since the last load),
+and the classroom routes invalidate the cache when classrooms are added or removed.
+"""
+import threading
+import time
+from typing import Iterable, Optional, Set
+
+from sqlalchemy import String, column, select, table
+
+classrooms_table = table("classrooms", column("id", String))
+
+
+class ClassroomIdCache:
+    """Known classroom IDs, reloaded every ``ttl`` seconds"""
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids: Set[str] = set()
+        self._loaded_at: Optional[float] = None
+
+    def invalidate(self):
+        """Reload on the next lookup"""
+        with self._lock:
+            self._loaded_at = None
+
+    def known(self, db, classroom_ids: Iterable[str]) -> Set[str]:
+        """
+        The subset of ``classroom_ids`` that exist
+
+        Args:
+            db: SQLAlchemy Session or Connection
+            classroom_ids: IDs to check
+        """
+        wanted = set(classroom_ids)
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._ids = set(db.execute(select(classrooms_table.c.id)).scalars())
+                self._loaded_at = time.monotonic()
+            missing = wanted - self._ids
+            if missing:
+                found = set(db.execute(
+                    select(classrooms_table.c.id).where(classrooms_table.c.id.in_(missing))
+                ).scalars())
+                self._ids |= found
+            return wanted & self._ids
+
+
+# Shared cache (TTL set from settings by the occupancy routes)
+classroom_ids = ClassroomIdCache()
@@ -0,0 +1,227 @@
+"""
+Write-behind buffer for occupancy_history
+
+With the buffer running, :class:`~services.occupancy_writer.OccupancyWriter` only
+upserts ``occupancy`` inside the request transaction and hands the history rows
+to :class:`HistoryBuffer` once that transaction commits. A background thread inserts them in batches every
+``flush_rows`` rows or ``flush_interval`` seconds with
+:meth:`~services.occupancy_writer.OccupancyWriter.write_history` (on PostgreSQL one
+``INSERT ... SELECT FROM unnest(...)`` per batch, so the whole batch is a single
+statement; ``ON CONFLICT DO NOTHING`` keeps replayed readings idempotent).
+
+The buffer is given its own engine (see ``database.session.create_dedicated_engine``)
+so flushes never hold the request handlers' pooled connection.
+
+Loss is bounded: at most ``max_rows`` rows wait in memory. Beyond that the oldest
+rows are dropped, and rows still buffered when the process is killed (rather than
+shut down through the app lifespan, which flushes) are lost. On connection errors
+(``OperationalError``, ``InterfaceError``, pool timeouts) the batch is put back and
+retried on the next flush. Any other failure means some row is bad (out of range,
+constraint violation, ...): the batch is then retried row by row in one
+transaction, each row under a SAVEPOINT, and only the rows the database rejects are
+dropped. Readings for unknown classrooms are skipped.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Sequence
+
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from .occupancy_writer import Reading, occupancy_writer
+
+logger = logging.getLogger(__name__)
+
+# Failures of the connection rather than of the rows: the batch is retried later
+_TRANSIENT_ERRORS = (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError)
+
+
+class HistoryBuffer:
+    """Batches occupancy_history rows and inserts them from a background thread"""
+
+    def __init__(self, flush_rows: int = 500, flush_interval: float = 1.0, max_rows: int = 50000):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self._bind = None
+        self._rows: deque = deque()
+        self._cond = threading.Condition()
+        # Serializes flushes (background thread vs. shutdown)
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._rejected = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._flush_times = deque(maxlen=256)
+        self._last_flush_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, bind):
+        """
+        Start the flush thread
+
+        Args:
+            bind: SQLAlchemy Engine the history rows are written with (a dedicated
+                engine, not the one request handlers use)
+        """
+        if self.running:
+            return
+        self._bind = bind
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="history-buffer", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"History write-behind buffer started "
+            f"(flush every {self.flush_rows} rows / {self.flush_interval:.1f}s, max {self.max_rows} rows)"
+        )
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flush thread and write everything still buffered"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+        with self._cond:
+            lost = len(self._rows)
+            self._rows.clear()
+            self._dropped += lost
+        if lost:
+            logger.error(f"History buffer stopped with {lost} unwritten rows (dropped)")
+        else:
+            logger.info("History write-behind buffer stopped")
+
+    def add(self, rows: Sequence[Reading]):
+        """
+        Queue history rows (readings with capture time and camera_id resolved)
+
+        Never blocks on the database; drops the oldest rows when the buffer is full.
+        """
+        if not rows:
+            return
+        with self._cond:
+            self._rows.extend(rows)
+            self._enqueued += len(rows)
+            overflow = len(self._rows) - self.max_rows
+            if overflow > 0:
+                for _ in range(overflow):
+                    self._rows.popleft()
+                self._dropped += overflow
+                logger.warning(f"History buffer full ({self.max_rows} rows): dropped the {overflow} oldest")
+            if len(self._rows) >= self.flush_rows:
+                self._cond.notify()
+
+    def flush(self) -> int:
+        """
+        Write the buffered rows now
+
+        Returns:
+            Number of rows written
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._rows)
+                self._rows.clear()
+            if not batch or self._bind is None:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                written = self._write(batch)
+            except _TRANSIENT_ERRORS as e:
+                # Connection problems: put the batch back (oldest first) and retry later
+                with self._cond:
+                    self._rows.extendleft(reversed(batch))
+                    overflow = len(self._rows) - self.max_rows
+                    for _ in range(max(0, overflow)):
+                        self._rows.popleft()
+                    self._dropped += max(0, overflow)
+                    self._failed_flushes += 1
+                logger.error(f"History flush failed ({len(batch)} rows kept for retry): {e}")
+                return 0
+
+            elapsed = time.perf_counter() - start
+            with self._cond:
+                self._written += written
+                self._flushes += 1
+                self._flush_times.append(elapsed)
+                self._last_flush_at = time.time()
+            logger.debug(f"History flush: {written} rows in {elapsed * 1000:.1f}ms")
+            return written
+
+    def _write(self, batch: List[Reading]) -> int:
+        try:
+            with self._bind.begin() as conn:
+                occupancy_writer.write_history(conn, batch)
+            return len(batch)
+        except _TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            logger.warning(f"History batch of {len(batch)} rows failed, retrying row by row: {e}")
+        # One bad row must not cost the whole batch (or block the buffer): write the
+        # rows one by one in a single transaction and roll back only the rejected ones
+        written = 0
+        rejected = 0
+        with self._bind.begin() as conn:
+            for row in batch:
+                try:
+                    with conn.begin_nested():
+                        occupancy_writer.write_history(conn, [row])
+                    written += 1
+                except _TRANSIENT_ERRORS:
+                    raise
+                except Exception as e:
+                    rejected += 1
+                    logger.warning(
+                        f"History row for {row.classroom_id} at {row.captured_at} rejected: {getattr(e, 'orig', e)}"
+                    )
+        with self._cond:
+            self._rejected += rejected
+        return written
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._rows) < self.flush_rows:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            self.flush()
+
+    def metrics(self) -> dict:
+        """Buffer depth, flush latency and row counters"""
+        with self._cond:
+            times = list(self._flush_times)
+            return {
+                "running": self.running,
+                "depth": len(self._rows),
+                "max_rows": self.max_rows,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "dropped": self._dropped,
+                "rejected": self._rejected,
+                "flushes": self._flushes,
+                "failed_flushes": self._failed_flushes,
+                "flush_time": {
+                    "avg_ms": round(sum(times) / len(times) * 1000, 1) if times else 0.0,
+                    "max_ms": round(max(times) * 1000, 1) if times else 0.0,
+                },
+                "last_flush_age": round(time.time() - self._last_flush_at, 1) if self._last_flush_at else None,
+            }
+
+
+# Shared buffer (configured and started from the app lifespan when HISTORY_BUFFER_ENABLED)
+history_buffer = HistoryBuffer()
@@ -0,0 +1,140 @@
+"""
+Monthly partitions of occupancy_history (PostgreSQL)
+
+``occupancy_history`` is range-partitioned on ``timestamp`` with one partition per
+month (``occupancy_history_2026_04`` covers April 2026) and a default partition
+that catches rows outside the prepared months. :func:`maintain` keeps the table in
+shape and is meant to run daily or monthly (``manage_history_partitions.py``):
+
+- Partitions for the coming months are created ahead of time. A new month is
+  created as a plain table and attached (``ATTACH PARTITION`` only takes a SHARE
+  UPDATE EXCLUSIVE lock, so ingestion keeps running); rows that landed in the
+  default partition for that month are moved into it first.
+- Months older than the retention period are dropped as whole tables instead of
+  being DELETEd, so removing a month of history costs no vacuum and no index bloat.
+"""
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+PARENT = "occupancy_history"
+DEFAULT_PARTITION = f"{PARENT}_default"
+_PARTITION_NAME = re.compile(rf"^{PARENT}_(\d{{4}})_(\d{{2}})$")
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """Partition table for the month containing ``month``"""
+    return f"{PARENT}_{month.year:04d}_{month.month:02d}"
+
+
+def list_partitions(conn) -> Dict[str, date]:
+    """Monthly partitions currently attached (name -> first day of the month)"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent)"
+    ), {"parent": PARENT}).scalars()
+    partitions = {}
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = date(int(match.group(1)), int(match.group(2)), 1)
+    return partitions
+
+
+def ensure_default_partition(conn):
+    """Create the default partition if it is missing"""
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"
+    ))
+
+
+def create_partition(conn, month: date) -> str:
+    """
+    Create and attach the partition for ``month``
+
+    Rows already in the default partition for that month are moved into the new
+    partition before it is attached.
+    """
+    name = partition_name(month)
+    start = month.replace(day=1)
+    end = _add_months(start, 1)
+    # Month boundaries in UTC
+    bounds = {"start": f"{start.isoformat()} 00:00:00+00", "end": f"{end.isoformat()} 00:00:00+00"}
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(
+        f"WITH moved AS ("
+        f"  DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= CAST(:start AS timestamptz) "
+        f"  AND timestamp < CAST(:end AS timestamptz) RETURNING *"
+        f") INSERT INTO {name} SELECT * FROM moved"
+    ), bounds).rowcount
+    conn.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    ))
+    if moved:
+        logger.info(f"Moved {moved} rows from {DEFAULT_PARTITION} into {name}")
+    return name
+
+
+def maintain(
+    conn,
+    retention_months: int,
+    months_ahead: int = 3,
+    today: Optional[date] = None,
+    dry_run: bool = False,
+) -> Dict[str, List[str]]:
+    """
+    Create upcoming monthly partitions and drop expired ones
+
+    Args:
+        conn: SQLAlchemy Connection (the caller commits)
+        retention_months: Months of history to keep besides the current one
+            (0 = keep everything)
+        months_ahead: Months to prepare after the current one
+        today: Reference date (default: today in UTC)
+        dry_run: Only report what would change
+
+    Returns:
+        {"created": [...], "dropped": [...]} partition names
+    """
+    today = today or datetime.now(timezone.utc).date()
+    current = today.replace(day=1)
+    if not dry_run:
+        ensure_default_partition(conn)
+    existing = list_partitions(conn)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = _add_months(current, offset)
+        name = partition_name(month)
+        if name not in existing:
+            if not dry_run:
+                create_partition(conn, month)
+            created.append(name)
+
+    dropped = []
+    if retention_months > 0:
+        cutoff = _add_months(current, -retention_months)
+        for name, month in sorted(existing.items(), key=lambda item: item[1]):
+            if month < cutoff:
+                if not dry_run:
+                    conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+        if not dry_run:
+            # Stragglers in the default partition (rows older than any monthly partition)
+            conn.execute(text(
+                f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < CAST(:cutoff AS timestamptz)"
+            ), {"cutoff": f"{cutoff.isoformat()} 00:00:00+00"})
+
+    return {"created": created, "dropped": dropped}
@@ -0,0 +1,143 @@
+"""
+Per-classroom smoothing and deadband for occupancy readings
+
+Detector counts flicker from frame to frame (12, 13, 12, 12, ...). Written as-is,
+every reading rewrites ``occupancy`` and appends to ``occupancy_history``.
+:class:`OccupancyFilter` sits in front of :class:`~services.occupancy_writer.OccupancyWriter`:
+
+- The count is smoothed with a running median over the last ``window`` readings.
+- The published count only moves when the smoothed count is at least ``deadband``
+  away from it, or when the room changes between empty and occupied (hysteresis:
+  a count hovering at the edge of the band does not toggle).
+- ``occupancy`` is written at change points and at least every ``max_age`` seconds,
+  which keeps ``last_updated`` fresh (the UI treats 30 s without updates as offline).
+- ``occupancy_history`` gets a row at change points and at least every ``heartbeat``
+  seconds.
+
+Ages are measured on the readings' capture times, so replayed readings are
+filtered the same way as live ones. Readings older than the newest one seen for
+the classroom (late spool replays) bypass the filter. The state is per process
+and is updated before the caller commits; when a classroom's readings are all
+suppressed but it has no stored row (that transaction rolled back), the writer
+writes the newest reading anyway.
+"""
+import threading
+from collections import deque
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from statistics import median_low
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from .occupancy_writer import Reading
+
+
+@dataclass
+class _ClassroomState:
+    published: int
+    last_seen: datetime
+    current_at: datetime
+    history_at: datetime
+    window: Deque[int] = field(default_factory=deque)
+
+
+class OccupancyFilter:
+    """Decides which readings are written to ``occupancy`` and ``occupancy_history``"""
+
+    def __init__(self, window: int = 3, deadband: int = 2, max_age: float = 20.0, heartbeat: float = 300.0):
+        self.window = window
+        self.deadband = deadband
+        self.max_age = max_age
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._states: Dict[str, _ClassroomState] = {}
+        self._readings = 0
+        self._current_writes = 0
+        self._history_writes = 0
+        self._changes = 0
+
+    def forget(self, classroom_id: str):
+        """Drop a classroom's state (its next reading is written as-is)"""
+        with self._lock:
+            self._states.pop(classroom_id, None)
+
+    def published(self, classroom_id: str) -> Optional[int]:
+        """The classroom's published count (None before its first reading)"""
+        with self._lock:
+            state = self._states.get(classroom_id)
+            return state.published if state is not None else None
+
+    def _is_change(self, smoothed: int, published: int) -> bool:
+        if smoothed == published:
+            return False
+        if (smoothed == 0) != (published == 0):
+            return True
+        return abs(smoothed - published) >= self.deadband
+
+    def apply(self, readings: Sequence[Reading]) -> List[Tuple[Reading, bool]]:
+        """
+        Filter readings (capture times must be set)
+
+        Returns:
+            (reading to write, whether to record history) for the readings that should
+            be written, with the count replaced by the published (smoothed) count.
+            Readings not in the list only refresh the filter state.
+        """
+        written: List[Tuple[Reading, bool]] = []
+        with self._lock:
+            for reading in sorted(readings, key=lambda r: r.captured_at):
+                self._readings += 1
+                state = self._states.get(reading.classroom_id)
+                if state is None:
+                    self._states[reading.classroom_id] = _ClassroomState(
+                        published=reading.count,
+                        last_seen=reading.captured_at,
+                        current_at=reading.captured_at,
+                        history_at=reading.captured_at,
+                        window=deque([reading.count], maxlen=self.window),
+                    )
+                    written.append((reading, True))
+                    continue
+                if reading.captured_at <= state.last_seen:
+                    # Late reading: history only (the writer keeps the newer state)
+                    written.append((reading, True))
+                    continue
+
+                state.last_seen = reading.captured_at
+                state.window.append(reading.count)
+                smoothed = median_low(state.window)
+                if self._is_change(smoothed, state.published):
+                    state.published = smoothed
+                    self._changes += 1
+                    record_history = True
+                elif (reading.captured_at - state.current_at).total_seconds() >= self.max_age:
+                    record_history = (reading.captured_at - state.history_at).total_seconds() >= self.heartbeat
+                else:
+                    continue
+                state.current_at = reading.captured_at
+                if record_history:
+                    state.history_at = reading.captured_at
+                written.append((replace(reading, count=state.published), record_history))
+
+            self._current_writes += len(written)
+            self._history_writes += sum(1 for _, record_history in written if record_history)
+        return written
+
+    def metrics(self) -> dict:
+        """Readings seen vs. rows written (compression = readings / rows)"""
+        with self._lock:
+            return {
+                "window": self.window,
+                "deadband": self.deadband,
+                "classrooms": len(self._states),
+                "readings": self._readings,
+                "changes": self._changes,
+                "occupancy_writes": self._current_writes,
+                "history_writes": self._history_writes,
+                "occupancy_compression": round(self._readings / self._current_writes, 2) if self._current_writes else None,
+                "history_compression": round(self._readings / self._history_writes, 2) if self._history_writes else None,
+            }
+
+
+# Shared filter (configured and attached to occupancy_writer from the app lifespan
+# when OCCUPANCY_FILTER_ENABLED)
+occupancy_filter = OccupancyFilter()
@@ -0,0 +1,390 @@
+"""
+Occupancy ingestion: one upsert per reading (or batch of readings)
+
+Every writer of camera readings (the camera and occupancy routes, CameraProcessor
+and capture_camera_direct.py) goes through :class:`OccupancyWriter`. The current
+state is written with ``INSERT ... ON CONFLICT (classroom_id) DO UPDATE ...
+RETURNING`` and the history rows with ``INSERT ... ON CONFLICT (classroom_key,
+timestamp) DO NOTHING``.
+On PostgreSQL both run as a single statement (data-modifying CTEs), so a reading
+costs one round trip and concurrent uploads for a new classroom cannot race on
+the unique ``classroom_id``.
+
+Rules shared by all writers:
+
+- A reading older than the stored ``last_updated`` (e.g. replayed from an edge
+  spool) goes into history but does not overwrite the current state.
+- History rows are unique per classroom and capture time, so replaying a reading
+  is a no-op.
+- ``camera_id`` is kept when a reading does not carry one.
+
+With a filter attached (:mod:`services.occupancy_filter`), readings are smoothed
+first and only the change points and periodic refreshes are written.
+
+When the write-behind buffer (:mod:`services.history_buffer`) is attached, only
+``occupancy`` is written in the caller's transaction and the history rows are
+queued for batched insertion instead. The rows wait in ``Session.info`` and are
+handed to the buffer from the session's ``after_commit`` event, so a transaction
+that rolls back (or fails to commit) leaves no history behind. Writes through a
+plain Connection have no such hook and keep writing history inline.
+
+The tables are declared as lightweight Core constructs so this module can be used
+without the application settings (capture_camera_direct.py has its own engine).
+The caller owns the transaction and commits.
+"""
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, Float, Integer, String, bindparam, column, event, func, select, table, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+
+occupancy_table = table(
+    "occupancy",
+    column("id", String),
+    column("classroom_id", String),
+    column("current_count", Integer),
+    column("detection_confidence", Float),
+    column("last_updated", DateTime(timezone=True)),
+    column("camera_id", String),
+)
+
+# History rows reference the classroom by its smallint short_id
+history_table = table(
+    "occupancy_history",
+    column("id", Integer),
+    column("classroom_key", Integer),
+    column("timestamp", DateTime(timezone=True)),
+    column("count", Integer),
+    column("detection_confidence", Float),
+    column("camera_id", String),
+)
+
+classrooms_table = table("classrooms", column("id", String), column("short_id", Integer))
+
+_RETURNED = (
+    occupancy_table.c.id,
+    occupancy_table.c.classroom_id,
+    occupancy_table.c.current_count,
+    occupancy_table.c.detection_confidence,
+    occupancy_table.c.last_updated,
+    occupancy_table.c.camera_id,
+)
+
+# PostgreSQL: the readings arrive as parallel arrays, so the statement text is the
+# same for any batch size (prepared/cached once). History is written by a
+# data-modifying CTE (joined to classrooms for the short key, which also skips
+# readings for unknown classrooms); the upsert takes the newest reading per classroom because
+# ON CONFLICT DO UPDATE may not touch the same row twice in one statement.
+_POSTGRES_READINGS = """
+WITH readings AS (
+    SELECT * FROM unnest(
+        CAST(:classroom_ids AS text[]),
+        CAST(:counts AS integer[]),
+        CAST(:confidences AS double precision[]),
+        CAST(:captured_at AS timestamptz[]),
+        CAST(:camera_ids AS text[]),
+        CAST(:record_history AS boolean[])
+    ) AS r (classroom_id, count, confidence, captured_at, camera_id, record_history)
+)
+"""
+
+_POSTGRES_HISTORY = """
+INSERT INTO occupancy_history (classroom_key, timestamp, count, detection_confidence, camera_id)
+SELECT c.short_id, r.captured_at, r.count, r.confidence, COALESCE(r.camera_id, o.camera_id)
+FROM readings r
+JOIN classrooms c ON c.id = r.classroom_id
+LEFT JOIN occupancy o ON o.classroom_id = r.classroom_id
+WHERE r.record_history
+ON CONFLICT (classroom_key, timestamp) DO NOTHING
+"""
+
+_POSTGRES_UPSERT = """
+INSERT INTO occupancy AS o (id, classroom_id, current_count, detection_confidence, last_updated, camera_id)
+SELECT DISTINCT ON (classroom_id) 'occ_' || classroom_id, classroom_id, count, confidence, captured_at, camera_id
+FROM readings
+ORDER BY classroom_id, captured_at DESC
+ON CONFLICT (classroom_id) DO UPDATE SET
+    current_count = EXCLUDED.current_count,
+    detection_confidence = EXCLUDED.detection_confidence,
+    last_updated = EXCLUDED.last_updated,
+    camera_id = COALESCE(EXCLUDED.camera_id, o.camera_id)
+WHERE o.last_updated IS NULL OR o.last_updated <= EXCLUDED.last_updated
+RETURNING o.id, o.classroom_id, o.current_count, o.detection_confidence, o.last_updated, o.camera_id
+"""
+
+_POSTGRES_WRITE = text(_POSTGRES_READINGS + ", history AS (" + _POSTGRES_HISTORY + ")" + _POSTGRES_UPSERT)
+# History goes to the write-behind buffer
+_POSTGRES_WRITE_CURRENT = text(_POSTGRES_READINGS + _POSTGRES_UPSERT)
+# History only (write-behind buffer flushes)
+_POSTGRES_WRITE_HISTORY = text(_POSTGRES_READINGS + _POSTGRES_HISTORY)
+
+
+def _sqlite_statements():
+    """(history insert, occupancy upsert) run with executemany (one row per reading)"""
+    # SQLite has no identity column for the composite (id, timestamp) key: ids are
+    # numbered in the statement (SQLite is only used for local benchmarks)
+    history = sqlite.insert(history_table).from_select(
+        ["id", "classroom_key", "timestamp", "count", "detection_confidence", "camera_id"],
+        select(
+            select(func.coalesce(func.max(history_table.c.id), 0) + 1).scalar_subquery(),
+            classrooms_table.c.short_id,
+            bindparam("captured_at", type_=DateTime(timezone=True)),
+            bindparam("count", type_=Integer),
+            bindparam("confidence", type_=Float),
+            func.coalesce(
+                bindparam("camera_id", type_=String),
+                select(occupancy_table.c.camera_id)
+                .where(occupancy_table.c.classroom_id == bindparam("classroom_id"))
+                .scalar_subquery(),
+            ),
+        ).where(classrooms_table.c.id == bindparam("classroom_id")),
+    ).on_conflict_do_nothing(index_elements=[history_table.c.classroom_key, history_table.c.timestamp])
+
+    stmt = sqlite.insert(occupancy_table).values(
+        id=bindparam("occupancy_id"),
+        classroom_id=bindparam("classroom_id"),
+        current_count=bindparam("count"),
+        detection_confidence=bindparam("confidence"),
+        last_updated=bindparam("captured_at"),
+        camera_id=bindparam("camera_id", type_=String),
+    )
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[occupancy_table.c.classroom_id],
+        set_={
+            "current_count": stmt.excluded.current_count,
+            "detection_confidence": stmt.excluded.detection_confidence,
+            "last_updated": stmt.excluded.last_updated,
+            "camera_id": func.coalesce(stmt.excluded.camera_id, occupancy_table.c.camera_id),
+        },
+        # Stale readings leave the current state alone
+        where=(occupancy_table.c.last_updated.is_(None))
+        | (occupancy_table.c.last_updated <= stmt.excluded.last_updated),
+    ).returning(*_RETURNED)
+    return history, upsert
+
+
+_SQLITE_HISTORY, _SQLITE_UPSERT = _sqlite_statements()
+
+
+# Session.info key of the history rows waiting for the session to commit:
+# a list of (HistoryBuffer, rows)
+_PENDING_HISTORY = "occupancy_writer.pending_history"
+
+
+@event.listens_for(Session, "after_commit")
+def _hand_over_history(session):
+    for buffer, rows in session.info.pop(_PENDING_HISTORY, []):
+        buffer.add(rows)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_history(session, transaction):
+    # The outermost transaction ended without committing (rollback or close)
+    if transaction.parent is None:
+        session.info.pop(_PENDING_HISTORY, None)
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Normalize a timestamp (naive values are treated as UTC)"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+@dataclass
+class Reading:
+    """One occupancy reading"""
+    classroom_id: str
+    count: int
+    confidence: float
+    # When the frame was captured (None = now)
+    captured_at: Optional[datetime] = None
+    camera_id: Optional[str] = None
+
+    def __post_init__(self):
+        if self.captured_at is not None:
+            self.captured_at = _as_utc(self.captured_at)
+
+    @property
+    def history_key(self) -> Tuple[str, datetime]:
+        """Identifies the reading's history row (unique per classroom and capture time)"""
+        return self.classroom_id, self.captured_at
+
+
+def _postgres_params(readings: Sequence[Reading], skip_history) -> dict:
+    return {
+        "classroom_ids": [r.classroom_id for r in readings],
+        "counts": [r.count for r in readings],
+        "confidences": [r.confidence for r in readings],
+        "captured_at": [r.captured_at for r in readings],
+        "camera_ids": [r.camera_id for r in readings],
+        "record_history": [r.history_key not in skip_history for r in readings],
+    }
+
+
+def _sqlite_params(readings: Sequence[Reading]) -> List[dict]:
+    return [
+        {
+            "occupancy_id": f"occ_{r.classroom_id}",
+            "classroom_id": r.classroom_id,
+            "count": r.count,
+            "confidence": r.confidence,
+            "captured_at": r.captured_at,
+            "camera_id": r.camera_id,
+        }
+        for r in readings
+    ]
+
+
+class OccupancyWriter:
+    """Write readings to ``occupancy`` and ``occupancy_history``"""
+
+    def __init__(self, history_buffer=None, filter=None):
+        # services.history_buffer.HistoryBuffer; history is written inline unless it is running
+        self.history_buffer = history_buffer
+        # services.occupancy_filter.OccupancyFilter; every reading is written without one
+        self.filter = filter
+
+    def _prepare(self, readings: Sequence[Reading]) -> List[Reading]:
+        """Fill in capture times and drop readings whose history row repeats"""
+        now = datetime.now(timezone.utc)
+        prepared: Dict[Tuple[str, datetime], Reading] = {}
+        for r in readings:
+            reading = Reading(
+                classroom_id=r.classroom_id,
+                count=int(r.count),
+                confidence=float(r.confidence),
+                captured_at=r.captured_at or now,
+                camera_id=r.camera_id,
+            )
+            prepared.setdefault(reading.history_key, reading)
+        return list(prepared.values())
+
+    def write_many(self, db, readings: Sequence[Reading]) -> Dict[str, dict]:
+        """
+        Write readings for any number of classrooms
+
+        Args:
+            db: SQLAlchemy Session or Connection (the caller commits)
+            readings: Readings; several per classroom are allowed (all go to history)
+
+        Returns:
+            Dict of classroom_id -> current occupancy row (id, classroom_id, current_count,
+            detection_confidence, last_updated, camera_id, applied, filtered). ``applied``
+            is False when the reading was older than the stored state or was suppressed by
+            the filter (``filtered``).
+
+        Raises:
+            ValueError: The database is neither PostgreSQL nor SQLite
+        """
+        if not readings:
+            return {}
+        readings = self._prepare(readings)
+        if self.filter is not None:
+            readings, skip_history, suppressed = self._filter(db, readings)
+        else:
+            skip_history, suppressed = set(), {}
+        if not readings:
+            return suppressed
+        # The buffer only takes rows once the caller commits, which needs a Session
+        buffered = self.history_buffer is not None and self.history_buffer.running and isinstance(db, Session)
+        bind = db.get_bind() if hasattr(db, "get_bind") else db
+        dialect = bind.dialect.name
+
+        if dialect == "postgresql":
+            rows = db.execute(
+                _POSTGRES_WRITE_CURRENT if buffered else _POSTGRES_WRITE,
+                _postgres_params(readings, skip_history),
+            ).mappings().all()
+        elif dialect == "sqlite":
+            # executemany keeps the compiled statements cached for any batch size
+            # (SQLAlchemy sends the RETURNING upsert as multi-row INSERTs)
+            readings = sorted(readings, key=lambda r: r.captured_at)
+            history = [r for r in readings if r.history_key not in skip_history]
+            if history and not buffered:
+                db.execute(_SQLITE_HISTORY, _sqlite_params(history))
+            # SQLite applies the rows in order (oldest first), so a classroom may
+            # come back more than once; the newest row is its current state
+            rows = db.execute(_SQLITE_UPSERT, _sqlite_params(readings)).mappings().all()
+        else:
+            raise ValueError(f"OccupancyWriter does not support the {dialect} dialect")
+
+        results: Dict[str, dict] = {}
+        for row in rows:
+            previous = results.get(row["classroom_id"])
+            if previous is None or row["last_updated"] >= previous["last_updated"]:
+                results[row["classroom_id"]] = {**row, "applied": True, "filtered": False}
+        written = {r.classroom_id for r in readings}
+        # Stale readings: return the state they did not overwrite
+        missing = written - results.keys()
+        if missing:
+            results.update(self._current(db, missing, filtered=False))
+        # Readings the filter suppressed
+        results.update(suppressed)
+        if buffered:
+            db.info.setdefault(_PENDING_HISTORY, []).append((self.history_buffer, [
+                replace(r, camera_id=r.camera_id or results.get(r.classroom_id, {}).get("camera_id"))
+                for r in readings
+                if r.history_key not in skip_history
+            ]))
+        return results
+
+    def _filter(self, db, readings: List[Reading]) -> Tuple[List[Reading], set, Dict[str, dict]]:
+        """
+        Run readings through the filter
+
+        Returns:
+            (readings to write, history keys not to record, stored rows of the
+            classrooms whose readings were all suppressed)
+        """
+        decisions = self.filter.apply(readings)
+        written = {reading.classroom_id for reading, _ in decisions}
+        suppressed = {r.classroom_id for r in readings} - written
+        stored = self._current(db, suppressed, filtered=True) if suppressed else {}
+        # The filter state is updated before the caller commits. If that transaction
+        # rolled back, a classroom can have filter state but no stored row: write its
+        # newest reading (at the published count) instead of suppressing it
+        for classroom_id in suppressed - stored.keys():
+            newest = max((r for r in readings if r.classroom_id == classroom_id), key=lambda r: r.captured_at)
+            published = self.filter.published(classroom_id)
+            decisions.append((replace(newest, count=newest.count if published is None else published), True))
+        skip_history = {reading.history_key for reading, record in decisions if not record}
+        return [reading for reading, _ in decisions], skip_history, stored
+
+    def _current(self, db, classroom_ids, filtered: bool) -> Dict[str, dict]:
+        """Stored rows for classrooms whose readings were not applied"""
+        rows = db.execute(
+            select(*_RETURNED).where(occupancy_table.c.classroom_id.in_(classroom_ids))
+        ).mappings().all()
+        return {row["classroom_id"]: {**row, "applied": False, "filtered": filtered} for row in rows}
+
+    def write(self, db, reading: Reading) -> Optional[dict]:
+        """
+        Write one reading
+
+        Returns:
+            The classroom's current occupancy row (see :meth:`write_many`), or None
+            if the classroom has no stored row
+        """
+        return self.write_many(db, [reading]).get(reading.classroom_id)
+
+    def write_history(self, db, readings: Sequence[Reading]):
+        """
+        Insert history rows only (capture times must be set; used by the write-behind buffer)
+
+        Raises:
+            ValueError: The database is neither PostgreSQL nor SQLite
+        """
+        dialect = (db.get_bind() if hasattr(db, "get_bind") else db).dialect.name
+        if dialect == "postgresql":
+            db.execute(_POSTGRES_WRITE_HISTORY, _postgres_params(readings, set()))
+        elif dialect == "sqlite":
+            db.execute(_SQLITE_HISTORY, _sqlite_params(readings))
+        else:
+            raise ValueError(f"OccupancyWriter does not support the {dialect} dialect")
+
+
+# Shared writer
+occupancy_writer = OccupancyWriter()
@@ -12,6 +12,7 @@ APIエンドポイントにPOST送信することで、仮想ラズパイとし
     --random: ランダムに画像を選択（デフォルト: 順番に）
     --classroom-id: 特定の教室IDを指定（デフォルト: ランダム）
     --api-url: APIのベースURL（デフォルト: http://localhost:8000）
+    --max-size: 送信前に長辺をこのピクセル数まで縮小して再エンコード（デフォルト: 0 = そのまま送信）
 """
 import argparse
 import time
@@ -91,10 +92,47 @@ def get_all_classroom_dirs(sample_dir: Path) -> List[str]:
     return sorted(classroom_ids)
 
 
+def load_image_bytes(image_path: Path, max_size: int = 0) -> bytes:
+    """
+    送信する画像のバイトデータを読み込む
+    
+    max_size を指定した場合、長辺が max_size より大きい画像は縮小してJPEGに
+    再エンコードします（JPEGはDCT領域で1/2・1/4・1/8に縮小してデコードするため、
+    大きな写真でもフル解像度のデコードは行いません）。
+    
+    Args:
+        image_path: 画像ファイルのパス
+        max_size: 送信する画像の長辺の上限（0 = そのまま）
+    """
+    data = image_path.read_bytes()
+    if max_size <= 0:
+        return data
+    
+    # 縮小するときだけOpenCVを読み込む
+    import cv2
+    from camera import codec
+    
+    decoded = codec.decode(data, min_size=max_size)
+    if decoded is None:
+        logger.warning(f"画像を読み込めないため、そのまま送信します: {image_path.name}")
+        return data
+    if max(decoded.shape[:2]) <= max_size:
+        return data
+    
+    image = decoded.image
+    h, w = image.shape[:2]
+    factor = max_size / max(h, w)
+    if factor < 1.0:
+        image = cv2.resize(image, (round(w * factor), round(h * factor)), interpolation=cv2.INTER_AREA)
+    encoded = codec.encode(image, quality=85)
+    return encoded if encoded is not None else data
+
+
 def send_image_to_api(
     image_path: Path,
     classroom_id: str,
-    api_url: str = "http://localhost:8000"
+    api_url: str = "http://localhost:8000",
+    max_size: int = 0
 ) -> bool:
     """
     画像をAPIエンドポイントに送信
@@ -103,6 +141,7 @@ def send_image_to_api(
         image_path: 送信する画像ファイルのパス
         classroom_id: 教室ID
         api_url: APIのベースURL
+        max_size: 送信する画像の長辺の上限（0 = そのまま）
         
     Returns:
         成功した場合True、失敗した場合False
@@ -110,25 +149,24 @@ def send_image_to_api(
     try:
         url = f"{api_url}/api/v1/camera/detect"
         
-        with open(image_path, 'rb') as f:
-            files = {'file': (image_path.name, f, 'image/jpeg')}
-            data = {'classroom_id': classroom_id}
-            
-            logger.info(f"画像を送信しています: {image_path.name} -> 教室ID: {classroom_id}")
-            response = requests.post(url, files=files, data=data, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(
-                    f"✓ 送信成功 - 教室ID: {result['classroom_id']}, "
-                    f"人数: {result['person_count']}, "
-                    f"信頼度: {result['confidence']:.2f}, "
-                    f"画像URL: {result['image_url']}"
-                )
-                return True
-            else:
-                logger.error(f"✗ 送信失敗 - ステータスコード: {response.status_code}, レスポンス: {response.text}")
-                return False
+        files = {'file': (image_path.name, load_image_bytes(image_path, max_size), 'image/jpeg')}
+        data = {'classroom_id': classroom_id}
+        
+        logger.info(f"画像を送信しています: {image_path.name} -> 教室ID: {classroom_id}")
+        response = requests.post(url, files=files, data=data, timeout=30)
+        
+        if response.status_code == 200:
+            result = response.json()
+            logger.info(
+                f"✓ 送信成功 - 教室ID: {result['classroom_id']}, "
+                f"人数: {result['person_count']}, "
+                f"信頼度: {result['confidence']:.2f}, "
+                f"画像URL: {result['image_url']}"
+            )
+            return True
+        else:
+            logger.error(f"✗ 送信失敗 - ステータスコード: {response.status_code}, レスポンス: {response.text}")
+            return False
                 
     except requests.exceptions.ConnectionError:
         logger.error(f"✗ APIサーバーに接続できません: {api_url}")
@@ -144,7 +182,8 @@ def simulate_raspberry_pi(
     interval: int = 5,
     random_mode: bool = False,
     classroom_id: Optional[str] = None,
-    api_url: str = "http://localhost:8000"
+    api_url: str = "http://localhost:8000",
+    max_size: int = 0
 ):
     """
     ラズベリーパイのシミュレーションを実行
@@ -155,6 +194,7 @@ def simulate_raspberry_pi(
         random_mode: ランダムモード（True: ランダムに選択、False: 順番に）
         classroom_id: 固定の教室ID（Noneの場合は利用可能な教室から選択）
         api_url: APIのベースURL
+        max_size: 送信する画像の長辺の上限（0 = そのまま）
     """
     # 利用可能な教室IDを取得
     available_classroom_ids = get_all_classroom_dirs(sample_dir)
@@ -236,7 +276,7 @@ def simulate_raspberry_pi(
                 classroom_indices[target_classroom_id] = (index + 1) % len(image_files)
             
             # 画像を送信
-            send_image_to_api(image_path, target_classroom_id, api_url)
+            send_image_to_api(image_path, target_classroom_id, api_url, max_size)
             
             # 待機
             logger.info(f"次の送信まで {interval}秒待機します...")
@@ -264,6 +304,9 @@ def main():
   
   # カスタムAPI URL
   python simulate_camera.py --api-url http://localhost:8000
+  
+  # 大きな写真を長辺1280pxに縮小してから送信
+  python simulate_camera.py --max-size 1280
         """
     )
     
@@ -301,6 +344,13 @@ def main():
         help='サンプル画像ディレクトリ（デフォルト: sample_images）'
     )
     
+    parser.add_argument(
+        '--max-size',
+        type=int,
+        default=0,
+        help='送信前に長辺をこのピクセル数まで縮小して再エンコード（デフォルト: 0 = そのまま送信）'
+    )
+    
     args = parser.parse_args()
     
     # サンプル画像ディレクトリのパス
@@ -316,7 +366,8 @@ def main():
         interval=args.interval,
         random_mode=args.random,
         classroom_id=args.classroom_id,
-        api_url=args.api_url
+        api_url=args.api_url,
+        max_size=args.max_size
     )
 
 
@@ -0,0 +1,143 @@
+"""
+ONNX Runtime検出器とYOLOv8（ultralytics）検出器の一致テストスクリプト
+
+simulate_camera.py と同じ sample_images/<教室ID>/ の画像で両方の検出器を実行し、
+人数・信頼度が許容範囲内で一致するか、1枚あたりの推論時間を比較します。
+
+使用方法:
+    # ONNXモデルを用意（初回のみ）
+    yolo export model=yolov8n.pt format=onnx
+
+    python test_onnx_parity.py
+    python test_onnx_parity.py --quantize   # int8量子化モデルも検証
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+import cv2
+import logging
+
+from camera.detector import YOLODetector
+from camera.onnx_detector import ONNXDetector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def load_sample_images(sample_dir: Path):
+    """sample_images/<教室ID>/ 以下の画像を読み込む"""
+    paths = sorted(
+        p for p in sample_dir.glob("*/*")
+        if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+    images = []
+    for path in paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            logger.warning(f"画像を読み込めませんでした: {path}")
+            continue
+        images.append((path, image))
+    return images
+
+
+def run_detector(detector, images):
+    """各画像で検出を実行し、結果と平均推論時間を返す"""
+    results = []
+    elapsed = 0.0
+    for _, image in images:
+        start = time.perf_counter()
+        results.append(detector.detect(image))
+        elapsed += time.perf_counter() - start
+    return results, elapsed / max(len(images), 1)
+
+
+def check_parity(
+    sample_dir: Path,
+    pt_model: str = "yolov8n.pt",
+    onnx_model: str = "yolov8n.onnx",
+    quantize: bool = False,
+    count_tolerance: int = 1,
+    confidence_tolerance: float = 0.05,
+) -> bool:
+    """ONNX検出器がYOLOv8検出器と許容範囲内で一致するかテスト"""
+    logger.info("=" * 60)
+    logger.info(f"ONNX一致テストを開始します（int8量子化: {'有効' if quantize else '無効'}）")
+    logger.info("=" * 60)
+
+    images = load_sample_images(sample_dir)
+    if not images:
+        logger.error(f"✗ サンプル画像が見つかりません: {sample_dir}")
+        return False
+
+    reference = YOLODetector(model_path=pt_model)
+    candidate = ONNXDetector(model_path=onnx_model, quantize=quantize)
+    if reference.model is None or candidate.session is None:
+        logger.error("✗ モデルの読み込みに失敗しました")
+        return False
+
+    # ウォームアップ
+    reference.detect(images[0][1])
+    candidate.detect(images[0][1])
+
+    expected, reference_time = run_detector(reference, images)
+    actual, candidate_time = run_detector(candidate, images)
+
+    mismatches = 0
+    for (path, _), (exp_count, exp_conf), (act_count, act_conf) in zip(images, expected, actual):
+        ok = (
+            abs(exp_count - act_count) <= count_tolerance
+            and abs(exp_conf - act_conf) <= confidence_tolerance
+        )
+        mismatches += 0 if ok else 1
+        logger.info(
+            f"{'✓' if ok else '✗'} {path.parent.name}/{path.name}: "
+            f"YOLO {exp_count}人 ({exp_conf:.2f}) / ONNX {act_count}人 ({act_conf:.2f})"
+        )
+
+    logger.info(f"平均推論時間 - YOLO: {reference_time * 1000:.1f}ms, ONNX: {candidate_time * 1000:.1f}ms")
+    logger.info(f"一致: {len(images) - mismatches}/{len(images)}枚")
+    return mismatches == 0
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="ONNX検出器とYOLOv8検出器の一致テスト")
+    parser.add_argument('--sample-dir', type=str, default='sample_images', help='サンプル画像ディレクトリ（デフォルト: sample_images）')
+    parser.add_argument('--pt-model', type=str, default='yolov8n.pt', help='比較元のYOLOv8モデル')
+    parser.add_argument('--onnx-model', type=str, default='yolov8n.onnx', help='検証するONNXモデル')
+    parser.add_argument('--quantize', action='store_true', help='int8量子化モデルも検証する')
+    parser.add_argument('--count-tolerance', type=int, default=1, help='人数の許容差（デフォルト: 1）')
+    parser.add_argument('--confidence-tolerance', type=float, default=0.05, help='平均信頼度の許容差（デフォルト: 0.05）')
+    args = parser.parse_args()
+
+    sample_dir = Path(args.sample_dir)
+    if not sample_dir.is_absolute():
+        sample_dir = backend_dir / sample_dir
+
+    ok = check_parity(
+        sample_dir, args.pt_model, args.onnx_model, False, args.count_tolerance, args.confidence_tolerance
+    )
+    if args.quantize:
+        # int8量子化は精度が少し落ちるため、信頼度の許容差を広げる
+        ok = check_parity(
+            sample_dir, args.pt_model, args.onnx_model, True, args.count_tolerance, args.confidence_tolerance * 2
+        ) and ok
+
+    if not ok:
+        logger.error("\n一致テストに失敗しました。")
+        return 1
+
+    logger.info("\n✓ すべての一致テストが成功しました！")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
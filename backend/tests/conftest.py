@@ -0,0 +1,64 @@
+"""
+pytest設定: backend/ をインポートパスに追加し、占有状況テーブルのSQLiteを用意する
+"""
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+# supabase_complete_schema.sql のうち OccupancyWriter が使う列だけ（パーティションなし）
+SCHEMA = [
+    """
+    CREATE TABLE classrooms (
+        id VARCHAR PRIMARY KEY,
+        short_id SMALLINT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE occupancy (
+        id VARCHAR PRIMARY KEY,
+        classroom_id VARCHAR NOT NULL UNIQUE REFERENCES classrooms (id),
+        current_count INTEGER NOT NULL,
+        detection_confidence FLOAT,
+        last_updated DATETIME,
+        camera_id VARCHAR
+    )
+    """,
+    """
+    CREATE TABLE occupancy_history (
+        id INTEGER NOT NULL,
+        classroom_key SMALLINT NOT NULL REFERENCES classrooms (short_id),
+        timestamp DATETIME NOT NULL,
+        count SMALLINT NOT NULL,
+        detection_confidence REAL,
+        camera_id VARCHAR,
+        PRIMARY KEY (id, timestamp),
+        UNIQUE (classroom_key, timestamp)
+    )
+    """,
+]
+
+
+@pytest.fixture
+def engine():
+    """教室 c1（short_id=1）と c2（short_id=2）を登録したインメモリSQLite"""
+    engine = create_engine("sqlite://")
+
+    # pysqlite: SQLAlchemy に BEGIN を発行させ、SAVEPOINT が正しく動くようにする
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO classrooms (id, short_id) VALUES ('c1', 1), ('c2', 2)"))
+    return engine
@@ -0,0 +1,95 @@
+"""
+HistoryBuffer のテスト（SQLite、Coreのみ）
+
+壊れた行は1行ずつ捨てられ、接続エラーのときだけバッチが戻されること、
+書き込みがコミットされた履歴だけがバッファに入ることを確認します。
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import DataError, OperationalError
+from sqlalchemy.orm import Session
+
+from services.history_buffer import HistoryBuffer
+from services.occupancy_writer import OccupancyWriter, Reading, occupancy_writer
+
+T0 = datetime(2026, 4, 13, 9, 0, tzinfo=timezone.utc)
+
+
+def _readings(n):
+    return [Reading("c1", i, 0.8, captured_at=T0 + timedelta(seconds=i)) for i in range(n)]
+
+
+def _counts(engine):
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(text("SELECT count FROM occupancy_history ORDER BY timestamp"))]
+
+
+def test_flush_writes_batch(engine):
+    buffer = HistoryBuffer()
+    buffer._bind = engine
+    buffer.add(_readings(5))
+    assert buffer.flush() == 5
+    assert _counts(engine) == [0, 1, 2, 3, 4]
+    assert buffer.metrics()["depth"] == 0
+
+
+def test_bad_row_is_rejected_alone(engine, monkeypatch):
+    write_history = occupancy_writer.write_history
+
+    def fake_write_history(conn, readings):
+        write_history(conn, readings)
+        if any(r.count == 2 for r in readings):
+            raise DataError("INSERT", {}, Exception("smallint out of range"))
+
+    monkeypatch.setattr(occupancy_writer, "write_history", fake_write_history)
+    buffer = HistoryBuffer()
+    buffer._bind = engine
+    buffer.add(_readings(5))
+    assert buffer.flush() == 4
+    assert _counts(engine) == [0, 1, 3, 4]
+    metrics = buffer.metrics()
+    assert metrics["rejected"] == 1
+    assert metrics["depth"] == 0
+
+
+def test_connection_error_requeues_batch(engine, monkeypatch):
+    def fake_write_history(conn, readings):
+        raise OperationalError("INSERT", {}, Exception("server closed the connection"))
+
+    monkeypatch.setattr(occupancy_writer, "write_history", fake_write_history)
+    buffer = HistoryBuffer()
+    buffer._bind = engine
+    buffer.add(_readings(3))
+    assert buffer.flush() == 0
+    metrics = buffer.metrics()
+    assert metrics["depth"] == 3
+    assert metrics["failed_flushes"] == 1
+    assert metrics["rejected"] == 0
+
+    monkeypatch.undo()
+    assert buffer.flush() == 3
+    assert _counts(engine) == [0, 1, 2]
+
+
+def test_writer_queues_history_only_after_commit(engine):
+    buffer = HistoryBuffer(flush_interval=60)
+    buffer.start(engine)
+    writer = OccupancyWriter(history_buffer=buffer)
+    try:
+        with Session(engine) as db:
+            writer.write(db, Reading("c1", 5, 0.8, captured_at=T0))
+            assert buffer.metrics()["enqueued"] == 0
+            db.rollback()
+            assert buffer.metrics()["enqueued"] == 0
+
+            writer.write(db, Reading("c1", 6, 0.8, captured_at=T0 + timedelta(seconds=5)))
+            db.commit()
+            assert buffer.metrics()["enqueued"] == 1
+
+            # Closing without committing drops the pending rows as well
+            writer.write(db, Reading("c1", 7, 0.8, captured_at=T0 + timedelta(seconds=10)))
+        assert buffer.metrics()["enqueued"] == 1
+    finally:
+        buffer.stop()
+    assert _counts(engine) == [6]
@@ -0,0 +1,62 @@
+"""
+OccupancyFilter のテスト（データベース不要）
+"""
+from datetime import datetime, timedelta, timezone
+
+from services.occupancy_filter import OccupancyFilter
+from services.occupancy_writer import Reading
+
+T0 = datetime(2026, 4, 13, 9, 0, tzinfo=timezone.utc)
+
+
+def _at(seconds, count):
+    return Reading("c1", count, 0.8, captured_at=T0 + timedelta(seconds=seconds))
+
+
+def test_first_reading_is_written_with_history():
+    occupancy_filter = OccupancyFilter(window=3, deadband=2)
+    assert occupancy_filter.apply([_at(0, 12)]) == [(_at(0, 12), True)]
+    assert occupancy_filter.published("c1") == 12
+    assert occupancy_filter.published("c2") is None
+
+
+def test_flicker_inside_the_deadband_is_suppressed():
+    occupancy_filter = OccupancyFilter(window=3, deadband=2, max_age=60)
+    occupancy_filter.apply([_at(0, 12)])
+    assert occupancy_filter.apply([_at(5, 13), _at(10, 12), _at(15, 13)]) == []
+    assert occupancy_filter.published("c1") == 12
+
+
+def test_change_is_published_at_the_smoothed_count():
+    occupancy_filter = OccupancyFilter(window=3, deadband=2, max_age=60)
+    occupancy_filter.apply([_at(0, 12)])
+    assert occupancy_filter.apply([_at(5, 20)]) == []
+    written = occupancy_filter.apply([_at(10, 20)])
+    assert written == [(_at(10, 20), True)]
+
+
+def test_empty_room_is_always_a_change():
+    occupancy_filter = OccupancyFilter(window=1, deadband=5)
+    occupancy_filter.apply([_at(0, 1)])
+    assert occupancy_filter.apply([_at(5, 0)]) == [(_at(5, 0), True)]
+
+
+def test_refresh_after_max_age_without_history_until_heartbeat():
+    occupancy_filter = OccupancyFilter(window=1, deadband=2, max_age=20, heartbeat=300)
+    occupancy_filter.apply([_at(0, 12)])
+    assert occupancy_filter.apply([_at(25, 13)]) == [(_at(25, 12), False)]
+    assert occupancy_filter.apply([_at(301, 13)]) == [(_at(301, 12), True)]
+
+
+def test_late_reading_bypasses_the_filter():
+    occupancy_filter = OccupancyFilter(window=1, deadband=2)
+    occupancy_filter.apply([_at(10, 12)])
+    assert occupancy_filter.apply([_at(0, 3)]) == [(_at(0, 3), True)]
+    assert occupancy_filter.published("c1") == 12
+
+
+def test_forget_starts_the_classroom_over():
+    occupancy_filter = OccupancyFilter(window=1, deadband=2)
+    occupancy_filter.apply([_at(0, 12)])
+    occupancy_filter.forget("c1")
+    assert occupancy_filter.apply([_at(5, 13)]) == [(_at(5, 13), True)]
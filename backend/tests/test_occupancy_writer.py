@@ -0,0 +1,138 @@
+"""
+OccupancyWriter のSQLite経路のテスト（Coreのみ、アプリの設定は不要）
+
+本番はPostgreSQLですが、ローカルのベンチマークとテストはSQLiteの経路を使うため、
+upsert・古い読み取り・再送の冪等性・camera_id の引き継ぎをここで確認します。
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.occupancy_filter import OccupancyFilter
+from services.occupancy_writer import OccupancyWriter, Reading
+
+T0 = datetime(2026, 4, 13, 9, 0, tzinfo=timezone.utc)
+
+
+def _history(conn):
+    return conn.execute(text(
+        "SELECT c.id, h.count, h.camera_id FROM occupancy_history h "
+        "JOIN classrooms c ON c.short_id = h.classroom_key ORDER BY h.timestamp, c.id"
+    )).all()
+
+
+def _occupancy(conn, classroom_id):
+    return conn.execute(
+        text("SELECT current_count, camera_id FROM occupancy WHERE classroom_id = :id"), {"id": classroom_id}
+    ).one()
+
+
+def test_write_inserts_current_state_and_history(engine):
+    with engine.begin() as conn:
+        row = OccupancyWriter().write(conn, Reading("c1", 12, 0.8, captured_at=T0, camera_id="cam-1"))
+        assert row["applied"] is True
+        assert row["current_count"] == 12
+        assert row["id"] == "occ_c1"
+        assert _occupancy(conn, "c1") == (12, "cam-1")
+        assert _history(conn) == [("c1", 12, "cam-1")]
+
+
+def test_newer_reading_updates_and_stale_reading_only_adds_history(engine):
+    writer = OccupancyWriter()
+    with engine.begin() as conn:
+        writer.write(conn, Reading("c1", 5, 0.8, captured_at=T0))
+        newer = writer.write(conn, Reading("c1", 7, 0.8, captured_at=T0 + timedelta(minutes=1)))
+        stale = writer.write(conn, Reading("c1", 3, 0.8, captured_at=T0 - timedelta(minutes=1)))
+
+        assert newer["applied"] is True
+        assert stale["applied"] is False
+        assert stale["current_count"] == 7
+        assert _occupancy(conn, "c1")[0] == 7
+        assert [count for _, count, _ in _history(conn)] == [3, 5, 7]
+
+
+def test_replayed_reading_is_a_no_op(engine):
+    writer = OccupancyWriter()
+    reading = Reading("c1", 5, 0.8, captured_at=T0)
+    with engine.begin() as conn:
+        writer.write(conn, reading)
+        writer.write(conn, reading)
+        writer.write_many(conn, [reading, reading])
+        assert len(_history(conn)) == 1
+
+
+def test_camera_id_is_kept_when_missing(engine):
+    writer = OccupancyWriter()
+    with engine.begin() as conn:
+        writer.write(conn, Reading("c1", 5, 0.8, captured_at=T0, camera_id="cam-1"))
+        row = writer.write(conn, Reading("c1", 6, 0.8, captured_at=T0 + timedelta(seconds=5)))
+        assert row["camera_id"] == "cam-1"
+        assert _history(conn)[-1] == ("c1", 6, "cam-1")
+
+
+def test_write_many_returns_newest_state_per_classroom(engine):
+    readings = [
+        Reading("c1", 4, 0.8, captured_at=T0 + timedelta(seconds=10)),
+        Reading("c1", 2, 0.8, captured_at=T0),
+        Reading("c2", 9, 0.8, captured_at=T0),
+    ]
+    with engine.begin() as conn:
+        results = OccupancyWriter().write_many(conn, readings)
+        assert results["c1"]["current_count"] == 4
+        assert results["c2"]["current_count"] == 9
+        assert _occupancy(conn, "c1")[0] == 4
+        assert len(_history(conn)) == 3
+
+
+def test_history_for_unknown_classroom_is_skipped(engine):
+    with engine.begin() as conn:
+        OccupancyWriter().write_history(conn, [
+            Reading("c1", 1, 0.8, captured_at=T0),
+            Reading("missing", 1, 0.8, captured_at=T0),
+        ])
+        assert _history(conn) == [("c1", 1, None)]
+
+
+def test_filtered_readings_are_not_written(engine):
+    writer = OccupancyWriter(filter=OccupancyFilter(window=1, deadband=2, max_age=60, heartbeat=300))
+    with engine.begin() as conn:
+        writer.write(conn, Reading("c1", 10, 0.8, captured_at=T0))
+        row = writer.write(conn, Reading("c1", 11, 0.8, captured_at=T0 + timedelta(seconds=5)))
+        assert row["applied"] is False
+        assert row["filtered"] is True
+        assert row["current_count"] == 10
+        row = writer.write(conn, Reading("c1", 14, 0.8, captured_at=T0 + timedelta(seconds=10)))
+        assert row["applied"] is True
+        assert [count for _, count, _ in _history(conn)] == [10, 14]
+
+
+def test_late_reading_through_filter_only_adds_history(engine):
+    writer = OccupancyWriter(filter=OccupancyFilter(window=1, deadband=2, max_age=60, heartbeat=300))
+    with engine.begin() as conn:
+        writer.write(conn, Reading("c1", 10, 0.8, captured_at=T0))
+        row = writer.write(conn, Reading("c1", 3, 0.8, captured_at=T0 - timedelta(seconds=30)))
+        assert row["applied"] is False
+        assert row["filtered"] is False
+        assert row["current_count"] == 10
+        assert [count for _, count, _ in _history(conn)] == [3, 10]
+
+
+def test_suppressed_reading_is_written_after_rollback(engine):
+    writer = OccupancyWriter(filter=OccupancyFilter(window=1, deadband=2, max_age=60, heartbeat=300))
+    with Session(engine) as db:
+        writer.write(db, Reading("c1", 5, 0.9, captured_at=T0))
+        db.rollback()
+
+        # The filter has already seen 5, but nothing was stored
+        row = writer.write(db, Reading("c1", 5, 0.9, captured_at=T0 + timedelta(seconds=5)))
+        db.commit()
+        assert row is not None
+        assert row["applied"] is True
+        assert row["current_count"] == 5
+        assert _occupancy(db, "c1")[0] == 5
+        assert [count for _, count, _ in _history(db)] == [5]
+
+        # Once stored, the filter suppresses the repeat again
+        row = writer.write(db, Reading("c1", 5, 0.9, captured_at=T0 + timedelta(seconds=10)))
+        assert row["filtered"] is True
@@ -19,6 +19,12 @@ def create_tables():
     
     logger.info("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    if engine.dialect.name == "postgresql":
+        # occupancy_history is created as a partitioned table: prepare its partitions
+        from config import settings
+        from services.history_partitions import maintain
+        with engine.begin() as conn:
+            maintain(conn, retention_months=0, months_ahead=settings.history_partition_months_ahead)
     logger.info("Database tables created successfully")
 
 
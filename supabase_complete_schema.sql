@@ -25,6 +25,7 @@ CREATE TABLE IF NOT EXISTS public.buildings (
 -- 2. Classrooms table
 CREATE TABLE IF NOT EXISTS public.classrooms (
     id VARCHAR NOT NULL,
+    short_id SMALLINT GENERATED BY DEFAULT AS IDENTITY,  -- compact key for occupancy_history
     room_number VARCHAR NOT NULL,
     building_id VARCHAR NOT NULL,
     faculty VARCHAR NOT NULL,
@@ -36,6 +37,7 @@ CREATE TABLE IF NOT EXISTS public.classrooms (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
     updated_at TIMESTAMP WITH TIME ZONE,
     CONSTRAINT classrooms_pkey PRIMARY KEY (id),
+    CONSTRAINT classrooms_short_id_key UNIQUE (short_id),
     CONSTRAINT classrooms_building_id_fkey FOREIGN KEY (building_id) REFERENCES public.buildings(id)
 );
 
@@ -83,20 +85,43 @@ CREATE TABLE IF NOT EXISTS public.occupancy (
 CREATE INDEX IF NOT EXISTS idx_occupancy_classroom_id ON public.occupancy(classroom_id);
 
 -- 5. Occupancy history table
+-- Range-partitioned by month on timestamp. Rows are compact (bigint identity,
+-- smallint classroom key, 24 bytes before camera_id) and old months are dropped
+-- as whole partitions by backend/manage_history_partitions.py (run it daily; it
+-- also creates the upcoming months). Existing databases: see
+-- supabase_migration_occupancy_history.sql
 CREATE TABLE IF NOT EXISTS public.occupancy_history (
-    id VARCHAR NOT NULL,
-    classroom_id VARCHAR NOT NULL,
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY,
     timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
-    count INTEGER NOT NULL,
-    detection_confidence DOUBLE PRECISION NOT NULL,
+    classroom_key SMALLINT NOT NULL,
+    count SMALLINT NOT NULL,
+    detection_confidence REAL NOT NULL,
     camera_id VARCHAR,
-    CONSTRAINT occupancy_history_pkey PRIMARY KEY (id),
-    CONSTRAINT occupancy_history_classroom_id_fkey FOREIGN KEY (classroom_id) REFERENCES public.classrooms(id)
-);
-
--- Create indexes for occupancy_history
-CREATE INDEX IF NOT EXISTS idx_occupancy_history_classroom_id ON public.occupancy_history(classroom_id);
-CREATE INDEX IF NOT EXISTS idx_occupancy_history_timestamp ON public.occupancy_history(timestamp);
+    -- The partition key must be part of every unique constraint
+    CONSTRAINT occupancy_history_pkey PRIMARY KEY (id, timestamp),
+    -- One row per classroom and capture time (replayed readings are ignored);
+    -- also serves per-classroom time-range queries
+    CONSTRAINT occupancy_history_classroom_key_timestamp_key UNIQUE (classroom_key, timestamp),
+    CONSTRAINT occupancy_history_classroom_key_fkey FOREIGN KEY (classroom_key) REFERENCES public.classrooms(short_id)
+) PARTITION BY RANGE (timestamp);
+
+-- Rows outside the prepared months land here until their month is created
+CREATE TABLE IF NOT EXISTS public.occupancy_history_default PARTITION OF public.occupancy_history DEFAULT;
+
+-- Partitions for the current and next three months
+DO $$
+DECLARE
+    month DATE := date_trunc('month', now() AT TIME ZONE 'UTC')::date;
+BEGIN
+    FOR i IN 0..3 LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.occupancy_history FOR VALUES FROM (%L) TO (%L)',
+            'occupancy_history_' || to_char(month + make_interval(months => i), 'YYYY_MM'),
+            (month + make_interval(months => i))::date || ' 00:00:00+00',
+            (month + make_interval(months => i + 1))::date || ' 00:00:00+00'
+        );
+    END LOOP;
+END $$;
 
 -- 6. Users table
 CREATE TABLE IF NOT EXISTS public.users (
@@ -0,0 +1,78 @@
+-- Migrate occupancy_history to the partitioned layout of supabase_complete_schema.sql
+--
+-- Before: string primary key 'hist_{classroom_id}_{timestamp}', VARCHAR classroom_id
+--         on every row, separate indexes on classroom_id and timestamp, no retention.
+-- After:  bigint identity key, smallint classroom key (classrooms.short_id), one
+--         partition per month, old months dropped by backend/manage_history_partitions.py.
+--
+-- Deploy the backend and the Vercel API (api/) from the release that contains this
+-- migration: both write history rows by classroom_key with a database-assigned id,
+-- and earlier versions (string ids, classroom_id column) cannot insert into the new table.
+--
+-- Run in the Supabase SQL editor while the backend is stopped (or accept that
+-- readings written during the copy go to occupancy_history_legacy only), then run
+--     python backend/manage_history_partitions.py
+-- and drop the legacy table once the new one has been checked.
+
+BEGIN;
+
+-- 1. Compact classroom key
+ALTER TABLE public.classrooms ADD COLUMN IF NOT EXISTS short_id SMALLINT GENERATED BY DEFAULT AS IDENTITY;
+ALTER TABLE public.classrooms ADD CONSTRAINT classrooms_short_id_key UNIQUE (short_id);
+
+-- 2. Keep the old table under another name
+ALTER TABLE public.occupancy_history RENAME TO occupancy_history_legacy;
+ALTER TABLE public.occupancy_history_legacy RENAME CONSTRAINT occupancy_history_pkey TO occupancy_history_legacy_pkey;
+ALTER TABLE public.occupancy_history_legacy RENAME CONSTRAINT occupancy_history_classroom_id_fkey TO occupancy_history_legacy_classroom_id_fkey;
+DROP INDEX IF EXISTS public.idx_occupancy_history_classroom_id;
+DROP INDEX IF EXISTS public.idx_occupancy_history_timestamp;
+DROP INDEX IF EXISTS public.ix_occupancy_history_id;
+DROP INDEX IF EXISTS public.ix_occupancy_history_classroom_id;
+DROP INDEX IF EXISTS public.ix_occupancy_history_timestamp;
+
+-- 3. New partitioned table (same definition as supabase_complete_schema.sql)
+CREATE TABLE public.occupancy_history (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    classroom_key SMALLINT NOT NULL,
+    count SMALLINT NOT NULL,
+    detection_confidence REAL NOT NULL,
+    camera_id VARCHAR,
+    CONSTRAINT occupancy_history_pkey PRIMARY KEY (id, timestamp),
+    CONSTRAINT occupancy_history_classroom_key_timestamp_key UNIQUE (classroom_key, timestamp),
+    CONSTRAINT occupancy_history_classroom_key_fkey FOREIGN KEY (classroom_key) REFERENCES public.classrooms(short_id)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE public.occupancy_history_default PARTITION OF public.occupancy_history DEFAULT;
+
+-- 4. One partition per month from the oldest reading to three months ahead
+DO $$
+DECLARE
+    month DATE;
+    last_month DATE := (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months')::date;
+BEGIN
+    SELECT COALESCE(date_trunc('month', min(timestamp) AT TIME ZONE 'UTC')::date, last_month)
+    INTO month FROM public.occupancy_history_legacy;
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE public.%I PARTITION OF public.occupancy_history FOR VALUES FROM (%L) TO (%L)',
+            'occupancy_history_' || to_char(month, 'YYYY_MM'),
+            month || ' 00:00:00+00',
+            (month + interval '1 month')::date || ' 00:00:00+00'
+        );
+        month := (month + interval '1 month')::date;
+    END LOOP;
+END $$;
+
+-- 5. Copy the history (rows for deleted classrooms have nothing to reference)
+INSERT INTO public.occupancy_history (timestamp, classroom_key, count, detection_confidence, camera_id)
+SELECT h.timestamp, c.short_id, h.count, h.detection_confidence, h.camera_id
+FROM public.occupancy_history_legacy h
+JOIN public.classrooms c ON c.id = h.classroom_id
+ORDER BY h.timestamp
+ON CONFLICT (classroom_key, timestamp) DO NOTHING;
+
+COMMIT;
+
+-- After checking the new table:
+-- DROP TABLE public.occupancy_history_legacy;